@@ -1,93 +1,129 @@
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-from email import encoders
-from io import BytesIO
-from openpyxl import load_workbook
-from openpyxl.utils import column_index_from_string
-from openpyxl.formula.translate import Translator
 import os
-import pandas as pd
-import pdfplumber
 import re
-import smtplib
-import streamlit as st
+import threading
 import time
 
+import streamlit as st
+
+from instrumentation import Metrics
+
+# pandas, pdfplumber, openpyxl and the mail modules are imported by the
+# step that needs them; a cold start only pays for the upload page
+
 st.set_page_config(layout="wide")
-# ======================
-# Helper: Normalize Entries
-# ======================
-def normalize_entries(data):
-    normalized_entries = []
-    
-    for entry in data:
-        pemotongan = [float(value.replace('.', '').replace(',', '.')) for value in entry['pemotongan']]
-        penyetoran = [float(value.replace('.', '').replace(',', '.')) for value in entry['penyetoran']]
-        saldo = [float(value.replace('.', '').replace(',', '.')) for value in entry['saldo']]
-        
-        for i in range(len(entry['tax'])):
-            normalized_entry = {
-                'date': entry['date'],
-                'kwt': entry['kwt'],
-                'ntpn': entry['ntpn'],
-                'uraian': entry['uraian'],
-                'tax': entry['tax'][i],
-                'pemotongan': pemotongan[i],
-                'penyetoran': penyetoran[i],
-                'saldo': saldo[i]
-            }
-            normalized_entries.append(normalized_entry)
-        
-    return normalized_entries
-    
-# Retry logic for email sending
-def send_email_with_attachment(to_email, subject, body, attachment, retries=3, delay=5):
-    gmail_user = st.secrets["gmail"]["email"]
-    gmail_password = st.secrets["gmail"]["password"]
-
-    # Create MIME message
-    msg = MIMEMultipart()
-    msg['From'] = gmail_user
-    msg['To'] = to_email
-    msg['Subject'] = subject
-    
-    # Ensure the body is properly attached as MIMEText
-    msg.attach(MIMEText(body, 'plain'))  # Wrap body in MIMEText
-
-    # Attach the file
-    with open(attachment, "rb") as attachment_file:
-        part = MIMEBase('application', 'octet-stream')
-        part.set_payload(attachment_file.read())
-        encoders.encode_base64(part)
-        part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(attachment)}')
-        msg.attach(part)
 
+# Parse page text with regex; "layout" reads amounts by column position, for
+# BKPP exports that leave zero amounts blank
+EXTRACT_MODE = os.environ.get("XTRACTPAJAK_EXTRACT_MODE", "text")
+
+@st.cache_resource
+def get_extract_cache():
+    from extract_cache import ExtractCache
+    cache_dir = os.environ.get("XTRACTPAJAK_CACHE_DIR", os.path.join(".cache", "extract"))
+    return ExtractCache(cache_dir)
+
+# Page records per ledger, so a longer re-upload only parses its new pages
+@st.cache_resource
+def get_incremental_store():
+    from bkpp_incremental import IncrementalStore
+    store_dir = os.environ.get("XTRACTPAJAK_INCREMENTAL_DIR", os.path.join(".cache", "incremental"))
+    return IncrementalStore(store_dir)
+
+# Tax lines of every upload, queried for masa/jenis SPT and cross-desa recaps
+@st.cache_resource
+def get_transaction_store():
+    from transaction_store import TransactionStore
+    return TransactionStore(os.environ.get("XTRACTPAJAK_DB", os.path.join(".cache", "transactions.sqlite")))
+
+# Uploaded PDFs and extracted frames, kept on disk instead of in session state
+@st.cache_resource
+def get_spill_store():
+    from spill_store import SpillStore
+    spill_dir = os.environ.get("XTRACTPAJAK_SPILL_DIR", os.path.join(".cache", "spill"))
+    budget_mb = int(os.environ.get("XTRACTPAJAK_SESSION_BUDGET_MB", 512))
+    ttl_hours = float(os.environ.get("XTRACTPAJAK_SPILL_TTL_HOURS", 6))
+    return SpillStore(spill_dir, session_budget=budget_mb * 1024 * 1024, ttl=ttl_hours * 3600)
+
+def spill_session():
+    if "spill_session" not in st.session_state:
+        from spill_store import new_session_id
+        st.session_state.spill_session = new_session_id()
+    return st.session_state.spill_session
+
+# The extracted frame of this session, read back from its spill file
+def load_session_df():
     try:
-        # Try to send the email with retries
-        for attempt in range(retries):
-            try:
-                # Connect to Gmail's SMTP server
-                server = smtplib.SMTP("smtp.gmail.com", 587)
-                server.starttls()
-                server.login(gmail_user, gmail_password)
-                server.sendmail(gmail_user, to_email, msg.as_string())
-                server.quit()
-                # st.success("✅ Email sent successfully!")
-                return
-            except smtplib.SMTPException as e:
-                st.error(f"Error sending email: {e}")
-                if attempt < retries - 1:
-                    # st.warning(f"Retrying in {delay} seconds...")
-                    time.sleep(delay)
-                else:
-                    # st.error("❌ Failed to send email after multiple attempts.")
-                    pass
-    except Exception as e:
-        # st.error(f"An unexpected error occurred: {e}")
+        return get_spill_store().get_frame(st.session_state.df_handle)
+    except FileNotFoundError:
+        # Evicted or expired: step 3 extracts again (from its caches)
+        st.session_state.pop("df_key", None)
+        go_to_step("extract")
+        st.rerun()
+
+# Extractions run as background jobs that outlive reruns and refreshes
+@st.cache_resource
+def get_extract_jobs():
+    from extract_jobs import JobManager
+    return JobManager(retention=int(os.environ.get("XTRACTPAJAK_JOB_RETENTION", 600)))
+
+@st.cache_resource
+def get_mailer():
+    from mailer import BackgroundMailer, Outbox, SmtpConnection
+    gmail = st.secrets["gmail"]
+    connection = SmtpConnection(
+        gmail.get("host", "smtp.gmail.com"),
+        int(gmail.get("port", 587)),
+        user=gmail["email"],
+        password=gmail["password"],
+        starttls=gmail.get("starttls", True),
+    )
+    outbox_dir = os.environ.get("XTRACTPAJAK_OUTBOX_DIR", os.path.join(".cache", "outbox"))
+    metrics = Metrics.from_env(run_id="mailer")
+    return BackgroundMailer(Outbox(outbox_dir), connection, metrics=metrics).start()
+
+# Report downloads are built on request and memoized per dataset (extraction cache
+# key) and spill file; the caller loads the frame, so nothing here touches the session
+@st.cache_data(max_entries=32, show_spinner="Menyiapkan laporan...")
+def get_report(dataset_key, fmt, df_path, _df, _summary, _monthly, _metrics):
+    from report_export import build_report
+    with _metrics.stage(f"report_{fmt}", rows_written=len(_df)) as stage:
+        data = build_report(fmt, _summary, _monthly, _df)
+        stage.count("bytes", len(data))
+    return data
+
+# Stage timings for this session; shown in the diagnostics panel
+def get_metrics():
+    if "metrics" not in st.session_state:
+        st.session_state.metrics = Metrics.from_env()
+    return st.session_state.metrics
+
+# Queue the email; delivery and retries happen on the mailer thread
+def send_email_with_attachment(to_email, subject, body, attachment):
+    from mailer import build_message
+    with get_metrics().stage("email_enqueue", bytes=os.path.getsize(attachment)):
+        gmail_user = st.secrets["gmail"]["email"]
+        msg = build_message(gmail_user, to_email, subject, body, attachment)
+        get_mailer().enqueue(msg, gmail_user, to_email)
+
+def _warm_up():
+    try:
+        import bkpp_frame, bkpp_incremental, report_export, transaction_store  # noqa: F401
+        from bupot_excel import preload_templates
+        preload_templates()
+    except Exception:
+        # Only a head start: the step that needs a module imports it again and reports errors
         pass
 
-        
+# Import the later steps' modules and parse the Bupot templates once per
+# process, in the background while the user is still on steps 1 and 2
+@st.cache_resource
+def start_warm_up():
+    thread = threading.Thread(target=_warm_up, name="xtractpajak-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+start_warm_up()
+
 # ======================
 # UI Header
 # ======================
@@ -100,7 +136,7 @@ Selamat datang di **XtractPajak** — alat bantu konversi **Buku Kas Pembantu Pa
 1️⃣ Upload file PDF BKPP  
 2️⃣ Masukkan NPWP dan klik **Kirim**  
 3️⃣ Pilih **Masa Pajak** & **Jenis SPT**, klik **Lanjutkan**  
-4️⃣ Tekan **Buat Excel** untuk menghasilkan file template
+4️⃣ Download **XML** siap impor ke Coretax (file Excel template tetap tersedia)
 """)
 
 
@@ -109,6 +145,16 @@ Selamat datang di **XtractPajak** — alat bantu konversi **Buku Kas Pembantu Pa
 # ======================
 if "step" not in st.session_state:
     st.session_state.step = "upload"
+    # After a refresh, reattach to the extraction job named in the URL; only
+    # the session that started it may, its files live in that session's spill dir
+    job = get_extract_jobs().get(st.query_params.get("job", ""))
+    session = st.query_params.get("session", "")
+    if job is not None and session and job.meta.get("session") == session:
+        st.session_state.update(job.meta, spill_session=session, cache_key=job.key)
+        st.session_state.step = "extract"
+    else:
+        st.query_params.pop("job", None)
+        st.query_params.pop("session", None)
 
 def go_to_step(step):
     st.session_state.step = step
@@ -119,11 +165,13 @@ def go_to_step(step):
 if st.session_state.step == "upload":
     uploaded_file = st.file_uploader("📎 Upload file BKPP (PDF)", type="pdf")
     if uploaded_file:
-        st.session_state.uploaded_file = uploaded_file
-        file_path = f"{uploaded_file.name}"
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        st.session_state.file_path = file_path
+        # Only the path is kept; the bytes live in this session's spill directory
+        st.session_state.file_path = get_spill_store().put_bytes(
+            spill_session(), uploaded_file.name, uploaded_file.getvalue())
+        st.session_state.file_name = uploaded_file.name
+        st.session_state.pop("cache_key", None)
+        st.query_params.pop("job", None)
+        st.query_params.pop("session", None)
         st.success("✅ File berhasil diupload!")
         
         go_to_step("npwp")
@@ -157,104 +205,161 @@ elif st.session_state.step == "npwp":
 # ======================
 elif st.session_state.step == "extract":
     st.write("### 🔍 Langkah 3 — Proses Ekstraksi Data dari PDF")
+    from extract_jobs import CANCELLED, FAILED, RUNNING, run_extraction
+    from reconcile import ERROR, reconcile
+    from report_export import REPORT_FORMATS, available_formats
+    from spill_store import SpillBudgetExceeded
+
+    file_name = st.session_state.file_name
+    pdf_filename = file_name.rsplit('.', 1)[0]
+    metrics = get_metrics()
+    cache = get_extract_cache()
+    if "cache_key" not in st.session_state:
+        try:
+            with open(st.session_state.file_path, "rb") as f:
+                st.session_state.cache_key = cache.key(f.read(), mode=EXTRACT_MODE)
+        except FileNotFoundError:
+            st.error("❌ File PDF sudah tidak tersedia (sesi kedaluwarsa). Silakan upload ulang.")
+            if st.button("⬅️ Upload ulang"):
+                go_to_step("upload")
+                st.rerun()
+            st.stop()
+    cache_key = st.session_state.cache_key
+
+    # Streamlit reruns this step on every interaction; extract, spill and
+    # store each upload once, later reruns only need the small summaries
+    if st.session_state.get("df_key") != cache_key:
+        jobs = get_extract_jobs()
+        job = jobs.get(cache_key)
+        result = None
+        if job is None:
+            with metrics.stage("extract_cache") as stage:
+                result = cache.get(cache_key)
+                stage.count("hit" if result is not None else "miss")
+        extract_notes = []
+        if result is None:
+            if job is None or (job.state in (CANCELLED, FAILED) and st.session_state.get("job_restart")):
+                st.session_state.pop("job_restart", None)
+                meta = {key: st.session_state[key] for key in ("file_path", "file_name", "npwp")}
+                meta["session"] = spill_session()
+                job = jobs.submit(cache_key, lambda job: run_extraction(
+                    job, meta["file_path"], get_incremental_store(), EXTRACT_MODE,
+                    workers=os.cpu_count() or 1, cache=cache, cache_key=cache_key, metrics=metrics,
+                ), meta=meta)
+            # Only the session that started the job may cancel it, or find it again after a refresh
+            own_job = job.meta.get("session") == spill_session()
+            if own_job:
+                st.query_params.update(job=cache_key, session=spill_session())
+            info = job.progress()
+            if info["state"] == RUNNING:
+                total = info["total_pages"]
+                label = f"{info['pages_done']}/{total} halaman · {info['entries']} transaksi" if total else "Membaca halaman PDF..."
+                if info["eta"] is not None:
+                    label += f" · sisa ± {int(info['eta'] // 60)} menit {int(info['eta'] % 60)} detik"
+                st.progress(int(info["pages_done"] / total * 100) if total else 0, text=label)
+                if info["cancel_requested"]:
+                    st.caption("⏳ Membatalkan ekstraksi...")
+                elif not own_job:
+                    st.caption("File yang sama sedang diekstraksi untuk sesi lain; hasilnya dipakai bersama.")
+                elif st.button("⛔ Batalkan ekstraksi"):
+                    job.cancel()
+                    st.rerun()
+                else:
+                    st.caption("Ekstraksi berjalan di latar belakang; halaman ini boleh dimuat ulang.")
+                # Poll until the job finishes
+                time.sleep(0.5)
+                st.rerun()
+            if info["state"] in (CANCELLED, FAILED):
+                if info["state"] == CANCELLED:
+                    st.warning("⛔ Ekstraksi dibatalkan.")
+                else:
+                    st.error(f"❌ Ekstraksi gagal: {info['error']}")
+                if st.button("🔄 Mulai ulang ekstraksi"):
+                    st.session_state.job_restart = True
+                    st.rerun()
+                if st.button("⬅️ Kembali"):
+                    go_to_step("npwp")
+                    st.rerun()
+                st.stop()
+            result, extract_stats = job.result, job.stats
+            if result is None:
+                # Another session already stored the result and released it from the job
+                with metrics.stage("extract_cache") as stage:
+                    result = cache.get(cache_key)
+                    stage.count("hit" if result is not None else "miss")
+                if result is None:
+                    # Evicted from the cache as well: extract again
+                    jobs.forget(cache_key)
+                    st.rerun()
+            df, summary, monthly = result["df"], result["summary"], result["monthly"]
+            if extract_stats.get("reused_pages"):
+                extract_notes.append(f"⚡ {extract_stats['reused_pages']} dari {extract_stats['pages']} halaman tidak berubah sejak upload sebelumnya; hanya halaman baru yang diproses.")
+        else:
+            df, summary, monthly = result["df"], result["summary"], result["monthly"]
+            extract_notes.append("⚡ Hasil ekstraksi diambil dari cache.")
+
+        # Cheap consistency checks, so a bad extraction shows up before the Bupot is filled
+        with metrics.stage("reconcile", tax_lines=len(df)) as stage:
+            st.session_state.findings = reconcile(df)
+            stage.count("findings", len(st.session_state.findings))
 
-    progress = st.progress(0)
-    uploaded_file = st.session_state.uploaded_file
-    pdf_filename = uploaded_file.name.rsplit('.', 1)[0]
-    extracted_data = []
-    
-    with pdfplumber.open(uploaded_file) as pdf:
-        current_entry = {}
-        total_pages = len(pdf.pages)
-        for i, page in enumerate(pdf.pages):
-            page_text = page.extract_text()
-            for line in page_text.split('\n'):
-                # Regex patterns
-                date_pattern = r'(\d{2}/\d{2}/\d{4})'
-                kwt_pattern = r'(\d{4,5}\/[A-Z]{3}\/\d{2}\.\d{4}\/\d{4})'
-                ntpn_pattern = r'NTPN\s*:\s*([A-Z0-9]+)'
-                tax_pattern = r'(Uang Muka dan Jaminan|Pajak Restoran, Rumah Makan|Potongan Pajak (PPN Pusat|PPh Pasal 21|PPh Pasal 22|PPh Pasal 23|Lainnnya))'
-                value_pattern = r'\d{1,3}(?:\.\d{3})*(?:,\d{2})'
-
-                date_match = re.search(date_pattern, line)
-                kwt_match = re.search(kwt_pattern, line)
-                ntpn_match = re.search(ntpn_pattern, line)
-                tax_match = re.search(tax_pattern, line)
-                value_match = re.findall(value_pattern, line)
-
-                if date_match and kwt_match:
-                    if current_entry:
-                        extracted_data.append(current_entry)
-                    current_entry = {
-                        'date': date_match.group(1),
-                        'kwt': None,
-                        'ntpn': None,
-                        'uraian': '',
-                        'tax': [],
-                        'pemotongan': [],
-                        'penyetoran': [],
-                        'saldo': []
-                    }
-
-                if kwt_match:
-                    current_entry['kwt'] = kwt_match.group(1)
-                if ntpn_match:
-                    current_entry['ntpn'] = ntpn_match.group(1)
-                if tax_match and value_match:
-                    tax_type = tax_match.group(1).strip()
-                
-                    # Ensure there are at least 3 numeric values (pemotongan, penyetoran, saldo)
-                    if len(value_match) >= 3:
-                        current_entry['tax'].append(tax_type)
-                        current_entry['pemotongan'].append(value_match[0])
-                        current_entry['penyetoran'].append(value_match[1])
-                        current_entry['saldo'].append(value_match[2])
-                if not (date_match or kwt_match or ntpn_match or tax_match or value_match):
-                    try:
-                        # Header fragment to remove if it's inside the line
-                        if ("Pemotongan" in line and "Penyetoran" in line) or "Uraian" in line or "Rp" in line:
-                            continue
-                        # Only add if something remains
-                        current_entry['uraian'] += line + ' '
-                    except:
-                        continue
-
-        if current_entry:
-            extracted_data.append(current_entry)
-
-            progress.progress(int(((i + 1) / total_pages) * 100))
-            # time.sleep(0.2)
-
-    df = pd.DataFrame(normalize_entries(extracted_data))
-    df["date"] = pd.to_datetime(df["date"], format="%d/%m/%Y", errors="coerce")
-
-    # Buat ringkasan total berdasarkan jenis pajak
-    summary = df.groupby("tax")[["pemotongan", "penyetoran"]].sum().reset_index()
-    monthly = df.pivot_table('pemotongan', df.date.dt.month, 'tax', aggfunc='sum')
+        with metrics.stage("spill_frame", tax_lines=len(df)) as stage:
+            try:
+                st.session_state.df_handle = get_spill_store().put_frame(spill_session(), "df", df)
+            except (SpillBudgetExceeded, OSError) as e:
+                st.error(f"❌ Hasil ekstraksi tidak dapat disimpan untuk sesi ini: {e}")
+                st.stop()
+            stage.count("bytes", st.session_state.df_handle.nbytes)
+        if job is not None:
+            # Spilled and cached now: the job need not hold the frame for its retention
+            job.result = None
+        # For the cross-desa recap only: another upload of this NPWP may replace these rows
+        with metrics.stage("store_save", tax_lines=len(df)):
+            get_transaction_store().save_frame(df, st.session_state.npwp, desa=pdf_filename, source=file_name)
+        st.session_state.summary, st.session_state.monthly = summary, monthly
+        st.session_state.extract_notes = extract_notes
+        st.session_state.df_key = cache_key
+        del df
+
+    summary, monthly = st.session_state.summary, st.session_state.monthly
+    for note in st.session_state.extract_notes:
+        st.caption(note)
 
     st.subheader("📊 Ringkasan Pemotongan dan Penyetoran per Jenis Pajak")
     st.dataframe(summary.style.format({"pemotongan": "Rp {:,.2f}", "penyetoran": "Rp {:,.2f}"}))
 
     st.subheader("📊 Ringkasan Pemotongan Bulanan per Jenis Pajak")
-    st.dataframe(monthly.applymap(lambda x: f"Rp {x:,.2f}" if pd.notna(x) else '-'))
+    st.dataframe(monthly.style.format("Rp {:,.2f}", na_rep="-"))
 
-    st.session_state.df = df
+    st.subheader("🔎 Pemeriksaan Saldo, NTPN dan Nomor Bukti")
+    findings = st.session_state.findings
+    errors = int((findings["severity"] == ERROR).sum())
+    if findings.empty:
+        st.success("✅ Saldo berkesinambungan, setiap pemotongan berpasangan dengan penyetoran ber-NTPN, dan tidak ada nomor bukti ganda.")
+    else:
+        if errors:
+            st.error(f"❌ {errors} baris tidak konsisten (saldo tidak berkesinambungan atau nomor bukti ganda). Periksa hasil ekstraksi sebelum membuat Bupot.")
+        if len(findings) > errors:
+            st.warning(f"⚠️ {len(findings) - errors} catatan NTPN (pemotongan belum disetor, penyetoran tanpa pasangan atau tanpa NTPN).")
+        with st.expander("Detail temuan"):
+            st.dataframe(findings, use_container_width=True)
     st.success("✅ Ekstraksi selesai!")
 
-    # Convert DataFrame to Excel in memory
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        summary.to_excel(writer, index=False, sheet_name='summary')
-        monthly.to_excel(writer, sheet_name='bulanan')
-        df.to_excel(writer, index=False, sheet_name='rincian')
-    output.seek(0)
-
-    st.download_button(
-        label="Download Excel file",
-        data=output,
-        file_name=f'{pdf_filename}.xlsx',
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+    # Reports are only serialized once someone asks for them
+    col_format, col_prepare = st.columns([3, 1])
+    report_format = col_format.selectbox("Format laporan", available_formats(),
+                                         format_func=lambda fmt: fmt.upper())
+    if col_prepare.button("📦 Siapkan laporan"):
+        st.session_state.report_request = (cache_key, report_format)
+    if st.session_state.get("report_request") == (cache_key, report_format):
+        extension, mime = REPORT_FORMATS[report_format]
+        st.download_button(
+            label=f"Download {report_format.upper()} file",
+            data=get_report(cache_key, report_format, st.session_state.df_handle.path, load_session_df(),
+                            summary, monthly, metrics),
+            file_name=f'{pdf_filename}.{extension}',
+            mime=mime
+        )
 
 
     if st.button("➡️ Lanjut ke Pilihan Masa dan Jenis SPT"):
@@ -270,6 +375,7 @@ elif st.session_state.step == "extract":
 # ======================
 elif st.session_state.step == "filter":
     st.write("### 🗓️ Langkah 4 — Pilih Masa Pajak & Jenis SPT")
+    from bupot_excel import JENIS_SPT
 
     bulan_map = {
         "Semua Masa": 0, "Januari": 1, "Februari": 2, "Maret": 3, "April": 4,
@@ -279,10 +385,7 @@ elif st.session_state.step == "filter":
 
     masa_nama = st.selectbox("🗓️ Pilih Masa Pajak:", list(bulan_map.keys()))
     masa = bulan_map[masa_nama]
-    jenis_spt = st.selectbox("📂 Pilih Jenis SPT:", [
-        "SPT PPh 21",
-        "SPT PPh Unifikasi (PPh Pasal 22, PPh Pasal 23, dan PPh Pasal 4 ayat (2))"
-    ])
+    jenis_spt = st.selectbox("📂 Pilih Jenis SPT:", JENIS_SPT)
 
     st.session_state.masa = masa
     st.session_state.jenis_spt = jenis_spt
@@ -296,104 +399,103 @@ elif st.session_state.step == "filter":
 
 
 # ======================
-# STEP 5: BUAT EXCEL
+# STEP 5: BUAT XML / EXCEL
 # ======================
 elif st.session_state.step == "excel":
-    st.write("### 📈 Langkah 5 — Generate Excel Berdasarkan Input")
-    df = st.session_state.df
+    st.write("### 📈 Langkah 5 — Generate XML dan Excel Berdasarkan Input")
+    from bupot_excel import TEMPLATE_NAMES, fill_template, filter_bupot
+    from bupot_xml import frame_to_xml
+    from reconcile import ERROR
+    tax_lines = st.session_state.df_handle.rows
     npwp = st.session_state.npwp
     masa = st.session_state.masa
     jenis_spt = st.session_state.jenis_spt
-    pdf_filename = st.session_state.uploaded_file.name.rsplit('.', 1)[0]
-
-    df["date"] = pd.to_datetime(df["date"], format="%d/%m/%Y", errors="coerce")
-    df = df.dropna(subset=["date"])
-
-    # Filter Data
-    if masa == 0:
-        df_filtered = df
-    else:
-        df_filtered = df[df['date'].dt.month == masa]
-    df_filtered = df_filtered[df_filtered['pemotongan'] > 0]
-    # Filter berdasarkan jenis SPT
-    if jenis_spt == "SPT PPh 21":
-        df_filtered = df_filtered[df_filtered['tax'].str.contains("PPh Pasal 21")]
-        template_path = "./BP21 Excel to XML v.4.xlsx"
-    else:
-        unifikasi_pajak = ["PPh Pasal 22", "PPh Pasal 23", "PPh Pasal 4 ayat (2)"]
-        template_path = "./BPPU Excel to XML v.3.xlsx"
-        pattern = '|'.join(unifikasi_pajak)
-        df_filtered = df_filtered[df_filtered['tax'].str.contains(pattern, case=False, regex=True)]
-
-    df_filtered.reset_index(drop=True, inplace=True)
-
-    # Load your Excel template
-    
-    wb = load_workbook(template_path)
-    ws = wb.active
-    table = list(ws._tables.values())[0]
-    
-    # === Start writing data from row 4 ===
-    ws[f'C1'] = npwp
-    start_row = 4
-    for i, row in df_filtered.iterrows():
-        excel_row = start_row + i
-        above_row = excel_row + i -1
-        ws[f'B{excel_row}'] = row['date'].month
-        ws[f'C{excel_row}'] = row['date'].year
-        ws[f'D{excel_row}'] = "0000000000000000"
-        ws[f'E{excel_row}'] = f'=D{excel_row} & "000000"'
-        if jenis_spt == "SPT PPh 21":
-            ws[f'F{excel_row}'] = "K/0"
-            ws[f'G{excel_row}'] = "N/A"
-            ws[f'H{excel_row}'] = "21-100-17"
-            ws[f'I{excel_row}'] = row['pemotongan']/0.05
-            ws[f'J{excel_row}'] = 100
-            ws[f'K{excel_row}'] = 5
-            ws[f'L{excel_row}'] = "PaymentProof"
-            ws[f'M{excel_row}'] = row['kwt']
-            ws[f'N{excel_row}'] = row['date'].strftime("%Y-%m-%d")
-            ws[f'O{excel_row}'] = f'{npwp}000000'
-            ws[f'P{excel_row}'] = row['date'].strftime("%Y-%m-%d")
-        else:
-            ws[f'F{excel_row}'] = "N/A"
-            ws[f'G{excel_row}'] = "22-910-01" if "PPh Pasal 22" in row['tax'] else ("24-100-02" if "PPh Pasal 23" in row['tax'] else ("28-403-02" if "PPh Pasal 4 ayat (2)" in row['tax'] else ""))
-            ws[f'H{excel_row}'] = (
-                                    row['pemotongan']/0.015 if "PPh Pasal 22" in row['tax'] else
-                                    row['pemotongan']/0.02 if "PPh Pasal 23" in row['tax'] else
-                                    row['pemotongan']/0.1 if "PPh Pasal 4 ayat (2)" in row['tax'] else ""
-                                )
-            ws[f'I{excel_row}'] = (
-                        1.5 if "PPh Pasal 22" in row['tax'] else
-                        2 if "PPh Pasal 23" in row['tax'] else
-                        10 if "PPh Pasal 4 ayat (2)" in row['tax'] else ""
-                    )
-            ws[f'J{excel_row}'] = "PaymentProof"
-            ws[f'K{excel_row}'] = row['kwt']
-            ws[f'L{excel_row}'] = row['date'].strftime("%Y-%m-%d")
-            ws[f'M{excel_row}'] = f'{npwp}000000'
-            ws[f'N{excel_row}'] = "Imprest"
-            ws[f'P{excel_row}'] = row['date'].strftime("%Y-%m-%d")
- 
-    table.ref = f"B3:P{excel_row}"
-
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    template_name = "Bupot 21" if jenis_spt == "SPT PPh 21" else "Bupot Unifikasi"
-    
+    pdf_filename = st.session_state.file_name.rsplit('.', 1)[0]
+
+    metrics = get_metrics()
+    # This session's own extraction, not the shared store
+    with metrics.stage("filter_bupot", tax_lines=tax_lines) as stage:
+        df_filtered = filter_bupot(load_session_df(), masa, jenis_spt)
+        stage.count("rows", len(df_filtered))
+
+    template_name = TEMPLATE_NAMES[jenis_spt]
+    if (st.session_state.findings["severity"] == ERROR).any():
+        st.warning("⚠️ Pemeriksaan di langkah 3 menemukan baris yang tidak konsisten; periksa kembali hasil Bupot.")
+
+    # XML straight from the rows, no workbook round trip through convertToXML
+    with metrics.stage("xml_export", rows_written=len(df_filtered)):
+        with frame_to_xml(df_filtered, npwp, jenis_spt) as xml_file:
+            xml_output = xml_file.read()
     st.download_button(
-        label="⬇️ Download Hasil Excel",
-        data=output,
-        file_name=f"{template_name}_{pdf_filename}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        label="⬇️ Download XML (Coretax)",
+        data=xml_output,
+        file_name=f"{template_name}_{pdf_filename}.xml",
+        mime="application/xml"
     )
+
+    if st.checkbox("Buat juga file Excel template"):
+        with metrics.stage("template_fill", rows_written=len(df_filtered)):
+            output = fill_template(df_filtered, npwp, jenis_spt)
+        st.download_button(
+            label="⬇️ Download Hasil Excel",
+            data=output,
+            file_name=f"{template_name}_{pdf_filename}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
     if st.button("⬅️ Kembali"):
         go_to_step("filter")
         st.rerun()
 
 
+# ======================
+# Rekap lintas desa
+# ======================
+if st.sidebar.checkbox("📚 Rekap lintas desa"):
+    from bupot_excel import JENIS_SPT
+    from transaction_store import QUARTERS
+    store = get_transaction_store()
+    years = store.years()
+    with st.expander("📚 Rekap Pemotongan dan Penyetoran Lintas Desa", expanded=True):
+        if not years:
+            st.caption("Belum ada transaksi tersimpan.")
+        else:
+            periods = {"Tahunan": None, **{f"Triwulan {q}": months for q, months in QUARTERS.items()}}
+            col_year, col_period, col_jenis = st.columns(3)
+            year = col_year.selectbox("Tahun", years[::-1])
+            period = col_period.selectbox("Periode", list(periods))
+            jenis = col_jenis.selectbox("Jenis SPT", ["Semua pajak", *JENIS_SPT])
+            with get_metrics().stage("store_recap"):
+                recap = store.recap(year, periods[period], None if jenis == "Semua pajak" else jenis)
+            st.dataframe(recap.style.format({"pemotongan": "Rp {:,.2f}", "penyetoran": "Rp {:,.2f}"}),
+                         use_container_width=True)
+            st.download_button(
+                label="⬇️ Download Rekap (CSV)",
+                data=recap.to_csv(index=False).encode("utf-8"),
+                file_name=f"rekap_{year}_{period.replace(' ', '_').lower()}.csv",
+                mime="text/csv",
+            )
+
+# ======================
+# Diagnostics (optional)
+# ======================
+if st.sidebar.checkbox("🔧 Tampilkan diagnostik", value=bool(os.environ.get("XTRACTPAJAK_DIAGNOSTICS"))):
+    metrics = get_metrics()
+    with st.expander("🔧 Diagnostik", expanded=True):
+        import pandas as pd
+        if metrics.records:
+            st.dataframe(pd.DataFrame(metrics.table()).iloc[::-1], use_container_width=True)
+        else:
+            st.caption("Belum ada tahap yang tercatat di sesi ini.")
+        cache = get_extract_cache()
+        cache_stats = cache.stats()
+        st.caption(f"Cache ekstraksi: {cache_stats['hits']} hit, {cache_stats['misses']} miss, "
+                   f"{cache_stats['entries']} entri ({cache_stats['size_bytes'] / 2 ** 20:.1f} MB)")
+        if st.checkbox("Profil cProfile untuk semua tahap berikutnya", value=metrics.profile is True):
+            metrics.profile = True
+            st.caption(f"File .prof disimpan di {metrics.profile_dir}")
+        elif metrics.profile is True:
+            metrics.profile = frozenset()
+
 # ======================
 # Footer
 # ======================
@@ -0,0 +1,479 @@
+#HTTP job API for BKPP extraction, Bupot template fill and Excel to XML conversion
+"""
+Usage:
+    python api_server.py --host 127.0.0.1 --port 8600 --workers 2 --queue 32
+
+Every operation is an asynchronous job: POST starts it and answers 202
+with the job id, the client polls the status and downloads the result.
+Request bodies wait for their job and results wait for their download in
+files under the upload directory, not in memory.
+
+    POST   /jobs/extract?npwp=<16 digit>[&name=<desa>][&mode=text|layout]
+           body: BKPP PDF. Result: JSON {"rows", "summary", "monthly", "findings"}
+           (findings: see reconcile.py)
+    POST   /jobs/bupot?npwp=<16 digit>&jenis=21|unifikasi[&masa=0-12][&format=xlsx|xml]
+           body: JSON {"rows": [...]} as returned by an extract job, or
+           empty with &source=<extract job id>. Result: Bupot Excel or XML
+    POST   /jobs/xml?type=Bp21|Bpu
+           body: filled Bupot workbook (.xlsx). Result: Coretax XML
+    GET    /jobs/<id>           status and progress
+    GET    /jobs/<id>/result    result download, 409 until the job is done
+    DELETE /jobs/<id>           cancel
+    GET    /health              worker and queue counts
+
+At most --workers jobs run at once and --queue jobs wait; further POSTs
+get 429 with a Retry-After header. Finished jobs and their results are
+kept for --retention seconds. Extractions share the on-disk caches of the
+Streamlit app (same environment variables), and --store saves extracted
+rows to the transaction store for the cross-desa recap.
+
+There is no authentication: bind it to localhost or put it behind a
+proxy that does.
+"""
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+from urllib.parse import parse_qs, urlsplit
+import uuid
+
+from extract_jobs import CANCELLED, DONE, FAILED, JobManager, JobQueueFull, run_extraction
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 64 * 1024 * 1024
+RETRY_AFTER_SECONDS = 10
+
+JOB_PATH_RE = re.compile(r'/jobs/([0-9a-f]{32})(/result)?')
+SAFE_NAME_RE = re.compile(r'[\w.-]{1,64}', re.ASCII)
+UNSAFE_FILENAME_RE = re.compile(r'[^\w.-]', re.ASCII)
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class BadRequest(Exception):
+    """Invalid parameters or body; answered with 400 and the message."""
+
+
+def _param(params, name, default=None, choices=None):
+    value = params.get(name, [default])[0]
+    if value is None:
+        raise BadRequest(f"parameter '{name}' wajib diisi")
+    if choices is not None and value not in choices:
+        raise BadRequest(f"parameter '{name}' harus salah satu dari {sorted(choices)}")
+    return value
+
+
+def _npwp(params):
+    npwp = _param(params, "npwp")
+    if not re.fullmatch(r"\d{16}", npwp):
+        raise BadRequest("NPWP harus 16 digit angka tanpa simbol")
+    return npwp
+
+
+def _name(params):
+    # Ends up in the download's file name and Content-Disposition header
+    name = _param(params, "name", "bkpp")
+    if not SAFE_NAME_RE.fullmatch(name):
+        raise BadRequest("parameter 'name' hanya boleh huruf, angka, '_', '-' dan '.' (maksimal 64)")
+    return name
+
+
+def _attachment(filename):
+    """Content-Disposition value; names from workbook cells (TIN) are not validated upstream."""
+    return f'attachment; filename="{UNSAFE_FILENAME_RE.sub("_", filename)}"'
+
+
+def _frame_json(df):
+    return df.to_json(orient="records", date_format="iso", force_ascii=False)
+
+
+def extract_json(result):
+    """An extraction result ({"df", "summary", "monthly"}) and its reconciliation findings as JSON bytes."""
+    from reconcile import reconcile
+
+    findings = reconcile(result["df"])
+    findings["date"] = findings["date"].dt.strftime("%Y-%m-%d")
+    df = result["df"].copy()
+    df["date"] = df["date"].dt.strftime("%Y-%m-%d")
+    df["tax_code"] = df["tax_code"].astype(object)
+    monthly = result["monthly"].reset_index().rename(columns={"date": "month"})
+    return (
+        f'{{"rows": {_frame_json(df)}, "summary": {_frame_json(result["summary"])}, '
+        f'"monthly": {_frame_json(monthly)}, "findings": {_frame_json(findings)}}}'
+    ).encode("utf-8")
+
+
+def rows_to_frame(rows):
+    """The `rows` of an extract result back as a tax line frame."""
+    import pandas as pd
+    from bkpp_frame import ENTRY_COLUMNS, MONEY_COLUMNS
+    from tax_taxonomy import tax_codes
+
+    df = pd.DataFrame(rows, columns=[*ENTRY_COLUMNS, "tax", *MONEY_COLUMNS])
+    df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d", errors="coerce")
+    for column in MONEY_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors="coerce").fillna(0.0)
+    df["tax_code"] = tax_codes(df)
+    return df
+
+
+class JobApi:
+    """The operations behind the HTTP endpoints, on a bounded JobManager."""
+
+    def __init__(self, workers=2, max_queued=32, retention=3600, upload_dir=None,
+                 extract_workers=1, store_path=None):
+        from extract_cache import ExtractCache
+        from bkpp_incremental import IncrementalStore
+
+        self.jobs = JobManager(retention=retention, workers=workers, max_queued=max_queued)
+        self.upload_dir = upload_dir or os.path.join(".cache", "api")
+        os.makedirs(self.upload_dir, exist_ok=True)
+        # Spooled request body and result file per job, see _sweep; both
+        # dicts are shared by the HTTP and job worker threads
+        self._uploads = {}
+        self._results = {}
+        self._lock = threading.Lock()
+        self.extract_workers = extract_workers
+        self.cache = ExtractCache(os.environ.get("XTRACTPAJAK_CACHE_DIR", os.path.join(".cache", "extract")))
+        self.incremental = IncrementalStore(
+            os.environ.get("XTRACTPAJAK_INCREMENTAL_DIR", os.path.join(".cache", "incremental")))
+        self.store = None
+        if store_path:
+            from transaction_store import TransactionStore
+            self.store = TransactionStore(store_path)
+
+    def submit(self, op, params, body):
+        """Validate and queue a job for `op`, return it. Raises BadRequest or JobQueueFull."""
+        self._sweep()
+        key = uuid.uuid4().hex
+        if op == "extract":
+            work, meta = self._extract_work(key, params, body)
+        elif op == "bupot":
+            work, meta = self._bupot_work(key, params, body)
+        elif op == "xml":
+            work, meta = self._xml_work(key, params, body)
+        else:
+            raise BadRequest(f"operasi tidak dikenal: {op}")
+        try:
+            return self.jobs.submit(key, work, meta=dict(meta, op=op))
+        except JobQueueFull:
+            self._remove_upload(key)
+            raise
+
+    @staticmethod
+    def _unlink(path):
+        if path is not None:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _spool_upload(self, key, body, suffix):
+        """Write a request body to the upload directory; queued jobs wait on disk, not in memory."""
+        fd, path = tempfile.mkstemp(dir=self.upload_dir, suffix=suffix)
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+        with self._lock:
+            self._uploads[key] = path
+        return path
+
+    def _remove_upload(self, key):
+        with self._lock:
+            path = self._uploads.pop(key, None)
+        self._unlink(path)
+
+    def _write_result(self, job, write, content_type, filename, rows, **extra):
+        """
+        Result dict of a job whose download `write(output)` writes to a
+        file; the file is deleted with the job, see _sweep.
+        """
+        path = os.path.join(self.upload_dir, f"{job.key}.result")
+        with self._lock:
+            self._results[job.key] = path
+        try:
+            with open(path, "wb") as output:
+                write(output)
+        except BaseException:
+            with self._lock:
+                self._results.pop(job.key, None)
+            self._unlink(path)
+            raise
+        return dict(extra, path=path, content_type=content_type, filename=filename, rows=rows)
+
+    def _sweep(self):
+        """
+        Delete request bodies of jobs that finished without reading them
+        (cancelled while queued) and results of jobs past their retention.
+        """
+        with self._lock:
+            uploads, results = list(self._uploads), list(self._results)
+        for key in uploads:
+            job = self.jobs.get(key)
+            if job is not None and job.finished is not None:
+                self._remove_upload(key)
+        for key in results:
+            if self.jobs.get(key) is None:
+                with self._lock:
+                    path = self._results.pop(key, None)
+                self._unlink(path)
+
+    def _extract_work(self, key, params, body):
+        from bkpp_parser import EXTRACT_MODES
+
+        npwp = _npwp(params)
+        mode = _param(params, "mode", "text", EXTRACT_MODES)
+        name = _name(params)
+        if not body.startswith(b"%PDF"):
+            raise BadRequest("body harus berupa file PDF")
+        cache_key = self.cache.key(body, mode=mode)
+        path = self._spool_upload(key, body, ".pdf")
+
+        def work(job):
+            try:
+                result = self.cache.get(cache_key)
+                if result is None:
+                    result = run_extraction(job, path, self.incremental, mode, self.extract_workers,
+                                            cache=self.cache, cache_key=cache_key)
+            finally:
+                self._remove_upload(job.key)
+            if self.store is not None:
+                self.store.save_frame(result["df"], npwp, desa=name, source=name)
+            # The frame is not kept: a source= job reads it back, see _source_frame
+            return self._write_result(job, lambda output: output.write(extract_json(result)),
+                                      "application/json", f"{name}.json", len(result["df"]),
+                                      cache_key=cache_key)
+
+        return work, {"npwp": npwp, "name": name}
+
+    def _source_frame(self, source):
+        """The tax line frame of a finished extract job: from the extraction cache, else its JSON result."""
+        cached = self.cache.get(source.result["cache_key"])
+        if cached is not None:
+            return cached["df"]
+        try:
+            with open(source.result["path"], "rb") as f:
+                return rows_to_frame(json.load(f)["rows"])
+        except FileNotFoundError:
+            raise ValueError(f"hasil job ekstraksi {source.key} sudah dihapus") from None
+
+    def _bupot_work(self, key, params, body):
+        from bupot_excel import SPT_21, SPT_UNIFIKASI, TEMPLATE_NAMES
+
+        npwp = _npwp(params)
+        jenis_spt = {"21": SPT_21, "unifikasi": SPT_UNIFIKASI}[
+            _param(params, "jenis", choices={"21", "unifikasi"})]
+        masa = _param(params, "masa", "0", {str(m) for m in range(13)})
+        fmt = _param(params, "format", "xlsx", {"xlsx", "xml"})
+        source_id = params.get("source", [None])[0]
+        source, path = None, None
+        if source_id is not None:
+            source = self.jobs.get(source_id)
+            if source is None or source.meta.get("op") != "extract":
+                raise BadRequest(f"job ekstraksi {source_id} tidak ditemukan")
+            if source.state != DONE:
+                raise BadRequest(f"job ekstraksi {source_id} belum selesai ({source.state})")
+        elif body.lstrip()[:1] != b"{":
+            raise BadRequest('body harus JSON {"rows": [...]} atau gunakan parameter source')
+        else:
+            # Parsed by the job, not on the HTTP thread
+            path = self._spool_upload(key, body, ".json")
+
+        def work(job):
+            from bupot_excel import fill_template, filter_bupot
+            from bupot_xml import write_frame_xml
+
+            if source is not None:
+                df = self._source_frame(source)
+            else:
+                try:
+                    with open(path, "rb") as f:
+                        rows = json.load(f)["rows"]
+                except (ValueError, KeyError, TypeError):
+                    raise ValueError('body harus JSON {"rows": [...]}') from None
+                finally:
+                    self._remove_upload(job.key)
+                df = rows_to_frame(rows)
+            df_filtered = filter_bupot(df, int(masa), jenis_spt)
+            name = f"{TEMPLATE_NAMES[jenis_spt]}_{npwp}"
+            if fmt == "xml":
+                return self._write_result(job, lambda output: write_frame_xml(df_filtered, npwp, jenis_spt, output),
+                                          "application/xml", f"{name}.xml", len(df_filtered))
+            workbook = fill_template(df_filtered, npwp, jenis_spt)
+            return self._write_result(job, lambda output: output.write(workbook.getbuffer()),
+                                      XLSX_MIME, f"{name}.xlsx", len(df_filtered))
+
+        return work, {"npwp": npwp, "jenis_spt": jenis_spt, "masa": int(masa), "format": fmt}
+
+    def _xml_work(self, key, params, body):
+        from bupot_excel import SPT_TYPES
+
+        type_spt = _param(params, "type", choices=set(SPT_TYPES.values()))
+        if not body.startswith(b"PK"):
+            raise BadRequest("body harus berupa file Excel (.xlsx)")
+        path = self._spool_upload(key, body, ".xlsx")
+
+        def work(job):
+            from bupot_batch import convert_workbook
+            from bupot_xml import write_bulk_parts
+
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            finally:
+                self._remove_upload(job.key)
+            with tempfile.TemporaryDirectory(dir=self.upload_dir) as directory:
+                result = convert_workbook("upload.xlsx", data, type_spt, directory)
+                if result["error"] is not None:
+                    raise ValueError(result["error"])
+                parts = [(result["path"], result["rows"])]
+                return self._write_result(job, lambda output: write_bulk_parts(output, type_spt, result["tin"], parts),
+                                          "application/xml", f"{type_spt}_{result['tin']}.xml", result["rows"])
+
+        return work, {"type": type_spt}
+
+    def status(self, job):
+        status = {"id": job.key, **job.meta, **job.progress(), "result_url": None}
+        if job.state == DONE:
+            status["result_url"] = f"/jobs/{job.key}/result"
+            status["rows"] = job.result["rows"]
+        return status
+
+    def health(self):
+        jobs = self.jobs.jobs()
+        counts = {}
+        for job in jobs:
+            counts[job.state] = counts.get(job.state, 0) + 1
+        return {"workers": self.jobs.workers, "queued": self.jobs.queued(), "jobs": counts}
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = "XtractPajakAPI/1.0"
+
+    @property
+    def api(self):
+        return self.server.api
+
+    def log_message(self, format, *args):
+        logger.info("%s %s", self.address_string(), format % args)
+
+    def _send_headers(self, status, content_type, length, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(length))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+
+    def _send(self, status, body, content_type="application/json", headers=()):
+        self._send_headers(status, content_type, len(body), headers)
+        self.wfile.write(body)
+
+    def _json(self, status, payload, headers=()):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), headers=headers)
+
+    def _error(self, status, message, headers=()):
+        self._json(status, {"error": message}, headers)
+
+    def _job(self):
+        match = JOB_PATH_RE.fullmatch(urlsplit(self.path).path)
+        job = self.api.jobs.get(match.group(1)) if match else None
+        return match, job
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/health":
+            return self._json(HTTPStatus.OK, self.api.health())
+        match, job = self._job()
+        if job is None:
+            return self._error(HTTPStatus.NOT_FOUND, "job tidak ditemukan")
+        if not match.group(2):
+            return self._json(HTTPStatus.OK, self.api.status(job))
+        if job.state != DONE:
+            status = HTTPStatus.CONFLICT if job.state not in (FAILED, CANCELLED) else HTTPStatus.GONE
+            return self._error(status, f"job {job.state}", [("Retry-After", str(RETRY_AFTER_SECONDS))])
+        result = job.result
+        try:
+            f = open(result["path"], "rb")
+        except FileNotFoundError:
+            return self._error(HTTPStatus.GONE, "hasil job sudah dihapus")
+        with f:
+            self._send_headers(HTTPStatus.OK, result["content_type"], os.fstat(f.fileno()).st_size,
+                               [("Content-Disposition", _attachment(result["filename"]))])
+            shutil.copyfileobj(f, self.wfile)
+
+    def do_DELETE(self):
+        match, job = self._job()
+        if job is None or match.group(2):
+            return self._error(HTTPStatus.NOT_FOUND, "job tidak ditemukan")
+        job.cancel()
+        self._json(HTTPStatus.ACCEPTED, self.api.status(job))
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        match = re.fullmatch(r'/jobs/(\w+)', url.path)
+        if not match:
+            return self._error(HTTPStatus.NOT_FOUND, "endpoint tidak ditemukan")
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            return self._error(HTTPStatus.LENGTH_REQUIRED, "Content-Length wajib diisi")
+        if int(length) > MAX_BODY_BYTES:
+            return self._error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"maksimal {MAX_BODY_BYTES} byte")
+        if self.api.jobs.full():
+            # Refuse before reading the body; submit() still checks, another request may take the room
+            self.close_connection = True
+            return self._error(HTTPStatus.TOO_MANY_REQUESTS, "antrian penuh",
+                               [("Retry-After", str(RETRY_AFTER_SECONDS))])
+        body = self.rfile.read(int(length))
+        try:
+            job = self.api.submit(match.group(1), parse_qs(url.query), body)
+        except BadRequest as e:
+            return self._error(HTTPStatus.BAD_REQUEST, str(e))
+        except JobQueueFull as e:
+            return self._error(HTTPStatus.TOO_MANY_REQUESTS, f"antrian penuh: {e}",
+                               [("Retry-After", str(RETRY_AFTER_SECONDS))])
+        self._json(HTTPStatus.ACCEPTED, self.api.status(job),
+                   [("Location", f"/jobs/{job.key}")])
+
+
+def make_server(host, port, api):
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    server.api = api
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Layanan HTTP untuk ekstraksi BKPP dan konversi Bupot.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--workers", type=int, default=2, help="jumlah job yang berjalan bersamaan")
+    parser.add_argument("--queue", type=int, default=32, help="jumlah job yang boleh menunggu")
+    parser.add_argument("--retention", type=int, default=3600, help="detik hasil job disimpan")
+    parser.add_argument("--extract-workers", type=int,
+                        default=max(1, (os.cpu_count() or 1) // 2),
+                        help="proses parser per ekstraksi")
+    parser.add_argument("--store", help="simpan transaksi ke file SQLite ini untuk rekap lintas desa")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    api = JobApi(workers=max(1, args.workers), max_queued=max(1, args.queue), retention=args.retention,
+                 extract_workers=max(1, args.extract_workers), store_path=args.store)
+    server = make_server(args.host, args.port, api)
+    logger.info("Listening on http://%s:%d", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
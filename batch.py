@@ -0,0 +1,173 @@
+#Batch convert BKPP PDFs to Bupot Excel and XML without the Streamlit UI
+"""
+Usage:
+    python batch.py "bkpp/*.pdf" --npwp-map npwp.csv --masa 3 --out hasil/
+
+The NPWP mapping is a CSV with `file` and `npwp` columns, where `file` is the
+PDF file name with or without the .pdf extension. Use --npwp instead to apply
+one NPWP to every file.
+
+Exit codes: 0 all files converted, 1 at least one file failed, 2 bad arguments.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+from bkpp_frame import entries_to_frame
+from bkpp_parser import EXTRACT_MODES, extract_entries, pool_context
+from bupot_excel import SPT_21, SPT_UNIFIKASI, TEMPLATE_NAMES, fill_template, filter_bupot
+from bupot_xml import write_frame_xml
+from reconcile import ERROR, finding_counts, reconcile
+from transaction_store import TransactionStore
+
+JENIS_CHOICES = {
+    "21": SPT_21,
+    "unifikasi": SPT_UNIFIKASI,
+}
+
+
+def collect_inputs(patterns):
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*.pdf")
+        paths.extend(sorted(glob.glob(pattern)))
+    # Keep order, drop duplicates from overlapping patterns
+    return list(dict.fromkeys(p for p in paths if p.lower().endswith(".pdf")))
+
+
+def load_npwp_map(path):
+    npwp_map = {}
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        if not {"file", "npwp"} <= set(reader.fieldnames or ()):
+            raise ValueError("kolom 'file' dan 'npwp' wajib ada")
+        for row in reader:
+            name = row["file"].strip()
+            npwp_map[name] = row["npwp"].strip()
+            npwp_map[os.path.splitext(name)[0]] = row["npwp"].strip()
+    return npwp_map
+
+
+def process_file(pdf_path, npwp, masa, jenis_list, out_dir, mode="text", store_path=None, excel=True):
+    """Convert one BKPP PDF, return a report dict for the summary."""
+    started = time.perf_counter()
+    pdf_filename = os.path.splitext(os.path.basename(pdf_path))[0]
+    report = {"file": pdf_path, "npwp": npwp, "outputs": [], "error": None}
+    try:
+        if not re.fullmatch(r"\d{16}", npwp or ""):
+            raise ValueError("NPWP harus 16 digit angka tanpa simbol")
+
+        df = entries_to_frame(extract_entries(pdf_path, mode=mode))
+        if df.empty:
+            raise ValueError("tidak ada transaksi pajak yang terbaca")
+        report["tax_lines"] = len(df)
+        findings = reconcile(df)
+        report["findings"] = finding_counts(findings)
+        report["reconcile_errors"] = int((findings["severity"] == ERROR).sum())
+        if store_path:
+            TransactionStore(store_path).save_frame(df, npwp, desa=pdf_filename, source=pdf_path)
+
+        for jenis_spt in jenis_list:
+            df_filtered = filter_bupot(df, masa, jenis_spt)
+            if df_filtered.empty:
+                continue
+            base_name = os.path.join(out_dir, f"{TEMPLATE_NAMES[jenis_spt]}_{pdf_filename}")
+            with open(f"{base_name}.xml", "wb") as f:
+                write_frame_xml(df_filtered, npwp, jenis_spt, f)
+            if excel:
+                with open(f"{base_name}.xlsx", "wb") as f:
+                    f.write(fill_template(df_filtered, npwp, jenis_spt).getvalue())
+            report["outputs"].append({"jenis_spt": jenis_spt, "rows": len(df_filtered), "path": base_name})
+    except Exception as e:
+        report["error"] = f"{type(e).__name__}: {e}"
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Konversi banyak file BKPP (PDF) ke Excel Bupot dan XML.")
+    parser.add_argument("inputs", nargs="+", help="folder, file PDF, atau pola glob")
+    npwp_group = parser.add_mutually_exclusive_group(required=True)
+    npwp_group.add_argument("--npwp-map", help="CSV dengan kolom file,npwp")
+    npwp_group.add_argument("--npwp", help="NPWP untuk semua file")
+    parser.add_argument("--masa", type=int, default=0, choices=range(0, 13), metavar="0-12",
+                        help="masa pajak (0 = semua masa)")
+    parser.add_argument("--jenis", action="append", choices=sorted(JENIS_CHOICES),
+                        help="jenis SPT, bisa diulang (default: 21 dan unifikasi)")
+    parser.add_argument("--out", default="hasil", help="folder output")
+    parser.add_argument("--mode", choices=EXTRACT_MODES, default="text",
+                        help="text: nilai dibaca dari teks halaman, layout: per posisi kolom "
+                             "(untuk BKPP yang mengosongkan nilai 0,00)")
+    parser.add_argument("--no-excel", dest="excel", action="store_false",
+                        help="hanya tulis XML, tanpa file Excel template")
+    parser.add_argument("--store", help="simpan transaksi ke file SQLite ini untuk rekap lintas desa")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--report", help="tulis ringkasan JSON ke file ini")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    pdf_paths = collect_inputs(args.inputs)
+    if not pdf_paths:
+        print("Tidak ada file PDF yang ditemukan.", file=sys.stderr)
+        return 2
+
+    if args.npwp_map:
+        try:
+            npwp_map = load_npwp_map(args.npwp_map)
+        except (OSError, KeyError, ValueError, AttributeError, csv.Error) as e:
+            # Missing columns, short rows (None values), undecodable or malformed files
+            print(f"File NPWP tidak valid: {type(e).__name__}: {e}", file=sys.stderr)
+            return 2
+    jenis_list = [JENIS_CHOICES[j] for j in (args.jenis or ["21", "unifikasi"])]
+    os.makedirs(args.out, exist_ok=True)
+
+    reports = []
+    with ProcessPoolExecutor(max_workers=max(1, args.workers), mp_context=pool_context()) as executor:
+        futures = {}
+        for pdf_path in pdf_paths:
+            if args.npwp_map:
+                name = os.path.basename(pdf_path)
+                npwp = npwp_map.get(name) or npwp_map.get(os.path.splitext(name)[0])
+            else:
+                npwp = args.npwp
+            future = executor.submit(process_file, pdf_path, npwp, args.masa, jenis_list, args.out,
+                                     args.mode, args.store, args.excel)
+            futures[future] = pdf_path
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                report = future.result()
+            except Exception as e:
+                # A crashed worker (BrokenProcessPool) fails its files, not the batch
+                report = {"file": futures[future], "outputs": [], "error": f"{type(e).__name__}: {e}",
+                          "seconds": None}
+            reports.append(report)
+            if report["error"]:
+                status = f"GAGAL {report['error']}"
+            else:
+                rows = ", ".join(f"{TEMPLATE_NAMES[o['jenis_spt']]}: {o['rows']} baris" for o in report["outputs"])
+                status = f"OK {rows or 'tidak ada baris untuk masa/jenis SPT ini'}"
+                if report["reconcile_errors"]:
+                    status += f" (PERIKSA: {report['reconcile_errors']} baris tidak konsisten)"
+            timing = f" ({report['seconds']}s)" if report["seconds"] is not None else ""
+            print(f"[{done}/{len(futures)}] {report['file']}{timing} {status}")
+
+    failed = [r for r in reports if r["error"]]
+    print(f"Selesai: {len(reports) - len(failed)} berhasil, {len(failed)} gagal.")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2, ensure_ascii=False)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
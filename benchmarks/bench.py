@@ -0,0 +1,294 @@
+#Stage-by-stage benchmark of the BKPP extraction and Bupot export pipeline
+"""
+Usage:
+    python -m benchmarks.bench --pages 200 --entries-per-page 12 --json hasil.json
+    python -m benchmarks.bench --pdf bkpp.pdf --baseline hasil.json
+
+Without --pdf a synthetic BKPP is generated (see benchmarks.synthetic_bkpp).
+Each stage is timed `--repeat` times (best run is reported) and then run
+once more under tracemalloc for its peak Python allocation. With
+--baseline, a stage slower or hungrier than the baseline by more than
+--tolerance fails the run.
+
+Exit codes: 0 ok, 1 regression against the baseline.
+"""
+from io import BytesIO
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+import pdfplumber
+
+from benchmarks.synthetic_bkpp import generate_bkpp_pdf
+from bkpp_frame import entries_to_frame, summarize
+from bkpp_parser import EXTRACT_MODES, BkppParser, extract_entries, normalize_entries
+from bupot_excel import JENIS_SPT, SPT_TYPES, fill_template, filter_bupot
+from bupot_xml import write_frame_xml, write_workbook_xml
+from reconcile import reconcile
+
+NPWP = "1234567890123456"
+
+
+class CountingSink:
+    """Binary sink that only counts bytes, so XML timing excludes disk I/O."""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        return len(data)
+
+
+# ======================
+# Stages: fn(ctx) -> (outputs for ctx, count, unit)
+# ======================
+def stage_pdf_text(ctx):
+    texts = []
+    with pdfplumber.open(BytesIO(ctx["pdf"])) as pdf:
+        for page in pdf.pages:
+            texts.append(page.extract_text())
+            page.close()
+    return {"texts": texts}, len(texts), "pages"
+
+
+def stage_parse(ctx):
+    parser = BkppParser()
+    entries = []
+    lines = 0
+    for text in ctx["texts"]:
+        lines += (text or "").count("\n") + 1
+        entries.extend(parser.feed_text(text))
+    tail = parser.finish()
+    if tail:
+        entries.append(tail)
+    return {"entries": entries}, lines, "lines"
+
+
+def stage_normalize_entries(ctx):
+    rows = normalize_entries(ctx["entries"])
+    return {"legacy_df": pd.DataFrame(rows)}, len(rows), "rows"
+
+
+def stage_entries_to_frame(ctx):
+    df = entries_to_frame(ctx["entries"])
+    return {"df": df}, len(df), "rows"
+
+
+def stage_summary(ctx):
+    summary, monthly = summarize(ctx["df"])
+    return {"summary": summary, "monthly": monthly}, len(ctx["df"]), "rows"
+
+
+def stage_reconcile(ctx):
+    findings = reconcile(ctx["df"])
+    return {"findings": len(findings)}, len(ctx["df"]), "rows"
+
+
+def stage_template_fill(ctx):
+    workbooks = {}
+    filtered = {}
+    rows = 0
+    for jenis_spt in JENIS_SPT:
+        df_filtered = filter_bupot(ctx["df"], 0, jenis_spt)
+        workbooks[jenis_spt] = fill_template(df_filtered, NPWP, jenis_spt).getvalue()
+        filtered[jenis_spt] = df_filtered
+        rows += len(df_filtered)
+    return {"workbooks": workbooks, "filtered": filtered, "bupot_rows": rows}, rows, "rows"
+
+
+def stage_xml(ctx):
+    size = 0
+    for jenis_spt, workbook in ctx["workbooks"].items():
+        sink = CountingSink()
+        write_workbook_xml(BytesIO(workbook), SPT_TYPES[jenis_spt], sink)
+        size += sink.size
+    return {"xml_bytes": size}, ctx["bupot_rows"], "rows"
+
+
+def stage_xml_direct(ctx):
+    size = 0
+    for jenis_spt, df_filtered in ctx["filtered"].items():
+        sink = CountingSink()
+        write_frame_xml(df_filtered, NPWP, jenis_spt, sink)
+        size += sink.size
+    return {"xml_direct_bytes": size}, ctx["bupot_rows"], "rows"
+
+
+def stage_layout_extract(ctx):
+    entries = extract_entries(ctx["pdf"], mode="layout")
+    outputs = {"layout_entries": len(entries)}
+    if ctx["mode"] == "layout":
+        # Later stages work on what the app would extract
+        outputs["entries"] = entries
+    return outputs, ctx["n_pages"], "pages"
+
+
+def stage_extract_parallel(ctx):
+    extract_entries(ctx["pdf"], workers=ctx["workers"])
+    return {}, ctx["n_pages"], "pages"
+
+
+STAGES = [
+    ("pdf_text", stage_pdf_text),
+    ("parse", stage_parse),
+    ("layout_extract", stage_layout_extract),
+    ("normalize_entries", stage_normalize_entries),
+    ("entries_to_frame", stage_entries_to_frame),
+    ("summary", stage_summary),
+    ("reconcile", stage_reconcile),
+    ("template_fill", stage_template_fill),
+    ("xml", stage_xml),
+    ("xml_direct", stage_xml_direct),
+]
+
+
+def measure(fn, ctx, repeat, memory=True):
+    """Run one stage, return (outputs, result dict)."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        outputs, count, unit = fn(ctx)
+        times.append(time.perf_counter() - started)
+    best = min(times)
+    result = {
+        "seconds": best,
+        "count": count,
+        "unit": unit,
+        "throughput": count / best if best else None,
+    }
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn(ctx)
+            result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return outputs, result
+
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss / 2 ** 20 if sys.platform == "darwin" else rss / 2 ** 10
+
+
+def run(pdf_bytes, repeat=3, workers=1, memory=True, progress=None, mode="text"):
+    ctx = {"pdf": pdf_bytes, "workers": workers, "mode": mode}
+    results = {}
+    stages = list(STAGES)
+    if workers > 1:
+        stages.append(("extract_parallel", stage_extract_parallel))
+    for name, fn in stages:
+        outputs, result = measure(fn, ctx, repeat, memory)
+        ctx.update(outputs)
+        ctx.setdefault("n_pages", len(ctx["texts"]))
+        results[name] = result
+        if progress:
+            progress(name, result)
+    summary = {
+        "pages": ctx["n_pages"],
+        "entries": len(ctx["entries"]),
+        "layout_entries": ctx["layout_entries"],
+        "tax_rows": len(ctx["df"]),
+        "bupot_rows": ctx["bupot_rows"],
+        "xml_bytes": ctx["xml_bytes"],
+        "max_rss_mb": max_rss_mb(),
+    }
+    return summary, results
+
+
+def format_result(name, result):
+    line = f"{name:<18} {result['seconds'] * 1000:10.1f} ms"
+    if result["throughput"] is not None:
+        line += f" {result['throughput']:12,.0f} {result['unit']}/s"
+    if "peak_mb" in result:
+        line += f" {result['peak_mb']:9.1f} MB peak"
+    return line
+
+
+def compare(results, baseline, tolerance):
+    """Stages that got slower or use more memory than `baseline` allows."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("stages", {}).get(name)
+        if not before:
+            continue
+        for key in ("seconds", "peak_mb"):
+            if key in result and key in before and result[key] > before[key] * (1 + tolerance):
+                regressions.append(f"{name} {key}: {before[key]:.3f} -> {result[key]:.3f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ekstraksi BKPP dan ekspor Bupot per tahap.")
+    parser.add_argument("--pdf", help="PDF BKPP nyata; tanpa ini dibuat PDF sintetis")
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--entries-per-page", type=int, default=12)
+    parser.add_argument("--max-taxes", type=int, default=3)
+    parser.add_argument("--ntpn-ratio", type=float, default=0.5)
+    parser.add_argument("--no-header-noise", action="store_true")
+    parser.add_argument("--blank-zeros", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=EXTRACT_MODES, default="text",
+                        help="Hasil ekstraksi yang dipakai tahap berikutnya")
+    parser.add_argument("--repeat", type=int, default=3, help="Jumlah pengulangan waktu per tahap")
+    parser.add_argument("--workers", type=int, default=1, help="Tambah tahap ekstraksi paralel bila > 1")
+    parser.add_argument("--no-memory", action="store_true", help="Lewati pengukuran tracemalloc")
+    parser.add_argument("--json", help="Simpan hasil ke file JSON")
+    parser.add_argument("--baseline", help="Bandingkan dengan hasil JSON sebelumnya")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Batas kenaikan relatif (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            pdf_bytes = f.read()
+        source = {"pdf": os.path.basename(args.pdf)}
+    else:
+        output = BytesIO()
+        generate_bkpp_pdf(output, args.pages, args.entries_per_page, args.max_taxes, args.ntpn_ratio,
+                          not args.no_header_noise, seed=args.seed, blank_zeros=args.blank_zeros)
+        pdf_bytes = output.getvalue()
+        source = {"synthetic": {"pages": args.pages, "entries_per_page": args.entries_per_page,
+                                "max_taxes": args.max_taxes, "ntpn_ratio": args.ntpn_ratio,
+                                "header_noise": not args.no_header_noise, "seed": args.seed,
+                                "blank_zeros": args.blank_zeros}}
+
+    summary, results = run(pdf_bytes, args.repeat, args.workers, not args.no_memory,
+                           progress=lambda name, result: print(format_result(name, result), flush=True),
+                           mode=args.mode)
+    print(", ".join(f"{key}={value:,.0f}" if isinstance(value, (int, float)) else f"{key}={value}"
+                    for key, value in summary.items()))
+
+    report = {
+        "source": source,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "summary": summary,
+        "stages": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESI {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#Cold-start and first-interaction benchmark for the Streamlit apps
+"""
+Usage:
+    python -m benchmarks.startup --repeat 5 --json startup.json
+
+Every measurement runs in a fresh interpreter, as on a newly started
+container. "import" rows time the modules each app step imports (the
+step's own imports, after the earlier steps'), next to "eager", which
+imports everything up front as the apps used to. "first" rows time the
+first and second call of work that is cached per process: template
+parsing and a step 5 export. Streamlit itself is not imported.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules each step imports, in step order (keep in sync with the apps)
+STEPS = [
+    ("upload", ["instrumentation", "spill_store"]),
+    ("npwp", ["mailer"]),
+    ("extract", ["extract_cache", "extract_jobs", "bkpp_frame", "bkpp_incremental", "report_export", "spill_store", "pyarrow", "transaction_store"]),
+    ("filter", ["bupot_excel"]),
+    ("excel", ["bupot_excel", "bupot_xml"]),
+    ("convert_upload", ["pandas", "bupot_batch", "bupot_xml"]),
+]
+
+IMPORT_SNIPPET = """
+import importlib, json, sys, time
+before, modules = {before!r}, {modules!r}
+for name in before:
+    importlib.import_module(name)
+started = time.perf_counter()
+for name in modules:
+    importlib.import_module(name)
+print(json.dumps(time.perf_counter() - started))
+"""
+
+FIRST_SNIPPET = """
+import json, time
+import pandas as pd
+from bupot_excel import JENIS_SPT, SPT_21, preload_templates
+from bupot_xml import frame_to_xml
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+df = pd.DataFrame({{
+    'date': pd.to_datetime(['2024-01-05'] * {rows}), 'kwt': ['0001/KWT/01.2001/2024'] * {rows},
+    'ntpn': [None] * {rows}, 'uraian': ['Belanja'] * {rows}, 'tax': ['Potongan Pajak PPh Pasal 21'] * {rows},
+    'pemotongan': [50000.0] * {rows}, 'penyetoran': [0.0] * {rows}, 'saldo': [50000.0] * {rows},
+}})
+result = {{
+    "templates_first": timed(preload_templates),
+    "templates_cached": timed(preload_templates),
+    "xml_export_first": timed(lambda: frame_to_xml(df, '1234567890123456', SPT_21).close()),
+    "xml_export_cached": timed(lambda: frame_to_xml(df, '1234567890123456', SPT_21).close()),
+}}
+print(json.dumps(result))
+"""
+
+
+def run_snippet(code):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    completed = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                               capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout)
+
+
+def import_seconds(modules, before=(), repeat=3):
+    code = IMPORT_SNIPPET.format(before=list(before), modules=list(modules))
+    return min(run_snippet(code) for _ in range(repeat))
+
+
+def run(repeat=3, rows=200):
+    results = {}
+    imported = []
+    for step, modules in STEPS:
+        if step == "convert_upload":
+            # The converter is a separate app: its steps start from nothing
+            imported = []
+        results[f"import:{step}"] = import_seconds(modules, imported, repeat)
+        imported = list(dict.fromkeys(imported + modules))
+    eager = list(dict.fromkeys(name for _, modules in STEPS for name in modules))
+    results["import:eager"] = import_seconds(eager, (), repeat)
+
+    first = [run_snippet(FIRST_SNIPPET.format(rows=rows)) for _ in range(repeat)]
+    for key in first[0]:
+        results[f"first:{key}"] = min(run[key] for run in first)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark waktu start dingin dan interaksi pertama aplikasi.")
+    parser.add_argument("--repeat", type=int, default=3, help="Jumlah proses baru per pengukuran")
+    parser.add_argument("--rows", type=int, default=200, help="Jumlah baris untuk ekspor XML langkah 5")
+    parser.add_argument("--json", help="Simpan hasil ke file JSON")
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat, args.rows)
+    for name, seconds in results.items():
+        print(f"{name:<28} {seconds * 1000:10.1f} ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+#Generate synthetic Siskeudes-style BKPP PDFs for benchmarks
+"""
+Usage:
+    python -m benchmarks.synthetic_bkpp bkpp_sintetis.pdf --pages 120 --entries-per-page 12
+
+The PDF is written by hand (standard Helvetica font, one text object per
+table cell) so no PDF library is needed. Cells sit at fixed column
+positions like the Siskeudes report: Tanggal, No Bukti, Uraian,
+Pemotongan, Penyetoran, Saldo. Entries flow across page breaks.
+"""
+from datetime import date, timedelta
+import argparse
+import random
+import zlib
+
+PAGE_WIDTH = 842   # A4 landscape
+PAGE_HEIGHT = 595
+FONT_SIZE = 7
+TOP_Y = 555
+BOTTOM_Y = 40
+
+# Left edge of each table column (amount columns are right-aligned to the next edge)
+COLUMNS = {"tanggal": 30, "bukti": 85, "uraian": 200, "pemotongan": 520, "penyetoran": 620, "saldo": 720}
+AMOUNT_RIGHT = {"pemotongan": 600, "penyetoran": 700, "saldo": 800}
+
+TAXES = [
+    "Potongan Pajak PPh Pasal 21",
+    "Potongan Pajak PPh Pasal 22",
+    "Potongan Pajak PPh Pasal 23",
+    "Potongan Pajak PPN Pusat",
+    "Pajak Restoran, Rumah Makan",
+]
+URAIAN_WORDS = [
+    "Belanja", "Honorarium", "Pembangunan", "Jalan", "Lingkungan", "Pengadaan", "Alat",
+    "Tulis", "Kantor", "Konsumsi", "Kegiatan", "Posyandu", "Pemeliharaan", "Gedung",
+    "Balai", "Perjalanan", "Dinas", "Tim", "Pelaksana", "Material", "Drainase", "Sumur",
+]
+
+# Helvetica advance widths (1/1000 em) for right-aligning amounts
+_DIGIT_WIDTH = 556
+_PUNCT_WIDTH = 278
+
+
+def format_amount(sen):
+    rupiah, sen = divmod(sen, 100)
+    return f"{rupiah:,}".replace(",", ".") + f",{sen:02d}"
+
+
+def _text_width(text):
+    return sum(_DIGIT_WIDTH if ch.isdigit() else _PUNCT_WIDTH for ch in text) * FONT_SIZE / 1000
+
+
+def _uraian(rng, words):
+    return " ".join(rng.choice(URAIAN_WORDS) for _ in range(words))
+
+
+def generate_entries(n_entries, max_taxes=3, ntpn_ratio=0.5, year=2024, seed=0):
+    """
+    Random BKPP entries in parser form (amount strings, running saldo per tax).
+
+    A withholding entry is followed, with probability `ntpn_ratio`, by a
+    deposit entry carrying an NTPN that pays the same amounts.
+    """
+    rng = random.Random(seed)
+    saldo = dict.fromkeys(TAXES, 0)
+    day = date(year, 1, 1)
+    entries = []
+    kwt_number = 0
+    while len(entries) < n_entries:
+        day = min(day + timedelta(days=rng.randint(0, 2)), date(year, 12, 31))
+        kwt_number += 1
+        taxes = rng.sample(TAXES, rng.randint(1, max_taxes))
+        amounts = [rng.randint(1, 5_000_000) * 100 for _ in taxes]
+        batches = [("KWT", amounts, None)]
+        if rng.random() < ntpn_ratio and len(entries) + 1 < n_entries:
+            ntpn = "".join(rng.choice("0123456789ABCDEF") for _ in range(16))
+            batches.append(("STS", amounts, ntpn))
+        for kind, amounts, ntpn in batches:
+            entry = {
+                'date': day.strftime("%d/%m/%Y"),
+                'kwt': f"{kwt_number:04d}/{kind}/05.2001/{year}",
+                'ntpn': ntpn,
+                'uraian': _uraian(rng, rng.randint(3, 12)),
+                'tax': [], 'pemotongan': [], 'penyetoran': [], 'saldo': [],
+            }
+            for tax, amount in zip(taxes, amounts):
+                cut, paid = (0, amount) if ntpn else (amount, 0)
+                saldo[tax] += cut - paid
+                entry['tax'].append(tax)
+                entry['pemotongan'].append(format_amount(cut))
+                entry['penyetoran'].append(format_amount(paid))
+                entry['saldo'].append(format_amount(saldo[tax]))
+            entries.append(entry)
+    return entries[:n_entries]
+
+
+def entry_lines(entry, uraian_width=50, blank_zeros=False):
+    """Table lines for one entry as lists of (column, text); `blank_zeros` leaves 0,00 cells empty."""
+    words = entry['uraian'].split()
+    wrapped, line = [], ""
+    for word in words:
+        if line and len(line) + len(word) + 1 > uraian_width:
+            wrapped.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    wrapped.append(line)
+
+    lines = [[("tanggal", entry['date']), ("bukti", entry['kwt']), ("uraian", wrapped[0])]]
+    lines.extend([("uraian", text)] for text in wrapped[1:])
+    if entry['ntpn']:
+        lines.append([("uraian", f"NTPN : {entry['ntpn']}")])
+    for i, tax in enumerate(entry['tax']):
+        cells = [("uraian", tax)]
+        for column in ("pemotongan", "penyetoran", "saldo"):
+            if not (blank_zeros and entry[column][i] == "0,00"):
+                cells.append((column, entry[column][i]))
+        lines.append(cells)
+    return lines
+
+
+def page_header(page_number, desa="Sukamaju", year=2024):
+    """Report title and table header drawn at the top of every page."""
+    header = [
+        [("uraian", f"BUKU KAS PEMBANTU PAJAK DESA {desa.upper()}")],
+        [("tanggal", "PEMERINTAH DESA"), ("uraian", f"TAHUN ANGGARAN {year}")],
+        [("tanggal", "Tanggal"), ("bukti", "No Bukti"), ("uraian", "Uraian"),
+         ("pemotongan", "Pemotongan"), ("penyetoran", "Penyetoran"), ("saldo", "Saldo")],
+        [("pemotongan", "(Rp)"), ("penyetoran", "(Rp)"), ("saldo", "(Rp)")],
+    ]
+    if page_number > 1:
+        # Later pages only repeat the table header
+        header = header[2:]
+    return header
+
+
+def _pdf_string(text, hex_strings=False):
+    if hex_strings:
+        return "<" + text.encode("latin-1").hex().upper() + ">"
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def _content_stream(lines, footer, line_height, hex_strings=False):
+    ops = []
+    y = TOP_Y
+    for cells in lines:
+        for column, text in cells:
+            if column in AMOUNT_RIGHT:
+                x = AMOUNT_RIGHT[column] - _text_width(text)
+            else:
+                x = COLUMNS[column]
+            ops.append(f"BT /F1 {FONT_SIZE} Tf 1 0 0 1 {x:.2f} {y:.2f} Tm {_pdf_string(text, hex_strings)} Tj ET")
+        y -= line_height
+    if footer:
+        ops.append(f"BT /F1 {FONT_SIZE} Tf 1 0 0 1 {COLUMNS['uraian']} {BOTTOM_Y - 20} Tm {_pdf_string(footer, hex_strings)} Tj ET")
+    return "\n".join(ops).encode("latin-1")
+
+
+def write_pdf(output, pages):
+    """Write `pages` (a list of compressed content streams) as a PDF to a binary file."""
+    n_pages = len(pages)
+    # Object numbers: 1 catalog, 2 pages, 3 font, then page/content pairs
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [" + " ".join(f"{4 + 2 * i} 0 R" for i in range(n_pages))
+         + f"] /Count {n_pages} >>").encode("ascii"),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for i, stream in enumerate(pages):
+        objects.append((
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        ).encode("ascii"))
+        objects.append(
+            f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode("ascii") + stream + b"\nendstream"
+        )
+
+    offsets = []
+    position = output.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    for number, body in enumerate(objects, start=1):
+        offsets.append(position)
+        position += output.write(f"{number} 0 obj\n".encode("ascii") + body + b"\nendobj\n")
+    xref = [f"xref\n0 {len(objects) + 1}\n", "0000000000 65535 f \n"]
+    xref.extend(f"{offset:010d} 00000 n \n" for offset in offsets)
+    output.write("".join(xref).encode("ascii"))
+    output.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{position}\n%%EOF\n".encode("ascii"))
+
+
+def generate_bkpp_pdf(output, pages=10, entries_per_page=12, max_taxes=3, ntpn_ratio=0.5,
+                      header_noise=True, year=2024, seed=0, blank_zeros=False, lines_per_page=None,
+                      hex_strings=False):
+    """
+    Write a synthetic BKPP PDF to `output` (binary file object), return the
+    entries it contains in the same form BkppParser produces.
+
+    Entry lines are spread evenly over `pages`, so entries continue across
+    page breaks. With `header_noise` every page carries the report and table
+    headers plus a page footer; the parser appends the title text to the
+    uraian of the entry open at that point, everything else matches.
+    With `blank_zeros` zero amounts are left out of the PDF, as some
+    Siskeudes versions print them. With `lines_per_page` pages are filled
+    to a fixed line count instead, so a ledger generated with more entries
+    (same seed) keeps the same leading pages, like next month's upload.
+    With `hex_strings` text is written as <hex> strings, like PDFs from
+    report engines that do not use literal strings.
+    """
+    entries = generate_entries(pages * entries_per_page, max_taxes, ntpn_ratio, year, seed)
+    lines = [line for entry in entries for line in entry_lines(entry, blank_zeros=blank_zeros)]
+    per_page = lines_per_page or -(-len(lines) // pages)
+    pages = -(-len(lines) // per_page)
+
+    streams = []
+    for page in range(pages):
+        page_lines = lines[page * per_page:(page + 1) * per_page]
+        footer = ""
+        if header_noise:
+            page_lines = page_header(page + 1, year=year) + page_lines
+            footer = f"Halaman {page + 1} dari {pages}"
+        line_height = min(10.0, (TOP_Y - BOTTOM_Y) / max(len(page_lines), 1))
+        streams.append(zlib.compress(_content_stream(page_lines, footer, line_height, hex_strings)))
+    write_pdf(output, streams)
+    return entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Buat PDF BKPP sintetis untuk benchmark.")
+    parser.add_argument("output", help="File PDF tujuan")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--entries-per-page", type=int, default=12)
+    parser.add_argument("--max-taxes", type=int, default=3, help="Baris pajak maksimum per entri")
+    parser.add_argument("--ntpn-ratio", type=float, default=0.5, help="Peluang entri setoran ber-NTPN")
+    parser.add_argument("--no-header-noise", action="store_true", help="Tanpa judul, header tabel dan footer")
+    parser.add_argument("--blank-zeros", action="store_true", help="Kosongkan sel bernilai 0,00")
+    parser.add_argument("--lines-per-page", type=int, help="Isi halaman dengan jumlah baris tetap")
+    parser.add_argument("--hex-strings", action="store_true", help="Tulis teks sebagai string hex <...>")
+    parser.add_argument("--year", type=int, default=2024)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with open(args.output, "wb") as f:
+        generate_bkpp_pdf(f, args.pages, args.entries_per_page, args.max_taxes, args.ntpn_ratio,
+                          not args.no_header_noise, args.year, args.seed, args.blank_zeros, args.lines_per_page,
+                          args.hex_strings)
+    print(args.output)
+
+
+if __name__ == "__main__":
+    main()
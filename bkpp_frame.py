@@ -0,0 +1,85 @@
+#Columnar conversion of parsed BKPP entries into DataFrames
+from decimal import Decimal
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from tax_taxonomy import classify
+
+ENTRY_COLUMNS = ['date', 'kwt', 'ntpn', 'uraian']
+MONEY_COLUMNS = ['pemotongan', 'penyetoran', 'saldo']
+MONEY_MODES = ('float', 'sen', 'decimal')
+
+
+def parse_amounts(values, money='float'):
+    """
+    Parse Indonesian-formatted amounts ("1.234.567,89") in one pass.
+
+    money='float' gives float64 rupiah, 'sen' gives exact int64 sen and
+    'decimal' gives exact Decimal rupiah.
+    """
+    values = pd.Series(values, dtype=object).str.replace('.', '', regex=False)
+    if money == 'float':
+        return values.str.replace(',', '.', regex=False).astype('float64')
+    if money == 'sen':
+        # value_pattern always captures two decimals, so dropping the comma gives sen
+        return values.str.replace(',', '', regex=False).astype('int64')
+    if money == 'decimal':
+        return pd.Series([Decimal(v) for v in values.str.replace(',', '.', regex=False)], dtype=object)
+    raise ValueError(f"money must be one of {MONEY_MODES}, got {money!r}")
+
+
+def entries_to_frame(entries, money='float'):
+    """
+    Explode parsed entries into one row per tax line.
+
+    Same columns as normalize_entries plus the categorical `tax_code`
+    (see tax_taxonomy), with `date` already converted to datetime and
+    money columns parsed according to `money`.
+    """
+    tax_counts = np.fromiter((len(entry['tax']) for entry in entries), dtype=np.intp, count=len(entries))
+    entry_index = np.repeat(np.arange(len(entries)), tax_counts)
+
+    data = {}
+    for column in ENTRY_COLUMNS:
+        values = np.empty(len(entries), dtype=object)
+        values[:] = [entry[column] for entry in entries]
+        data[column] = values[entry_index]
+    # object dtype even when empty, so .str filters still work
+    data['tax'] = np.array(list(chain.from_iterable(entry['tax'] for entry in entries)), dtype=object)
+    for column in MONEY_COLUMNS:
+        raw = list(chain.from_iterable(entry[column] for entry in entries))
+        data[column] = parse_amounts(raw, money).to_numpy()
+    data['tax_code'] = classify(data['tax']).array
+
+    df = pd.DataFrame(data)
+    df['date'] = pd.to_datetime(df['date'], format='%d/%m/%Y', errors='coerce')
+    return df
+
+
+def to_sen(values):
+    """Money column (float, int sen or Decimal) as exact int64 sen."""
+    if values.dtype == object:
+        return values.map(lambda v: int(v * 100)).astype('int64')
+    if np.issubdtype(values.dtype, np.integer):
+        return values.astype('int64')
+    return (values * 100).round().astype('int64')
+
+
+def summarize(df):
+    """
+    Build the per-tax summary and the monthly pemotongan pivot.
+
+    Sums are taken over integer sen so totals are exact to the cent.
+    """
+    sen = pd.DataFrame({
+        'tax': df['tax'],
+        'month': df['date'].dt.month,
+        'pemotongan': to_sen(df['pemotongan']),
+        'penyetoran': to_sen(df['penyetoran']),
+    })
+    summary = sen.groupby('tax')[['pemotongan', 'penyetoran']].sum().div(100).reset_index()
+    monthly = sen.pivot_table('pemotongan', 'month', 'tax', aggfunc='sum').div(100)
+    monthly.index.name = 'date'
+    return summary, monthly
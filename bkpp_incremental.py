@@ -0,0 +1,349 @@
+#Incremental BKPP extraction: reuse unchanged leading pages of a re-uploaded ledger
+"""
+Operators upload the same year's BKPP again every month, a few pages longer.
+For every page we store a fingerprint, the entries finished on that page and
+a checkpoint of the parser state after it. On the next upload the longest
+run of leading pages with unchanged fingerprints is taken from the store,
+the parser is resumed from the checkpoint of the last reused page and only
+the remaining pages are parsed.
+
+Fingerprints hash the tokenized content streams of a page (and of the
+form XObjects it draws) plus its media box, without interpreting them:
+comparing leading pages costs a fraction of extracting their text. Text
+objects that only draw the "Halaman x dari y" footer, which the parser
+skips as well, are left out, so a growing page count does not invalidate
+every page. A footer whose string bytes are not plain text (CID fonts,
+kerned arrays) stays in the hash; such ledgers are then parsed again in
+full, never reused wrongly.
+
+The store is keyed by the first page's fingerprint: a re-upload can only
+reuse leading pages, so the upload it continues has the same first page.
+Different ledgers of one NPWP (another year, a corrected export) keep
+their own records instead of replacing each other's.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import copy
+import hashlib
+from io import BytesIO
+import math
+import os
+import pickle
+import tempfile
+
+import pdfplumber
+from pdfminer.pdfinterp import PDFContentParser
+from pdfminer.pdftypes import PDFStream, resolve1
+from pdfminer.psparser import PSEOF, PSKeyword, PSLiteral, keyword_name, literal_name
+
+from bkpp_parser import (
+    CHUNKS_PER_WORKER, EXTRACT_MODES, PARALLEL_MIN_PAGES, PARSER_VERSION,
+    BkppParser, feed_page, is_page_footer, merge_continuation, pool_context, pool_source,
+)
+from extract_cache import DEFAULT_MAX_BYTES, evict_lru
+
+
+TEXT_SHOWING_OPERATORS = ('Tj', 'TJ', "'", '"')
+
+
+def _content_operations(streams):
+    """(operator, operands) of content streams, tokenized only."""
+    try:
+        parser = PDFContentParser(streams)
+    except PSEOF:
+        return
+    operands = []
+    while True:
+        try:
+            _, token = parser.nextobject()
+        except PSEOF:
+            return
+        if isinstance(token, PSKeyword):
+            yield keyword_name(token), operands
+            operands = []
+        else:
+            operands.append(token)
+
+
+def _shown_text(operator, operands):
+    if not operands:
+        return b''
+    strings = operands[-1] if operator == 'TJ' and isinstance(operands[-1], list) else [operands[-1]]
+    return b''.join(string for string in strings if isinstance(string, bytes))
+
+
+def _hash_content(digest, streams, resources, seen):
+    text_object = None
+    for operator, operands in _content_operations(streams):
+        operation = f"{operands!r} {operator}\n".encode('utf-8', 'backslashreplace')
+        if operator == 'BT':
+            text_object, shown = [operation], []
+        elif text_object is not None:
+            text_object.append(operation)
+            if operator in TEXT_SHOWING_OPERATORS:
+                shown.append(_shown_text(operator, operands))
+            elif operator == 'ET':
+                if not is_page_footer(b''.join(shown).decode('latin-1')):
+                    digest.update(b''.join(text_object))
+                text_object = None
+        else:
+            digest.update(operation)
+            if operator == 'Do' and operands and isinstance(operands[-1], PSLiteral):
+                xobjects = resolve1((resources or {}).get('XObject')) or {}
+                xobject = resolve1(xobjects.get(literal_name(operands[-1])))
+                if (isinstance(xobject, PDFStream) and xobject.objid not in seen
+                        and literal_name(xobject.get('Subtype')) == 'Form'):
+                    seen.add(xobject.objid)
+                    _hash_content(digest, [xobject], resolve1(xobject.get('Resources')) or resources, seen)
+    if text_object is not None:
+        digest.update(b''.join(text_object))
+
+
+def page_fingerprint(page):
+    """Hash of a pdfplumber page's content streams and media box, without page footers."""
+    page_obj = page.page_obj
+    digest = hashlib.sha256(repr(tuple(page_obj.mediabox)).encode())
+    _hash_content(digest, list(page_obj.contents), page_obj.resources, set())
+    return digest.hexdigest()
+
+
+# ======================
+# Parser checkpoints
+# ======================
+def snapshot(parser, layouts=None):
+    return {
+        'head': copy.deepcopy(parser.head),
+        'current': copy.deepcopy(parser.current),
+        'lines': parser.lines,
+        # Table layouts detected so far (layout mode), reused on resume
+        'layouts': dict(layouts) if layouts is not None else None,
+    }
+
+
+def restore(state):
+    parser = BkppParser()
+    if state is not None:
+        parser.head = copy.deepcopy(state['head'])
+        parser.current = copy.deepcopy(state['current'])
+        parser.lines = state['lines']
+    return parser
+
+
+def _parse_page_records(source, start, stop, mode='text', state=None, progress_callback=None):
+    """
+    Parse pages [start, stop) starting from checkpoint `state` (None for a
+    fresh parser). Returns one record per page: its fingerprint, the entries
+    finished on it, the parser state after it and, for a fresh parser, the
+    head it closed.
+    """
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    layouts = None
+    if mode == 'layout':
+        layouts = dict(state['layouts'] or {}) if state else {}
+    parser = restore(state)
+    records = []
+    with pdfplumber.open(source) as pdf:
+        for i, page in enumerate(pdf.pages[start:stop], start=start):
+            head_before = parser.head
+            entries = feed_page(parser, page, layouts)
+            fingerprint = page_fingerprint(page)
+            page.close()
+            records.append({
+                'fingerprint': fingerprint,
+                'entries': entries,
+                'state': snapshot(parser, layouts),
+                'closed_head': copy.deepcopy(parser.head) if parser.head is not head_before else None,
+            })
+            if progress_callback:
+                progress_callback(i + 1, len(entries))
+    return records
+
+
+def rebase_records(records, previous_state):
+    """
+    Turn records parsed with a fresh parser into records of the whole
+    document, given the parser state after the previous page range. Until
+    the range's first entry starts, its lines continue the entry that was
+    open at the end of the previous range.
+    """
+    open_entry = previous_state['current']
+    head = previous_state['head']
+    continuing = True
+    for record in records:
+        state = record['state']
+        if continuing:
+            closed_head = record['closed_head']
+            if closed_head is not None:
+                continuing = False
+                entry = copy.deepcopy(open_entry)
+                merge_continuation(entry, closed_head)
+                if entry['date'] is None:
+                    # No entry had started yet: this is still the report header
+                    head = entry
+                else:
+                    record['entries'].insert(0, entry)
+            else:
+                entry = copy.deepcopy(open_entry)
+                merge_continuation(entry, state['current'])
+                state['current'] = entry
+        state['head'] = copy.deepcopy(head)
+        state['lines'] += previous_state['lines']
+    return records
+
+
+def _parse_tail(source, start, total_pages, mode, state, workers, progress_callback):
+    """
+    Page records for pages [start, total_pages), resumed from `state`.
+    `progress_callback(pages_done, new_entries)` is called per page, or per
+    chunk of pages with a process pool.
+    """
+    remaining = total_pages - start
+    if workers <= 1 or remaining < PARALLEL_MIN_PAGES:
+        return _parse_page_records(source, start, total_pages, mode, state, progress_callback)
+
+    with pool_source(source) as pdf_path:
+        return _parse_tail_parallel(pdf_path, start, total_pages, mode, state, workers, progress_callback)
+
+
+def _parse_tail_parallel(source, start, total_pages, mode, state, workers, progress_callback):
+    remaining = total_pages - start
+    chunk_size = max(1, math.ceil(remaining / (workers * CHUNKS_PER_WORKER)))
+    ranges = [(s, min(s + chunk_size, total_pages)) for s in range(start, total_pages, chunk_size)]
+    results = [None] * len(ranges)
+    pages_done = start
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) as executor:
+        futures = {
+            # Only the first range continues from the checkpoint; the rest are rebased below
+            executor.submit(_parse_page_records, source, s, e, mode, state if index == 0 else None): index
+            for index, (s, e) in enumerate(ranges)
+        }
+        try:
+            for future in as_completed(futures):
+                index = futures[future]
+                results[index] = future.result()
+                s, e = ranges[index]
+                pages_done += e - s
+                if progress_callback:
+                    progress_callback(pages_done, sum(len(record['entries']) for record in results[index]))
+        except BaseException:
+            # E.g. a cancelled job (the callback raised): drop the chunks not started yet
+            executor.shutdown(cancel_futures=True)
+            raise
+
+    records = list(results[0])
+    for chunk in results[1:]:
+        records.extend(rebase_records(chunk, records[-1]['state']))
+    return records
+
+
+# ======================
+# Store
+# ======================
+class IncrementalStore:
+    """
+    Page records of the last extraction per document key and mode, one
+    pickle file each. The least recently used files are evicted once the
+    directory grows past `max_bytes`.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, mode):
+        name = hashlib.sha256(f"{key}\0{mode}".encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.pkl")
+
+    def load(self, key, mode):
+        try:
+            with open(self._path(key, mode), "rb") as f:
+                record = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if record.get('version') != PARSER_VERSION:
+            return None
+        try:
+            os.utime(self._path(key, mode))
+        except OSError:
+            pass
+        return record
+
+    def save(self, key, mode, pages):
+        record = {'version': PARSER_VERSION, 'mode': mode, 'pages': pages}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key, mode))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        evict_lru(self.directory, self.max_bytes)
+
+
+def extract_incremental(source, store, mode='text', workers=1, progress_callback=None, stats=None):
+    """
+    Like bkpp_parser.extract_entries, reusing the leading pages stored for
+    the same document whose fingerprints are unchanged. The new page
+    records are saved back.
+    `stats` additionally receives `reused_pages`, and is
+    kept up to date while pages are parsed (`pages`, `pages_done`,
+    `entries_found`), so another thread can read it for progress. An
+    exception raised by `progress_callback` aborts the extraction without
+    saving anything.
+    """
+    if stats is None:
+        stats = {}
+    if mode not in EXTRACT_MODES:
+        raise ValueError(f"mode must be one of {EXTRACT_MODES}, got {mode!r}")
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    old_pages = []
+    reused = 0
+    with pdfplumber.open(source) as pdf:
+        total_pages = len(pdf.pages)
+        stats.update(pages=total_pages, pages_done=0, entries_found=0)
+        if not total_pages:
+            stats.update(lines=0, reused_pages=0)
+            return []
+        key = page_fingerprint(pdf.pages[0])
+        stored = store.load(key, mode)
+        if stored:
+            old_pages = stored['pages']
+            # Only the leading pages can be reused, so stop at the first change
+            while (reused < min(len(old_pages), total_pages)
+                   and old_pages[reused]['fingerprint'] == page_fingerprint(pdf.pages[reused])):
+                pdf.pages[reused].close()
+                reused += 1
+
+    def on_pages(pages_done, new_entries):
+        stats['pages_done'] = pages_done
+        stats['entries_found'] += new_entries
+        if progress_callback:
+            progress_callback(pages_done, total_pages)
+
+    if reused:
+        on_pages(reused, sum(len(record['entries']) for record in old_pages[:reused]))
+
+    state = old_pages[reused - 1]['state'] if reused else None
+    records = old_pages[:reused]
+    if reused < total_pages:
+        tail = _parse_tail(source, reused, total_pages, mode, state, workers, on_pages)
+        for record in tail:
+            record.pop('closed_head', None)
+        records = records + tail
+    store.save(key, mode, records)
+
+    # Reused records hold only the entries finished on reused pages; the one
+    # still open lives in the checkpoint the tail was resumed from
+    reused_entries = [entry for record in records[:reused] for entry in record['entries']]
+    parsed_entries = [entry for record in records[reused:] for entry in record['entries']]
+    final_state = records[-1]['state']
+    last = restore(final_state).finish()
+    if last:
+        parsed_entries.append(last)
+
+    stats.update(lines=final_state['lines'], reused_pages=reused)
+    # Copies, so callers can modify entries without touching the stored records
+    return copy.deepcopy(reused_entries) + parsed_entries
@@ -0,0 +1,157 @@
+#Read BKPP table rows from word coordinates instead of page text
+"""
+The amount columns (Pemotongan, Penyetoran, Saldo) are right-aligned, so
+an amount's right edge lies past the centre of its own column header and
+before the centre of the next one. Header positions and the footer band
+are detected on the first page of each layout and cached by page size,
+the header band of continuation pages (the repeated table header without
+the report title) on the second. Later pages with the same size are
+cropped to the table between the two bands before their words are read.
+"""
+from collections import namedtuple
+import re
+
+AMOUNT_RE = re.compile(r'\d{1,3}(?:\.\d{3})*,\d{2}')
+AMOUNT_HEADERS = ('Pemotongan', 'Penyetoran', 'Saldo')
+FOOTER_RE = re.compile(r'Halaman\b')
+# The "(Rp)" row under the amount headers
+UNIT_RE = re.compile(r'\(?Rp\)?')
+
+# Words whose tops differ by at most this many points share a line
+LINE_TOLERANCE = 3
+# Slack when comparing an amount's right edge with a header centre
+ANCHOR_TOLERANCE = 2
+# Footer lines are looked for in the bottom part of the page only
+FOOTER_BAND = 0.8
+
+# anchors: horizontal centres of the Pemotongan, Penyetoran and Saldo headers
+# footer_top: page y where the footer band starts (page height when none)
+# table_top: page y where the header band of continuation pages ends, 0 when
+#   they repeat no header, None until a continuation page was seen
+TableLayout = namedtuple('TableLayout', ['anchors', 'footer_top', 'table_top'], defaults=(None,))
+
+
+def layout_signature(page):
+    return (round(float(page.width)), round(float(page.height)))
+
+
+def group_lines(words):
+    """Group pdfplumber words into lines (lists of words ordered by x)."""
+    lines = []
+    current = []
+    line_top = None
+    for word in sorted(words, key=lambda w: (w['top'], w['x0'])):
+        if current and word['top'] - line_top > LINE_TOLERANCE:
+            lines.append(sorted(current, key=lambda w: w['x0']))
+            current = []
+        if not current:
+            line_top = word['top']
+        current.append(word)
+    if current:
+        lines.append(sorted(current, key=lambda w: w['x0']))
+    return lines
+
+
+def header_anchors(line):
+    """Centres of the amount headers if `line` is the table header row."""
+    found = {}
+    for word in line:
+        if word['text'] in AMOUNT_HEADERS:
+            found.setdefault(word['text'], (float(word['x0']) + float(word['x1'])) / 2)
+    if len(found) != len(AMOUNT_HEADERS):
+        return None
+    return tuple(found[name] for name in AMOUNT_HEADERS)
+
+
+def header_band(lines):
+    """
+    (index of the first line, page y) below the table header row and its
+    unit row, or None when `lines` hold no table header.
+    """
+    for i, line in enumerate(lines):
+        if header_anchors(line):
+            end = i + 1
+            while end < len(lines) and all(UNIT_RE.fullmatch(word['text']) for word in lines[end]):
+                end += 1
+            bottom = max(float(word['bottom']) for word in lines[end - 1])
+            if end < len(lines):
+                # Halfway to the first table line, so small offsets between pages do not cut it
+                bottom = (bottom + min(float(word['top']) for word in lines[end])) / 2
+            return end, bottom
+    return None
+
+
+def detect_layout(lines, page_height):
+    """TableLayout for a page's lines, or None when there is no table header."""
+    anchors = None
+    for line in lines:
+        anchors = header_anchors(line)
+        if anchors:
+            break
+    if anchors is None:
+        return None
+    footer_top = float(page_height)
+    for line in lines:
+        if line[0]['top'] > page_height * FOOTER_BAND and FOOTER_RE.match(line[0]['text']):
+            footer_top = min(footer_top, float(line[0]['top']) - 1)
+    return TableLayout(anchors, footer_top, None)
+
+
+def column_of(x1, anchors):
+    """Index of the amount column for a word ending at `x1`, or None."""
+    column = None
+    for i, anchor in enumerate(anchors):
+        if anchor <= x1 + ANCHOR_TOLERANCE:
+            column = i
+    return column
+
+
+def table_rows(lines, layout):
+    """
+    (text, values) per table line below the header band. `values` holds the
+    (pemotongan, penyetoran, saldo) strings, None where the cell is empty.
+    """
+    band = header_band(lines)
+    # Skip the report title and table header above the data
+    start = band[0] if band else 0
+    rows = []
+    for line in lines[start:]:
+        if line[0]['top'] >= layout.footer_top:
+            break
+        values = [None] * len(AMOUNT_HEADERS)
+        text = []
+        for word in line:
+            if AMOUNT_RE.fullmatch(word['text']):
+                column = column_of(float(word['x1']), layout.anchors)
+                if column is not None and values[column] is None:
+                    values[column] = word['text']
+                    continue
+            text.append(word['text'])
+        rows.append((' '.join(text), tuple(values)))
+    return rows
+
+
+def page_rows(page, layouts):
+    """
+    Table rows of a pdfplumber page, or None when no layout is known for
+    its size and none can be detected. `layouts` maps layout signatures to
+    TableLayout and is filled in as new layouts are seen.
+    """
+    signature = layout_signature(page)
+    layout = layouts.get(signature)
+    if layout is None:
+        lines = group_lines(page.extract_words())
+        layout = detect_layout(lines, page.height)
+        if layout is None:
+            return None
+        layouts[signature] = layout
+        return table_rows(lines, layout)
+    top = layout.table_top or 0
+    if top > 0 or layout.footer_top < page.height:
+        page = page.crop((0, top, page.width, layout.footer_top))
+    lines = group_lines(page.extract_words())
+    if layout.table_top is None:
+        # First continuation page: find where its table starts, for the pages after it
+        band = header_band(lines)
+        layouts[signature] = layout._replace(table_top=band[1] if band else 0)
+    return table_rows(lines, layout)
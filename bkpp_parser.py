@@ -0,0 +1,344 @@
+#Parse BKPP (Buku Kas Pembantu Pajak) PDF from Siskeudes
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from io import BytesIO
+import math
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+
+import pdfplumber
+
+from bkpp_layout import page_rows
+from tax_taxonomy import tax_pattern
+
+# Bump when parsing output changes so cached results are invalidated
+PARSER_VERSION = "4"
+
+# ======================
+# Regex patterns (compiled once per process)
+# ======================
+date_pattern = re.compile(r'(\d{2}/\d{2}/\d{4})')
+kwt_pattern = re.compile(r'(\d{4,5}\/[A-Z]{3}\/\d{2}\.\d{4}\/\d{4})')
+ntpn_pattern = re.compile(r'NTPN\s*:\s*([A-Z0-9]+)')
+# tax_pattern is built from the tax_taxonomy table
+value_pattern = re.compile(r'\d{1,3}(?:\.\d{3})*(?:,\d{2})')
+page_footer_pattern = re.compile(r'\s*Halaman\s+\d+\s+dari\s+\d+\s*')
+
+# Documents shorter than this are parsed in-process even when workers > 1
+PARALLEL_MIN_PAGES = 40
+CHUNKS_PER_WORKER = 4
+
+# 'text' parses page text with regex; 'layout' reads amounts by column position
+EXTRACT_MODES = ('text', 'layout')
+
+
+def new_entry(date):
+    return {
+        'date': date,
+        'kwt': None,
+        'ntpn': None,
+        'uraian': '',
+        'tax': [],
+        'pemotongan': [],
+        'penyetoran': [],
+        'saldo': []
+    }
+
+
+def is_page_footer(line):
+    return page_footer_pattern.fullmatch(line) is not None
+
+
+def is_header_fragment(line):
+    return (("Pemotongan" in line and "Penyetoran" in line) or "Uraian" in line or "Rp" in line
+            or is_page_footer(line))
+
+
+class BkppParser:
+    """
+    Line-by-line state machine for BKPP text.
+
+    A new entry starts on a line holding both a date and a kwitansi number;
+    following lines add NTPN, tax lines and uraian to it until the next
+    entry starts. Lines seen before the first entry are kept in `head`.
+    """
+
+    def __init__(self):
+        self.head = None
+        self.current = new_entry(None)
+        self.lines = 0
+
+    def _close_current(self):
+        if self.current['date'] is None:
+            self.head = self.current
+            return None
+        return self.current
+
+    def feed_line(self, line, values=None):
+        """
+        Feed one text line, return the entry it finished (or None).
+
+        `values` optionally gives the (pemotongan, penyetoran, saldo) read
+        from column positions, None for empty cells; without it the amounts
+        are taken from the line text in order.
+        """
+        finished = None
+        self.lines += 1
+        date_match = date_pattern.search(line)
+        kwt_match = kwt_pattern.search(line)
+        ntpn_match = ntpn_pattern.search(line)
+        tax_match = tax_pattern.search(line)
+        if values is None:
+            value_match = value_pattern.findall(line)
+            # Ensure there are at least 3 numeric values (pemotongan, penyetoran, saldo)
+            amounts = value_match if len(value_match) >= 3 else None
+        else:
+            value_match = [value for value in values if value]
+            amounts = [value or '0,00' for value in values] if value_match else None
+
+        if date_match and kwt_match:
+            finished = self._close_current()
+            self.current = new_entry(date_match.group(1))
+
+        current_entry = self.current
+        if kwt_match:
+            current_entry['kwt'] = kwt_match.group(1)
+        if ntpn_match:
+            current_entry['ntpn'] = ntpn_match.group(1)
+        if tax_match and amounts:
+            current_entry['tax'].append(tax_match.group(1).strip())
+            current_entry['pemotongan'].append(amounts[0])
+            current_entry['penyetoran'].append(amounts[1])
+            current_entry['saldo'].append(amounts[2])
+        if not (date_match or kwt_match or ntpn_match or tax_match or value_match):
+            # Skip repeated table header fragments
+            if not is_header_fragment(line):
+                current_entry['uraian'] += line + ' '
+        return finished
+
+    def feed_text(self, text):
+        """Feed a page of text, return the list of entries it finished."""
+        finished = []
+        for line in (text or '').split('\n'):
+            entry = self.feed_line(line)
+            if entry:
+                finished.append(entry)
+        return finished
+
+    def feed_rows(self, rows):
+        """Feed (text, values) table rows, return the list of entries they finished."""
+        finished = []
+        for line, values in rows:
+            entry = self.feed_line(line, values)
+            if entry:
+                finished.append(entry)
+        return finished
+
+    def finish(self):
+        """Close the entry still open at the end of the document."""
+        entry = self._close_current()
+        self.current = new_entry(None)
+        return entry
+
+
+# ======================
+# Page streaming API
+# ======================
+def feed_page(parser, page, layouts=None):
+    """
+    Feed one pdfplumber page, return the entries it finished. With a
+    `layouts` dict (see bkpp_layout.page_rows) amounts are assigned to
+    columns by position; pages without a detectable table fall back to text.
+    """
+    if layouts is not None:
+        rows = page_rows(page, layouts)
+        if rows is not None:
+            return parser.feed_rows(rows)
+    return parser.feed_text(page.extract_text())
+
+
+def _check_mode(mode):
+    if mode not in EXTRACT_MODES:
+        raise ValueError(f"mode must be one of {EXTRACT_MODES}, got {mode!r}")
+    return {} if mode == 'layout' else None
+
+
+def iter_page_entries(pdf, parser=None, mode='text'):
+    """
+    Yields (page_index, entries) for every page of an opened pdfplumber PDF.
+
+    `entries` holds the BKPP entries finished on that page; the entry still
+    open after the last page is yielded together with the last page.
+    """
+    layouts = _check_mode(mode)
+    if parser is None:
+        parser = BkppParser()
+    pages = pdf.pages
+    last_index = len(pages) - 1
+    for i, page in enumerate(pages):
+        entries = feed_page(parser, page, layouts)
+        page.close()
+        if i == last_index:
+            tail = parser.finish()
+            if tail:
+                entries.append(tail)
+        yield i, entries
+
+
+def extract_entries(source, workers=1, progress_callback=None, mode='text', stats=None):
+    """
+    Parse a BKPP PDF (path, bytes or file-like object) into a list of entries.
+
+    With `workers` > 1 and at least PARALLEL_MIN_PAGES pages, the page range
+    is split across a process pool. `progress_callback(pages_done, total_pages)`
+    is called as pages finish. `mode` is one of EXTRACT_MODES. When `stats`
+    is a dict, the page and text line counts are stored in it.
+    """
+    _check_mode(mode)
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    extracted_data = []
+    with pdfplumber.open(source) as pdf:
+        total_pages = len(pdf.pages)
+        if not (workers > 1 and total_pages >= PARALLEL_MIN_PAGES):
+            parser = BkppParser()
+            for i, entries in iter_page_entries(pdf, parser, mode=mode):
+                extracted_data.extend(entries)
+                if progress_callback:
+                    progress_callback(i + 1, total_pages)
+            if stats is not None:
+                stats.update(pages=total_pages, lines=parser.lines)
+            return extracted_data
+    with pool_source(source) as pdf_path:
+        return _extract_parallel(pdf_path, total_pages, workers, progress_callback, mode, stats)
+
+
+# ======================
+# Parallel extraction
+# ======================
+
+def pool_context():
+    """
+    Start method for worker pools. Pools are started from threads (Streamlit
+    script runs, extraction jobs), and forking a threaded process can copy
+    held locks into the child; forkserver (spawn where unavailable) does not.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+@contextmanager
+def pool_source(source):
+    """
+    A path worker processes can reopen the PDF from. Bytes and file
+    objects are written to a temporary file once, instead of pickling the
+    whole PDF into every chunk task.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        yield source
+        return
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if isinstance(source, bytes):
+                f.write(source)
+            else:
+                source.seek(0)
+                shutil.copyfileobj(source, f)
+        yield path
+    finally:
+        os.unlink(path)
+
+
+def _parse_page_range(source, start, stop, mode='text'):
+    """Parse pages [start, stop) with a fresh parser, return (head, entries, lines)."""
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    layouts = _check_mode(mode)
+    parser = BkppParser()
+    entries = []
+    with pdfplumber.open(source) as pdf:
+        for page in pdf.pages[start:stop]:
+            entries.extend(feed_page(parser, page, layouts))
+            page.close()
+    tail = parser.finish()
+    if tail:
+        entries.append(tail)
+    return parser.head, entries, parser.lines
+
+
+def merge_continuation(entry, head):
+    """
+    Apply the lines a page chunk saw before its first entry (`head`) to the
+    entry that was still open at the end of the previous chunk.
+    """
+    if head['kwt']:
+        entry['kwt'] = head['kwt']
+    if head['ntpn']:
+        entry['ntpn'] = head['ntpn']
+    entry['uraian'] += head['uraian']
+    for key in ('tax', 'pemotongan', 'penyetoran', 'saldo'):
+        entry[key].extend(head[key])
+
+
+def merge_chunks(chunks):
+    """Merge ordered (head, entries) chunk results into one entry list."""
+    extracted_data = []
+    for head, entries in chunks:
+        # The first chunk's head is the report header before any entry
+        if extracted_data and head:
+            merge_continuation(extracted_data[-1], head)
+        extracted_data.extend(entries)
+    return extracted_data
+
+
+def _extract_parallel(source, total_pages, workers, progress_callback=None, mode='text', stats=None):
+    chunk_size = max(1, math.ceil(total_pages / (workers * CHUNKS_PER_WORKER)))
+    ranges = [(start, min(start + chunk_size, total_pages)) for start in range(0, total_pages, chunk_size)]
+    results = [None] * len(ranges)
+    pages_done = 0
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) as executor:
+        futures = {
+            executor.submit(_parse_page_range, source, start, stop, mode): index
+            for index, (start, stop) in enumerate(ranges)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            results[index] = future.result()
+            start, stop = ranges[index]
+            pages_done += stop - start
+            if progress_callback:
+                progress_callback(pages_done, total_pages)
+    if stats is not None:
+        stats.update(pages=total_pages, lines=sum(lines for _, _, lines in results))
+    return merge_chunks((head, entries) for head, entries, _ in results)
+
+
+# ======================
+# Helper: Normalize Entries
+# ======================
+def normalize_entries(data):
+    normalized_entries = []
+
+    for entry in data:
+        pemotongan = [float(value.replace('.', '').replace(',', '.')) for value in entry['pemotongan']]
+        penyetoran = [float(value.replace('.', '').replace(',', '.')) for value in entry['penyetoran']]
+        saldo = [float(value.replace('.', '').replace(',', '.')) for value in entry['saldo']]
+
+        for i in range(len(entry['tax'])):
+            normalized_entry = {
+                'date': entry['date'],
+                'kwt': entry['kwt'],
+                'ntpn': entry['ntpn'],
+                'uraian': entry['uraian'],
+                'tax': entry['tax'][i],
+                'pemotongan': pemotongan[i],
+                'penyetoran': penyetoran[i],
+                'saldo': saldo[i]
+            }
+            normalized_entries.append(normalized_entry)
+
+    return normalized_entries
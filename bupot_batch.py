@@ -0,0 +1,110 @@
+#Convert many filled Bupot workbooks to Coretax XML in a process pool, zipped
+"""
+Workbooks are read in worker processes (openpyxl parsing is CPU bound);
+each worker writes the XML row elements of one workbook to a file in a
+shared directory and returns its path, TIN and row count, so no row data
+travels back through the pool. The main process then assembles the XML
+documents from those files straight into a ZIP archive, one per workbook
+or, with `merge_by_tin`, one per TIN holding the rows of all workbooks
+with that TIN in upload order.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+import os
+import posixpath
+import tempfile
+import zipfile
+
+from bkpp_parser import pool_context
+from bupot_xml import SPOOL_MAX_BYTES, write_bulk_parts, write_workbook_rows
+
+# Fewer files than this are read in-process, a pool costs more than it saves
+POOL_MIN_FILES = 3
+
+
+def convert_workbook(name, data, type_spt, directory):
+    """
+    Result dict for one uploaded workbook (`data` is its bytes): its TIN,
+    row count and the `path` of its row elements in `directory`. Errors
+    are reported, not raised.
+    """
+    result = {"name": name, "tin": None, "rows": 0, "path": None, "error": None}
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".xml.part")
+    try:
+        with os.fdopen(fd, "wb") as output:
+            result["tin"], result["rows"] = write_workbook_rows(BytesIO(data), type_spt, output)
+        result["path"] = path
+    except KeyError as e:
+        result["error"] = f"sheet tidak ditemukan: {e}"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    if result["error"] is not None:
+        os.unlink(path)
+    return result
+
+
+def convert_workbooks(files, type_spt, directory, workers=None, progress_callback=None):
+    """
+    Convert (name, bytes) workbooks into `directory`, return their result
+    dicts in input order. `progress_callback(done, total, result)` is
+    called as each one finishes.
+    """
+    files = list(files)
+    workers = workers or os.cpu_count() or 1
+    results = [None] * len(files)
+    if workers <= 1 or len(files) < POOL_MIN_FILES:
+        for index, (name, data) in enumerate(files):
+            results[index] = convert_workbook(name, data, type_spt, directory)
+            if progress_callback:
+                progress_callback(index + 1, len(files), results[index])
+        return results
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(files)), mp_context=pool_context()) as executor:
+        futures = {
+            executor.submit(convert_workbook, name, data, type_spt, directory): index
+            for index, (name, data) in enumerate(files)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            results[index] = future.result()
+            if progress_callback:
+                progress_callback(done, len(files), results[index])
+    return results
+
+
+def _unique(name, used):
+    stem, ext = posixpath.splitext(name)
+    candidate, n = name, 1
+    while candidate in used:
+        n += 1
+        candidate = f"{stem} ({n}){ext}"
+    used.add(candidate)
+    return candidate
+
+
+def xml_documents(results, type_spt, merge_by_tin=False):
+    """(archive name, TIN, parts) per XML document for the converted workbooks; see write_bulk_parts."""
+    ok = [result for result in results if result["error"] is None]
+    if not merge_by_tin:
+        return [(f"{posixpath.splitext(r['name'])[0]}.xml", r["tin"], [(r["path"], r["rows"])]) for r in ok]
+    by_tin = {}
+    for result in ok:
+        by_tin.setdefault(result["tin"], []).append((result["path"], result["rows"]))
+    return [(f"{type_spt}_{tin}.xml", tin, parts) for tin, parts in by_tin.items()]
+
+
+def write_zip(output, results, type_spt, merge_by_tin=False):
+    """Write the XML documents for `results` into a ZIP archive on `output`."""
+    used = set()
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, tin, parts in xml_documents(results, type_spt, merge_by_tin):
+            with archive.open(_unique(name, used), "w") as member:
+                write_bulk_parts(member, type_spt, tin, parts)
+
+
+def results_to_zip(results, type_spt, merge_by_tin=False):
+    """Like write_zip, return a file object positioned at 0."""
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    write_zip(output, results, type_spt, merge_by_tin)
+    output.seek(0)
+    return output
@@ -0,0 +1,148 @@
+#Fill Bukti Potong (Bupot) Excel templates from extracted BKPP rows
+from io import BytesIO
+import os
+
+import numpy as np
+import pandas as pd
+
+from tax_taxonomy import FAMILY_21, FAMILY_UNIFIKASI, family_codes, lookup, tax_codes
+from xlsx_template import Formula, load_template
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SPT_21 = "SPT PPh 21"
+SPT_UNIFIKASI = "SPT PPh Unifikasi (PPh Pasal 22, PPh Pasal 23, dan PPh Pasal 4 ayat (2))"
+JENIS_SPT = [SPT_21, SPT_UNIFIKASI]
+
+TEMPLATE_PATHS = {
+    SPT_21: os.path.join(BASE_DIR, "BP21 Excel to XML v.4.xlsx"),
+    SPT_UNIFIKASI: os.path.join(BASE_DIR, "BPPU Excel to XML v.3.xlsx"),
+}
+
+TEMPLATE_NAMES = {
+    SPT_21: "Bupot 21",
+    SPT_UNIFIKASI: "Bupot Unifikasi",
+}
+
+# XML document type produced from each template, also its tax_taxonomy family
+SPT_TYPES = {
+    SPT_21: FAMILY_21,
+    SPT_UNIFIKASI: FAMILY_UNIFIKASI,
+}
+
+
+def filter_bupot(df, masa, jenis_spt):
+    """Select rows for one masa (0 = semua masa) and one jenis SPT."""
+    df = df.copy()
+    df["date"] = pd.to_datetime(df["date"], format="%d/%m/%Y", errors="coerce")
+    df = df.dropna(subset=["date"])
+
+    # Filter Data
+    if masa == 0:
+        df_filtered = df
+    else:
+        df_filtered = df[df['date'].dt.month == masa]
+    df_filtered = df_filtered[df_filtered['pemotongan'] > 0]
+    # Filter berdasarkan jenis SPT
+    df_filtered = df_filtered[tax_codes(df_filtered).isin(family_codes(SPT_TYPES[jenis_spt]))]
+
+    return df_filtered.reset_index(drop=True)
+
+
+# ======================
+# Template column spec
+# ======================
+# (column, kind, arg): "field" reads a column of template_fields(),
+# "value" writes a constant, "formula" writes a per-row formula.
+TEMPLATE_COLUMNS = {
+    SPT_21: [
+        ("B", "field", "month"),
+        ("C", "field", "year"),
+        ("D", "value", "0000000000000000"),
+        ("E", "formula", '=D{row} & "000000"'),
+        ("F", "value", "K/0"),
+        ("G", "value", "N/A"),
+        ("H", "field", "object_code"),
+        ("I", "field", "gross"),
+        ("J", "value", 100),
+        ("K", "field", "rate"),
+        ("L", "value", "PaymentProof"),
+        ("M", "field", "kwt"),
+        ("N", "field", "date_str"),
+        ("O", "field", "tku"),
+        ("P", "field", "date_str"),
+    ],
+    SPT_UNIFIKASI: [
+        ("B", "field", "month"),
+        ("C", "field", "year"),
+        ("D", "value", "0000000000000000"),
+        ("E", "formula", '=D{row} & "000000"'),
+        ("F", "value", "N/A"),
+        ("G", "field", "object_code"),
+        ("H", "field", "gross"),
+        ("I", "field", "rate"),
+        ("J", "value", "PaymentProof"),
+        ("K", "field", "kwt"),
+        ("L", "field", "date_str"),
+        ("M", "field", "tku"),
+        ("N", "value", "Imprest"),
+        ("P", "field", "date_str"),
+    ],
+}
+
+sheet_name = "DATA"
+TIN_cell = "C1"
+start_row = 4
+
+
+def template_fields(df_filtered, npwp, jenis_spt):
+    """Per-row values referenced by TEMPLATE_COLUMNS, computed column-wise."""
+    dates = df_filtered['date']
+    fields = {
+        "month": dates.dt.month,
+        "year": dates.dt.year,
+        "date_str": dates.dt.strftime("%Y-%m-%d"),
+        "kwt": df_filtered['kwt'],
+        "tku": f'{npwp}000000',
+    }
+    codes = tax_codes(df_filtered)
+    fields["object_code"] = pd.Series(lookup(codes, "object_code", ""), index=df_filtered.index)
+    # Keep the tarif as written (5, 1.5, 2, 10) rather than as floats
+    fields["rate"] = pd.Series(lookup(codes, "rate", ""), index=df_filtered.index)
+    fractions = lookup(codes, "rate", np.nan).astype("float64") / 100
+    fields["gross"] = df_filtered['pemotongan'] / fractions
+    return fields
+
+
+def template_columns(df_filtered, npwp, jenis_spt):
+    """Resolve TEMPLATE_COLUMNS into (column, values) pairs for the filler."""
+    fields = template_fields(df_filtered, npwp, jenis_spt)
+    columns = []
+    for col, kind, arg in TEMPLATE_COLUMNS[jenis_spt]:
+        if kind == "field":
+            columns.append((col, fields[arg]))
+        elif kind == "formula":
+            columns.append((col, Formula(arg)))
+        else:
+            columns.append((col, arg))
+    return columns
+
+
+def preload_templates():
+    """Parse every Bupot template into the process-wide template cache."""
+    for jenis_spt in JENIS_SPT:
+        load_template(TEMPLATE_PATHS[jenis_spt], sheet_name, start_row)
+
+
+def fill_template(df_filtered, npwp, jenis_spt):
+    """Write filtered rows into the Bupot template, return the workbook as BytesIO."""
+    template = load_template(TEMPLATE_PATHS[jenis_spt], sheet_name, start_row)
+    output = BytesIO()
+    template.fill(
+        output,
+        template_columns(df_filtered, npwp, jenis_spt),
+        len(df_filtered),
+        header_values={TIN_cell: npwp},
+    )
+    output.seek(0)
+    return output
@@ -0,0 +1,257 @@
+#Convert Bupot Excel template (or filtered BKPP rows directly) to Coretax XML
+from collections import ChainMap
+from itertools import chain
+from numbers import Number
+import shutil
+import tempfile
+
+from bupot_excel import SPT_TYPES, template_columns
+from excel_formula import A1_REF_RE, FormulaError, FormulaEvaluator, column_index, to_text
+from xlsx_template import Formula, _is_blank, _is_sequence, _number, col_index
+
+sheet_name = "DATA"
+TIN_cell = "C1"
+start_row = 4
+
+# XML field tags in order for columns B → P
+xml_tags_21 = [
+    "TaxPeriodMonth", "TaxPeriodYear", "CounterpartTin",
+    "IDPlaceOfBusinessActivityOfIncomeRecipient", "StatusTaxExemption",
+    "TaxCertificate", "TaxObjectCode", "Gross", "Deemed",
+    "Rate", "Document", "DocumentNumber",
+    "DocumentDate", "IDPlaceOfBusinessActivity",
+    "WithholdingDate"
+]
+
+xml_tags_uni = [
+    "TaxPeriodMonth", "TaxPeriodYear", "CounterpartTin",
+    "IDPlaceOfBusinessActivityOfIncomeRecipient",
+    "TaxCertificate", "TaxObjectCode", "TaxBase",
+    "Rate", "Document", "DocumentNumber",
+    "DocumentDate", "IDPlaceOfBusinessActivity",
+    "GovTreasurerOpt", "SP2DNumber",
+    "WithholdingDate"
+]
+
+XML_TAGS = {
+    "Bp21": xml_tags_21,
+    "Bpu": xml_tags_uni,
+}
+
+# Columns B → P in Excel
+excel_cols = list("BCDEFGHIJKLMNOP")
+
+# Columns for special evaluation
+evaluate_cols = ["E"]
+
+# XML output above this size spills from memory to a temporary file
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+
+def coordinate_to_tuple(ref):
+    """(row, column) of an A1 reference, without importing openpyxl."""
+    match = A1_REF_RE.fullmatch(ref)
+    return int(match.group(5)), column_index(match.group(3))
+
+
+# --- FORMULA EVALUATION ---
+def eval_formula(f, values, origin):
+    """
+    Evaluates a formula located at `origin` (row, col) against `values`
+    ({(row, col): raw value}); referenced formulas are evaluated as well.
+    Returns the result as text, "" when the formula cannot be evaluated.
+    """
+    if not isinstance(f, str) or not f.startswith("="):
+        return f
+    try:
+        return to_text(FormulaEvaluator(values).evaluate(f, *origin))
+    except FormulaError:
+        return ""
+
+
+def _row_values(row):
+    return {(cell.row, cell.column): cell.value for cell in row if cell.value is not None}
+
+
+def iter_bupot_rows(ws):
+    """
+    Yields the B → P values of each data row of a read-only DATA sheet,
+    with formulas evaluated against the header rows and the row itself.
+    """
+    header_values = {}
+    for row in ws.iter_rows(min_row=1, max_row=start_row - 1):
+        header_values.update(_row_values(row))
+
+    evaluate = {excel_cols.index(col) for col in evaluate_cols}
+    for row in ws.iter_rows(min_row=start_row, min_col=2, max_col=2 + len(excel_cols) - 1):
+        if row[0].value is None:
+            break
+        # One evaluator per row: chained references are memoized within the row
+        evaluator = FormulaEvaluator(ChainMap(_row_values(row), header_values))
+        row_vals = []
+        for i, cell in enumerate(row):
+            # If this column needs evaluation AND has a formula:
+            if i in evaluate and isinstance(cell.value, str) and cell.value.startswith("="):
+                try:
+                    row_vals.append(to_text(evaluator.value_at(cell.row, cell.column)))
+                except FormulaError:
+                    row_vals.append("")
+            else:
+                row_vals.append(cell.value)
+        yield row_vals
+
+
+def read_tin(ws):
+    row, col = coordinate_to_tuple(TIN_cell)
+    for (value,) in ws.iter_rows(min_row=row, max_row=row, min_col=col, max_col=col, values_only=True):
+        return str(value)
+    return str(None)
+
+
+def _xml_text(value):
+    return (str(value).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;"))
+
+
+def _element(tag, value):
+    # Convert None to empty string; ElementTree writes empty text as <Tag />
+    text = "" if value is None else _xml_text(value)
+    return f"<{tag}>{text}</{tag}>" if text else f"<{tag} />"
+
+
+def _bulk_head(type_spt, tin):
+    return (
+        "<?xml version='1.0' encoding='utf-8'?>\n"
+        f'<{type_spt}Bulk xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+        f'{_element("TIN", tin)}'
+    ).encode("utf-8")
+
+
+def write_bulk_rows(output, type_spt, rows):
+    """Write the <{type_spt}> element of each row to `output`, return the number of rows."""
+    xml_tags = XML_TAGS[type_spt]
+    n_rows = 0
+    for row_vals in rows:
+        elements = "".join(_element(tag, value) for tag, value in zip(xml_tags, row_vals))
+        output.write(f"<{type_spt}>{elements}</{type_spt}>".encode("utf-8"))
+        n_rows += 1
+    return n_rows
+
+
+def write_bulk_xml(output, type_spt, tin, rows):
+    """Write a {type_spt}Bulk document to `output` one row element at a time."""
+    output.write(_bulk_head(type_spt, tin))
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        output.write(f"<ListOf{type_spt} />".encode("utf-8"))
+    else:
+        output.write(f"<ListOf{type_spt}>".encode("utf-8"))
+        write_bulk_rows(output, type_spt, chain((first,), rows))
+        output.write(f"</ListOf{type_spt}>".encode("utf-8"))
+    output.write(f"</{type_spt}Bulk>".encode("utf-8"))
+
+
+def write_bulk_parts(output, type_spt, tin, parts):
+    """
+    Like write_bulk_xml, for row elements already written to files by
+    write_bulk_rows: `parts` is a list of (path, number of rows).
+    """
+    output.write(_bulk_head(type_spt, tin))
+    if not any(n_rows for _, n_rows in parts):
+        output.write(f"<ListOf{type_spt} />".encode("utf-8"))
+    else:
+        output.write(f"<ListOf{type_spt}>".encode("utf-8"))
+        for path, _ in parts:
+            with open(path, "rb") as part:
+                shutil.copyfileobj(part, output)
+        output.write(f"</ListOf{type_spt}>".encode("utf-8"))
+    output.write(f"</{type_spt}Bulk>".encode("utf-8"))
+
+
+def write_workbook_xml(excel_file, type_spt, output):
+    """Stream a filled Bupot workbook (path or file-like) as XML into `output`."""
+    # --- READ EXCEL ---
+    # openpyxl is only imported by the workbook path (~0.1 s)
+    import openpyxl
+    wb = openpyxl.load_workbook(excel_file, read_only=True, data_only=False)
+    try:
+        ws = wb[sheet_name]
+        write_bulk_xml(output, type_spt, read_tin(ws), iter_bupot_rows(ws))
+    finally:
+        wb.close()
+
+
+def write_workbook_rows(excel_file, type_spt, output):
+    """Write the row elements of a filled Bupot workbook to `output`, return (TIN, number of rows)."""
+    import openpyxl
+    wb = openpyxl.load_workbook(excel_file, read_only=True, data_only=False)
+    try:
+        ws = wb[sheet_name]
+        return read_tin(ws), write_bulk_rows(output, type_spt, iter_bupot_rows(ws))
+    finally:
+        wb.close()
+
+
+def workbook_to_xml(excel_file, type_spt):
+    """Convert a filled Bupot workbook to XML, return a file object positioned at 0."""
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    write_workbook_xml(excel_file, type_spt, output)
+    output.seek(0)
+    return output
+
+
+# --- DIRECT EXPORT (no workbook) ---
+def _as_read_back(value):
+    """`value` as openpyxl reads it back from a template filled by xlsx_template."""
+    if _is_blank(value):
+        return None
+    if isinstance(value, Number) and not isinstance(value, bool):
+        text = _number(value)
+        return float(text) if "." in text or "e" in text or "E" in text else int(text)
+    return str(value)
+
+
+def iter_frame_rows(df_filtered, npwp, jenis_spt):
+    """
+    Yields the B → P values the filled template would hold for each row of
+    `df_filtered`, formulas evaluated the same way iter_bupot_rows does.
+    """
+    header_values = {coordinate_to_tuple(TIN_cell): npwp}
+    n_rows = len(df_filtered)
+    columns = {}
+    formulas = {}
+    for col, values in template_columns(df_filtered, npwp, jenis_spt):
+        if isinstance(values, Formula):
+            formulas[col] = values.template
+        elif _is_sequence(values):
+            columns[col] = [_as_read_back(v) for v in list(values)]
+        else:
+            columns[col] = [_as_read_back(values)] * n_rows
+    evaluate = [col for col in evaluate_cols if col in formulas]
+
+    for i in range(n_rows):
+        row = start_row + i
+        row_vals = {col: values[i] for col, values in columns.items()}
+        row_vals.update((col, template.format(row=row)) for col, template in formulas.items())
+        if evaluate:
+            cells = {(row, col_index(col)): value for col, value in row_vals.items() if value is not None}
+            evaluator = FormulaEvaluator(ChainMap(cells, header_values))
+            for col in evaluate:
+                try:
+                    row_vals[col] = to_text(evaluator.value_at(row, col_index(col)))
+                except FormulaError:
+                    row_vals[col] = ""
+        yield [row_vals.get(col) for col in excel_cols]
+
+
+def write_frame_xml(df_filtered, npwp, jenis_spt, output):
+    """Stream filtered BKPP rows as Coretax XML into `output`, without a workbook."""
+    write_bulk_xml(output, SPT_TYPES[jenis_spt], str(npwp), iter_frame_rows(df_filtered, npwp, jenis_spt))
+
+
+def frame_to_xml(df_filtered, npwp, jenis_spt):
+    """Convert filtered BKPP rows to XML, return a file object positioned at 0."""
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    write_frame_xml(df_filtered, npwp, jenis_spt, output)
+    output.seek(0)
+    return output
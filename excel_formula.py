@@ -0,0 +1,262 @@
+#Small Excel formula engine for the Bupot templates (no eval)
+"""
+Supports text and number literals, cell references (relative or $absolute),
+unary +/-, ^, * /, + -, the & concatenation operator, parentheses and the
+CONCAT/CONCATENATE functions. Anything else raises FormulaError.
+
+A formula is first rewritten to R1C1 form relative to its own cell, so
+`=D4 & "000000"` in E4 and `=D5 & "000000"` in E5 share one compiled form.
+"""
+import functools
+import math
+import operator
+import re
+
+A1_REF_RE = re.compile(r'("(?:[^"]|"")*")|(?<![A-Za-z0-9_.])(\$?)([A-Z]{1,3})(\$?)(\d+)(?![\w(])')
+TOKEN_RE = re.compile(r'''\s*(?:
+    (?P<str>"(?:[^"]|"")*")
+  | (?P<ref>R(?:\[-?\d+\]|\d+)C(?:\[-?\d+\]|\d+))
+  | (?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<func>[A-Z][A-Z0-9.]*)(?=\s*\()
+  | (?P<op>[-+*/^&(),])
+)''', re.X)
+R1C1_RE = re.compile(r'R(\[(-?\d+)\]|(\d+))C(\[(-?\d+)\]|(\d+))')
+
+
+class FormulaError(Exception):
+    pass
+
+
+def column_index(letters):
+    index = 0
+    for ch in letters:
+        index = index * 26 + ord(ch) - 64
+    return index
+
+
+def to_r1c1(formula, row, col):
+    """Rewrite A1 references in `formula` relative to the cell at (row, col)."""
+    def repl(match):
+        if match.group(1):
+            return match.group(1)
+        col_abs, letters, row_abs, digits = match.group(2, 3, 4, 5)
+        ref_col = column_index(letters)
+        ref_row = int(digits)
+        r = f"{ref_row}" if row_abs else f"[{ref_row - row}]"
+        c = f"{ref_col}" if col_abs else f"[{ref_col - col}]"
+        return f"R{r}C{c}"
+    return A1_REF_RE.sub(repl, formula)
+
+
+# ======================
+# Value coercion (Excel rules)
+# ======================
+def to_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else f"{value:.15g}"
+    return str(value)
+
+
+def to_number(value):
+    """Excel numbers are doubles: ints are coerced too, so `^` never builds a huge int."""
+    if value is None:
+        return 0.0
+    try:
+        number = float(value)
+    except (TypeError, ValueError, OverflowError):
+        raise FormulaError(f"#VALUE! {value!r} is not a number")
+    if not math.isfinite(number):
+        raise FormulaError(f"#VALUE! {value!r} is not a number")
+    return number
+
+
+def _arithmetic(op):
+    def apply(a, b):
+        try:
+            result = op(to_number(a), to_number(b))
+        except ZeroDivisionError:
+            raise FormulaError("#DIV/0!") from None
+        except ArithmeticError:
+            raise FormulaError("#NUM!") from None
+        # Overflow to inf, or a complex root of a negative number
+        if not isinstance(result, float) or not math.isfinite(result):
+            raise FormulaError("#NUM!")
+        return result
+    return apply
+
+
+BINARY_OPS = {
+    '&': lambda a, b: to_text(a) + to_text(b),
+    '+': _arithmetic(operator.add),
+    '-': _arithmetic(operator.sub),
+    '*': _arithmetic(operator.mul),
+    '/': _arithmetic(operator.truediv),
+    '^': _arithmetic(operator.pow),
+}
+
+FUNCTIONS = {
+    'CONCAT': lambda *args: ''.join(to_text(a) for a in args),
+    'CONCATENATE': lambda *args: ''.join(to_text(a) for a in args),
+}
+
+
+# ======================
+# Parser: R1C1 text -> closures
+# ======================
+class _Parser:
+    """Recursive-descent parser emitting closures `node(evaluator, row, col)`."""
+
+    def __init__(self, text):
+        self.tokens = []
+        pos = 0
+        text = text.rstrip()
+        while pos < len(text):
+            match = TOKEN_RE.match(text, pos)
+            if not match or match.end() == pos:
+                raise FormulaError(f"unsupported syntax at {text[pos:]!r}")
+            kind = match.lastgroup
+            self.tokens.append((kind, match.group(kind)))
+            pos = match.end()
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, value=None):
+        token = self.peek()
+        if token[0] is None or (value is not None and token[1] != value):
+            raise FormulaError(f"expected {value or 'a value'}")
+        self.pos += 1
+        return token
+
+    def parse(self):
+        node = self.binary(0)
+        if self.pos != len(self.tokens):
+            raise FormulaError(f"unexpected {self.peek()[1]!r}")
+        return node
+
+    # Lowest to highest precedence
+    LEVELS = [('&',), ('+', '-'), ('*', '/'), ('^',)]
+
+    def binary(self, level):
+        if level == len(self.LEVELS):
+            return self.unary()
+        left = self.binary(level + 1)
+        while self.peek()[0] == 'op' and self.peek()[1] in self.LEVELS[level]:
+            op = BINARY_OPS[self.take()[1]]
+            right = self.binary(level + 1)
+            left = (lambda op, l, r: lambda ev, row, col: op(l(ev, row, col), r(ev, row, col)))(op, left, right)
+        return left
+
+    def unary(self):
+        kind, value = self.peek()
+        if kind == 'op' and value in ('-', '+'):
+            self.take()
+            operand = self.unary()
+            if value == '-':
+                return lambda ev, row, col: -to_number(operand(ev, row, col))
+            return lambda ev, row, col: to_number(operand(ev, row, col))
+        return self.primary()
+
+    def primary(self):
+        kind, value = self.take()
+        if kind == 'num':
+            number = float(value)
+            number = int(number) if number.is_integer() and '.' not in value and 'e' not in value.lower() else number
+            return lambda ev, row, col: number
+        if kind == 'str':
+            text = value[1:-1].replace('""', '"')
+            return lambda ev, row, col: text
+        if kind == 'ref':
+            return self.reference(value)
+        if kind == 'func':
+            return self.function(value)
+        if kind == 'op' and value == '(':
+            node = self.binary(0)
+            self.take(')')
+            return node
+        raise FormulaError(f"unexpected {value!r}")
+
+    @staticmethod
+    def reference(token):
+        match = R1C1_RE.fullmatch(token)
+        row_rel, row_abs = match.group(2), match.group(3)
+        col_rel, col_abs = match.group(5), match.group(6)
+        if row_abs is not None and col_abs is not None:
+            target = (int(row_abs), int(col_abs))
+            return lambda ev, row, col: ev.value_at(*target)
+        if row_abs is not None:
+            ref_row, dcol = int(row_abs), int(col_rel)
+            return lambda ev, row, col: ev.value_at(ref_row, col + dcol)
+        if col_abs is not None:
+            drow, ref_col = int(row_rel), int(col_abs)
+            return lambda ev, row, col: ev.value_at(row + drow, ref_col)
+        drow, dcol = int(row_rel), int(col_rel)
+        return lambda ev, row, col: ev.value_at(row + drow, col + dcol)
+
+    def function(self, name):
+        func = FUNCTIONS.get(name.upper())
+        if func is None:
+            raise FormulaError(f"unsupported function {name}")
+        self.take('(')
+        args = []
+        if self.peek() != ('op', ')'):
+            args.append(self.binary(0))
+            while self.peek() == ('op', ','):
+                self.take()
+                args.append(self.binary(0))
+        self.take(')')
+        return lambda ev, row, col: func(*(arg(ev, row, col) for arg in args))
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_r1c1(text):
+    """Compiled closure for a formula body in R1C1 form (without the '=')."""
+    return _Parser(text).parse()
+
+
+def compile_formula(formula, row, col):
+    """Compile an A1 formula located at (row, col); identical column formulas share one entry."""
+    if not formula.startswith('='):
+        raise FormulaError("not a formula")
+    return compile_r1c1(to_r1c1(formula[1:], row, col))
+
+
+# ======================
+# Evaluation
+# ======================
+class FormulaEvaluator:
+    """
+    Evaluates formulas against a buffer of raw cell values keyed by
+    (row, col). Referenced cells that hold formulas are evaluated in turn;
+    results are memoized and circular references raise FormulaError.
+    """
+
+    def __init__(self, values):
+        self.values = values
+        self.memo = {}
+        self._in_progress = set()
+
+    def value_at(self, row, col):
+        key = (row, col)
+        if key in self.memo:
+            return self.memo[key]
+        raw = self.values.get(key)
+        if not (isinstance(raw, str) and raw.startswith('=')):
+            return raw
+        if key in self._in_progress:
+            raise FormulaError("circular reference")
+        self._in_progress.add(key)
+        try:
+            result = compile_formula(raw, row, col)(self, row, col)
+        finally:
+            self._in_progress.discard(key)
+        self.memo[key] = result
+        return result
+
+    def evaluate(self, formula, row, col):
+        return compile_formula(formula, row, col)(self, row, col)
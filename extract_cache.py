@@ -0,0 +1,117 @@
+#On-disk cache of BKPP extraction results
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+
+from bkpp_parser import PARSER_VERSION
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def evict_lru(directory, max_bytes, suffix=".pkl"):
+    """Delete the least recently modified `suffix` files until `directory` holds at most `max_bytes`."""
+    files = []
+    for name in os.listdir(directory):
+        if not name.endswith(suffix):
+            continue
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in files)
+    for _, size, name in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(os.path.join(directory, name))
+        except OSError:
+            continue
+        total -= size
+
+
+class ExtractCache:
+    """
+    Stores parsed results (DataFrames) keyed by a hash of the PDF bytes and
+    the parser version. Files are evicted least-recently-used first once the
+    directory grows past `max_bytes`; a hit refreshes the file's mtime.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(pdf_bytes, mode='text'):
+        digest = hashlib.sha256()
+        digest.update(PARSER_VERSION.encode())
+        digest.update(b'\0')
+        digest.update(mode.encode())
+        digest.update(b'\0')
+        digest.update(pdf_bytes)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            self._miss()
+            return None
+        except Exception as e:
+            # Truncated, or pickled by another pandas/module version: recompute
+            logger.warning("Dropping unreadable cache entry %s: %s: %s", key, type(e).__name__, e)
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            self._miss()
+            return None
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def put(self, key, result):
+        # Write to a temp file first so readers never see a partial pickle
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        evict_lru(self.cache_dir, self.max_bytes)
+
+    def stats(self):
+        sizes = [
+            os.path.getsize(os.path.join(self.cache_dir, name))
+            for name in os.listdir(self.cache_dir) if name.endswith(".pkl")
+        ]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(sizes),
+            "size_bytes": sum(sizes),
+        }
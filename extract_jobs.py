@@ -0,0 +1,243 @@
+#Background extraction jobs with progress, ETA and cancellation, shared per process
+"""
+A Streamlit script run ends (and restarts) on every interaction, so a long
+extraction cannot live inside it. Instead it runs in a Job on a daemon
+thread, keyed by the extraction cache key (PDF hash and mode). A rerun, a
+browser refresh or a second session uploading the same PDF attaches to
+the running job instead of parsing the PDF again; the page shows the
+job's progress and polls until it is done.
+
+The app releases a job's result once it has spilled and cached it;
+sessions attaching later load it from the extraction cache, so a finished
+job does not hold the frame in memory for its whole retention.
+
+Cancelling sets a flag that the job's progress callback checks: the
+extraction stops after the current page (or, with a process pool, once
+the chunks already running finish) and saves nothing.
+
+Services that must not start unbounded work (api_server) give the
+JobManager a fixed number of worker threads and a bounded queue instead.
+"""
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work once cancel() was called."""
+
+
+class JobQueueFull(Exception):
+    """The JobManager's queue has no room for another job."""
+
+
+class Job:
+    """
+    One background extraction. `stats` is the live stats dict of
+    bkpp_incremental.extract_incremental; `meta` holds whatever the caller
+    needs to reattach to the job (file path, NPWP, the session that
+    started it, ...).
+    """
+
+    def __init__(self, key, meta=None, state=RUNNING):
+        self.key = key
+        self.meta = dict(meta or {})
+        self.state = state
+        self.stats = {}
+        self.result = None
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self._rate_start = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    def report(self, pages_done, total_pages):
+        """Progress callback for the extraction; raises JobCancelled once cancel() was called."""
+        if self._cancel.is_set():
+            raise JobCancelled(self.key)
+        if self._rate_start is None:
+            # The first report may jump over pages reused from an earlier upload
+            self._rate_start = (time.time(), pages_done)
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the job finished; False on timeout."""
+        return self._done.wait(timeout)
+
+    def eta(self, now=None):
+        """Estimated seconds left from the page rate so far, None until it is known."""
+        total, done = self.stats.get("pages"), self.stats.get("pages_done", 0)
+        if self.state != RUNNING or not total or self._rate_start is None:
+            return None
+        started, pages_at_start = self._rate_start
+        elapsed = (time.time() if now is None else now) - started
+        if done <= pages_at_start or elapsed <= 0:
+            return None
+        return (total - done) * elapsed / (done - pages_at_start)
+
+    def progress(self):
+        """Snapshot of the job's state for display."""
+        end = self.finished or time.time()
+        return {
+            "state": self.state,
+            "pages_done": self.stats.get("pages_done", 0),
+            "total_pages": self.stats.get("pages"),
+            "entries": self.stats.get("entries_found", 0),
+            "elapsed": end - self.started,
+            "eta": self.eta(),
+            "cancel_requested": self.cancel_requested,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Jobs of this process by key. Finished jobs are kept for `retention`
+    seconds so a refreshed page can still pick up the result.
+
+    Without `workers` every job starts on its own thread right away. With
+    `workers`, that many threads run the jobs in submission order and at
+    most `max_queued` jobs wait (0 = no limit); submit() raises
+    JobQueueFull beyond that.
+    """
+
+    def __init__(self, retention=600, workers=None, max_queued=0):
+        self.retention = retention
+        self.workers = workers
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._queue = None
+        if workers:
+            self._queue = queue.Queue(maxsize=max_queued)
+            for n in range(workers):
+                threading.Thread(target=self._worker, name=f"xtractpajak-job-worker-{n}", daemon=True).start()
+
+    def queued(self):
+        """Number of jobs waiting for a worker."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def full(self):
+        """True when submit() would raise JobQueueFull right now."""
+        return self._queue is not None and self._queue.full()
+
+    def _prune(self, now):
+        for key, job in list(self._jobs.items()):
+            if job.finished is not None and now - job.finished > self.retention:
+                del self._jobs[key]
+
+    def get(self, key):
+        with self._lock:
+            self._prune(time.time())
+            return self._jobs.get(key)
+
+    def jobs(self):
+        with self._lock:
+            self._prune(time.time())
+            return list(self._jobs.values())
+
+    def forget(self, key):
+        """Drop a finished job, so the next submit() for `key` starts a new one."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.finished is not None:
+                del self._jobs[key]
+
+    def submit(self, key, work, meta=None):
+        """
+        The job for `key`: the running (or finished) one if there is one,
+        otherwise a new job running `work(job)` on a daemon thread. Failed
+        and cancelled jobs are replaced.
+        """
+        with self._lock:
+            self._prune(time.time())
+            job = self._jobs.get(key)
+            if job is not None and job.state in (QUEUED, RUNNING, DONE):
+                return job
+            if self._queue is not None:
+                job = Job(key, meta, state=QUEUED)
+                try:
+                    self._queue.put_nowait((job, work))
+                except queue.Full:
+                    raise JobQueueFull(f"{self._queue.maxsize} jobs already waiting") from None
+                self._jobs[key] = job
+                return job
+            job = Job(key, meta)
+            self._jobs[key] = job
+        thread = threading.Thread(target=self._run, args=(job, work),
+                                  name=f"xtractpajak-job-{key[:12]}", daemon=True)
+        thread.start()
+        return job
+
+    def _worker(self):
+        while True:
+            job, work = self._queue.get()
+            if job.cancel_requested:
+                # Cancelled while waiting: never started
+                job.state = CANCELLED
+                job.finished = time.time()
+                job._done.set()
+            else:
+                job.state = RUNNING
+                job.started = time.time()
+                self._run(job, work)
+            self._queue.task_done()
+
+    def _run(self, job, work):
+        try:
+            job.result = work(job)
+            job.state = DONE
+        except JobCancelled:
+            job.state = CANCELLED
+        except Exception as e:
+            logger.exception("Extraction job %s failed", job.key)
+            job.error = f"{type(e).__name__}: {e}"
+            job.state = FAILED
+        finally:
+            job.finished = time.time()
+            job._done.set()
+
+
+def run_extraction(job, source, incremental_store, mode, workers, cache=None, cache_key=None, metrics=None):
+    """
+    Job work for one BKPP: incremental extraction, frame and summaries. The
+    result dict ({"df", "summary", "monthly"}) is also put in `cache`
+    (extract_cache.ExtractCache) under `cache_key`. With `metrics`
+    (instrumentation.Metrics) the steps are recorded as stages.
+    """
+    from contextlib import nullcontext
+
+    from bkpp_frame import entries_to_frame, summarize
+    from bkpp_incremental import extract_incremental
+
+    def stage(name, **counters):
+        return metrics.stage(name, **counters) if metrics is not None else nullcontext()
+
+    with stage("extract", mode=mode) as recorded:
+        entries = extract_incremental(source, incremental_store, mode=mode, workers=workers,
+                                      progress_callback=job.report, stats=job.stats)
+        if recorded is not None:
+            recorded.counters.update(job.stats)
+    with stage("entries_to_frame", entries=len(entries)):
+        df = entries_to_frame(entries)
+    with stage("summary", tax_lines=len(df)):
+        summary, monthly = summarize(df)
+    result = {"df": df, "summary": summary, "monthly": monthly}
+    if cache is not None:
+        cache.put(cache_key, result)
+    return result
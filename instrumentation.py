@@ -0,0 +1,191 @@
+#Per-stage timing, memory and counter instrumentation
+"""
+Wrap a piece of work in `metrics.stage(name)` to record its wall time,
+resident memory and counters:
+
+    with metrics.stage("extract") as stage:
+        entries = extract_entries(path)
+        stage.count("entries", len(entries))
+
+`rss_mb` and `rss_delta_mb` are the resident memory after the stage and
+its change over the stage. `process_peak_mb` is the peak RSS of the whole
+process so far (getrusage), not of the stage; `peak_delta_mb` is how far
+the stage raised it, 0 unless the stage set a new process peak. Memory
+fields are None where the platform cannot report them (no getrusage on
+Windows).
+
+Environment variables:
+    XTRACTPAJAK_METRICS_LOG   append one JSON line per stage to this file
+    XTRACTPAJAK_PROFILE       stage names to run under cProfile ("all" or a comma list)
+    XTRACTPAJAK_PROFILE_DIR   where .prof files go (default .cache/profiles)
+
+The .prof files open with pstats or snakeviz. Sampling profilers such as
+py-spy need no hook: attach them to the server process.
+"""
+from collections import deque
+from contextlib import contextmanager
+import cProfile
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_log_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def rss_mb():
+    """Current resident set size in MB (falls back to the peak off Linux, None when unknown)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return max_rss_mb()
+
+
+def max_rss_mb():
+    """Peak resident set size of the process since it started, in MB; None without getrusage."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss / 2 ** 20 if sys.platform == "darwin" else rss / 2 ** 10
+
+
+def _profiled_stages(value):
+    value = (value or "").strip()
+    if value.lower() in ("1", "all", "true"):
+        return True
+    return frozenset(name.strip() for name in value.split(",") if name.strip())
+
+
+class Stage:
+    """Measurements for one run of a stage; counters are set by the caller."""
+
+    def __init__(self, name, run_id, counters=None):
+        self.name = name
+        self.run_id = run_id
+        self.counters = dict(counters or {})
+        self.started_at = time.time()
+        self.seconds = None
+        self.rss_mb = None
+        self.rss_delta_mb = None
+        self.process_peak_mb = None
+        self.peak_delta_mb = None
+        self.error = None
+        self.profile_path = None
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self):
+        return {
+            "ts": round(self.started_at, 3),
+            "run": self.run_id,
+            "stage": self.name,
+            "seconds": round(self.seconds, 4) if self.seconds is not None else None,
+            "rss_mb": round(self.rss_mb, 1) if self.rss_mb is not None else None,
+            "rss_delta_mb": round(self.rss_delta_mb, 1) if self.rss_delta_mb is not None else None,
+            "process_peak_mb": round(self.process_peak_mb, 1) if self.process_peak_mb is not None else None,
+            "peak_delta_mb": round(self.peak_delta_mb, 1) if self.peak_delta_mb is not None else None,
+            "counters": self.counters,
+            "error": self.error,
+            "profile": self.profile_path,
+        }
+
+
+class Metrics:
+    """
+    Collects Stage records for one session (or one background component).
+    The last `keep` records stay in memory for display; with `log_path`
+    every record is also appended to a JSON-lines file. `profile` names the
+    stages to run under cProfile, True for all of them.
+    """
+
+    def __init__(self, log_path=None, profile=(), profile_dir=None, keep=200, run_id=None):
+        self.log_path = log_path
+        self.profile = profile if profile is True else frozenset(profile)
+        self.profile_dir = profile_dir or os.path.join(".cache", "profiles")
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.records = deque(maxlen=keep)
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        kwargs.setdefault("log_path", os.environ.get("XTRACTPAJAK_METRICS_LOG") or None)
+        kwargs.setdefault("profile", _profiled_stages(os.environ.get("XTRACTPAJAK_PROFILE")))
+        kwargs.setdefault("profile_dir", os.environ.get("XTRACTPAJAK_PROFILE_DIR"))
+        return cls(**kwargs)
+
+    def _profiler(self, name):
+        if not (self.profile is True or name in self.profile):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another cProfile (an enclosing profiled stage) is already active
+            return None
+        return profiler
+
+    @contextmanager
+    def stage(self, name, **counters):
+        stage = Stage(name, self.run_id, counters)
+        rss_before, peak_before = rss_mb(), max_rss_mb()
+        started = time.perf_counter()
+        profiler = self._profiler(name)
+        try:
+            yield stage
+        except BaseException as e:
+            stage.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+            stage.seconds = time.perf_counter() - started
+            stage.rss_mb = rss_mb()
+            if stage.rss_mb is not None and rss_before is not None:
+                stage.rss_delta_mb = stage.rss_mb - rss_before
+            stage.process_peak_mb = max_rss_mb()
+            if stage.process_peak_mb is not None and peak_before is not None:
+                stage.peak_delta_mb = stage.process_peak_mb - peak_before
+            if profiler:
+                stage.profile_path = self._dump_profile(profiler, stage)
+            self.record(stage)
+
+    def record(self, stage):
+        self.records.append(stage)
+        if self.log_path:
+            line = json.dumps(stage.to_dict(), ensure_ascii=False)
+            with _log_lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _dump_profile(self, profiler, stage):
+        path = os.path.join(self.profile_dir, f"{self.run_id}-{stage.name}-{int(stage.started_at)}.prof")
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profiler.dump_stats(path)
+        except OSError as e:
+            logger.warning("Could not write profile %s: %s", path, e)
+            return None
+        return path
+
+    def table(self):
+        """Records as plain dicts, newest last (for st.dataframe)."""
+        rows = []
+        for stage in self.records:
+            row = stage.to_dict()
+            counters = row.pop("counters")
+            row.update(counters)
+            rows.append(row)
+        return rows
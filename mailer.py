@@ -0,0 +1,281 @@
+#Background email delivery with a persistent outbox
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import json
+import logging
+import os
+import smtplib
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Replies that refuse this message itself; sending it again cannot succeed
+MESSAGE_REJECTED = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def is_permanent(error):
+    """True for a 5xx refusal of the message (sender, recipients or content)."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, MESSAGE_REJECTED) and error.smtp_code >= 500
+
+
+def build_message(from_email, to_email, subject, body, attachment):
+    # Create MIME message
+    msg = MIMEMultipart()
+    msg['From'] = from_email
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+
+    # Attach the file
+    with open(attachment, "rb") as attachment_file:
+        part = MIMEBase('application', 'octet-stream')
+        part.set_payload(attachment_file.read())
+        encoders.encode_base64(part)
+        part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(attachment)}')
+        msg.attach(part)
+    return msg
+
+
+class Outbox:
+    """
+    Messages waiting to be sent, one `.eml` file plus a `.json` sidecar each.
+    The sidecar is written last, so a message only becomes visible once its
+    body is fully on disk. Messages that run out of attempts go to failed/.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.failed_directory = os.path.join(directory, "failed")
+        os.makedirs(self.failed_directory, exist_ok=True)
+
+    def _unlink(self, name):
+        try:
+            os.unlink(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def _write_json(self, path, meta):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+
+    def put(self, msg, from_email, to_email):
+        message_id = f"{time.time():.6f}-{uuid.uuid4().hex}"
+        with open(os.path.join(self.directory, f"{message_id}.eml"), "wb") as f:
+            f.write(msg.as_bytes())
+        meta = {"from": from_email, "to": to_email, "attempts": 0, "next_attempt": 0, "error": None}
+        self._write_json(os.path.join(self.directory, f"{message_id}.json"), meta)
+        return message_id
+
+    def due(self, limit, now=None):
+        """Oldest messages whose next attempt is due, as (id, meta) pairs."""
+        now = time.time() if now is None else now
+        ready = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".json"):
+                continue
+            message_id = name[:-len(".json")]
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if meta["next_attempt"] <= now:
+                ready.append((message_id, meta))
+                if len(ready) >= limit:
+                    break
+        return ready
+
+    def body(self, message_id):
+        with open(os.path.join(self.directory, f"{message_id}.eml"), "rb") as f:
+            return f.read()
+
+    def done(self, message_id):
+        for ext in (".json", ".eml"):
+            self._unlink(f"{message_id}{ext}")
+
+    def retry_later(self, message_id, meta, delay, error):
+        meta = dict(meta, attempts=meta["attempts"] + 1, next_attempt=time.time() + delay, error=error)
+        self._write_json(os.path.join(self.directory, f"{message_id}.json"), meta)
+
+    def fail(self, message_id, meta, error):
+        meta = dict(meta, attempts=meta["attempts"] + 1, error=error)
+        self._write_json(os.path.join(self.failed_directory, f"{message_id}.json"), meta)
+        try:
+            os.replace(os.path.join(self.directory, f"{message_id}.eml"),
+                       os.path.join(self.failed_directory, f"{message_id}.eml"))
+        except FileNotFoundError:
+            # Nothing to keep but the sidecar with the error
+            pass
+        self._unlink(f"{message_id}.json")
+
+    def pending(self):
+        """Number of queued messages. Sidecars whose `.eml` is gone are removed."""
+        names = set(os.listdir(self.directory))
+        count = 0
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            if f"{name[:-len('.json')]}.eml" in names:
+                count += 1
+            else:
+                logger.warning("Dropping outbox entry %s without a message body", name)
+                self._unlink(name)
+        return count
+
+
+class SmtpConnection:
+    """An authenticated SMTP connection that is opened lazily and reused."""
+
+    def __init__(self, host, port, user=None, password=None, starttls=True, timeout=30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.server = None
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            server.starttls()
+        if self.user:
+            server.login(self.user, self.password)
+        self.server = server
+
+    def send(self, from_email, to_email, data):
+        if self.server is None:
+            self._connect()
+        try:
+            self.server.sendmail(from_email, to_email, data)
+        except smtplib.SMTPServerDisconnected:
+            # Pooled connection timed out on the server side: reconnect once
+            self.server = None
+            self._connect()
+            self.server.sendmail(from_email, to_email, data)
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.server = None
+
+
+class BackgroundMailer:
+    """
+    Sends outbox messages from a daemon thread in batches over one reused
+    connection. Failed sends are retried with exponential backoff, up to
+    `max_attempts`; messages the server refuses outright (5xx) and entries
+    whose body is missing fail at once. The connection is closed after `idle_timeout` seconds
+    without work. With `metrics` (instrumentation.Metrics) each batch is
+    recorded as an "smtp_send" stage.
+    """
+
+    def __init__(self, outbox, connection, batch_size=20, base_delay=5, max_delay=600,
+                 max_attempts=6, idle_timeout=60, poll_interval=5, metrics=None):
+        self.outbox = outbox
+        self.connection = connection
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.metrics = metrics
+        self.sent = 0
+        self.failed = 0
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name="xtractpajak-mailer", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def enqueue(self, msg, from_email, to_email):
+        message_id = self.outbox.put(msg, from_email, to_email)
+        self._wakeup.set()
+        return message_id
+
+    def backoff(self, attempts):
+        return min(self.max_delay, self.base_delay * 2 ** attempts)
+
+    def send_due(self):
+        """Send one batch of due messages, return how many were attempted."""
+        batch = self.outbox.due(self.batch_size)
+        if batch and self.metrics is not None:
+            with self.metrics.stage("smtp_send", messages=len(batch)) as stage:
+                sent, failed = self.sent, self.failed
+                self._send_batch(batch)
+                stage.count("sent", self.sent - sent)
+                stage.count("failed", self.failed - failed)
+        else:
+            self._send_batch(batch)
+        return len(batch)
+
+    def _send_batch(self, batch):
+        for message_id, meta in batch:
+            try:
+                data = self.outbox.body(message_id)
+            except FileNotFoundError:
+                logger.error("Giving up on email %s: message body is missing", message_id)
+                self.outbox.fail(message_id, meta, "message body is missing")
+                self.failed += 1
+                continue
+            try:
+                self.connection.send(meta["from"], meta["to"], data)
+            except (smtplib.SMTPException, OSError) as e:
+                permanent = is_permanent(e)
+                if not permanent:
+                    # Drop the connection so the next attempt starts clean
+                    self.connection.close()
+                error = f"{type(e).__name__}: {e}"
+                if permanent or meta["attempts"] + 1 >= self.max_attempts:
+                    logger.error("Giving up on email %s: %s", message_id, error)
+                    self.outbox.fail(message_id, meta, error)
+                    self.failed += 1
+                else:
+                    logger.warning("Email %s failed, retrying: %s", message_id, error)
+                    self.outbox.retry_later(message_id, meta, self.backoff(meta["attempts"]), error)
+                continue
+            self.outbox.done(message_id)
+            self.sent += 1
+
+    def _run(self):
+        idle_since = time.monotonic()
+        while not self._stopped.is_set():
+            try:
+                attempted = self.send_due()
+            except Exception:
+                logger.exception("Mailer loop error")
+                attempted = 0
+            if attempted:
+                idle_since = time.monotonic()
+                continue
+            if time.monotonic() - idle_since > self.idle_timeout:
+                self.connection.close()
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+        self.connection.close()
@@ -0,0 +1,131 @@
+#Reconciliation checks on extracted BKPP tax lines
+"""
+Checks that catch a bad extraction (an amount read into the wrong column,
+a missed tax line) before it reaches a Bupot template or Coretax:
+
+- saldo: per tax, the previous line's saldo + pemotongan - penyetoran
+  must equal the line's saldo. The first line of each tax is the opening
+  balance and is not checked.
+- NTPN pairing: every pemotongan is paired with a later penyetoran of
+  the same tax and amount, in document order. Withholdings left without a
+  deposit, deposits left without a withholding and deposits without an
+  NTPN are reported. One deposit that pays several withholdings at once
+  cannot be paired by amount, so these are warnings; the saldo check
+  still covers such lines.
+- duplicate kwt: a kwt number on more than one entry, or the same tax
+  twice within one entry.
+
+Every check is a handful of column operations on the frame, in integer
+sen like bkpp_frame.summarize.
+"""
+import pandas as pd
+
+from bkpp_frame import MONEY_COLUMNS, to_sen
+
+ERROR = "error"
+WARNING = "peringatan"
+
+FINDING_COLUMNS = ['check', 'severity', 'row', 'date', 'kwt', 'tax', 'detail']
+
+
+def _rupiah(sen):
+    # Only ever called on the (few) flagged lines
+    return pd.Series([f"Rp {v / 100:,.2f}" for v in sen], index=sen.index, dtype=object)
+
+
+def _findings(df, mask, check, severity, detail):
+    rows = df[mask]
+    return pd.DataFrame({
+        'check': check,
+        'severity': severity,
+        'row': rows.index,
+        'date': rows['date'],
+        'kwt': rows['kwt'],
+        'tax': rows['tax'],
+        'detail': detail[mask] if isinstance(detail, pd.Series) else detail,
+    }, columns=FINDING_COLUMNS)
+
+
+def _sen(df):
+    return pd.DataFrame({column: to_sen(df[column]) for column in MONEY_COLUMNS}, index=df.index)
+
+
+def check_saldo(df):
+    """Lines whose saldo does not follow from the previous line of the same tax."""
+    sen = _sen(df)
+    previous = sen['saldo'].groupby(df['tax'], sort=False).shift()
+    expected = previous + sen['pemotongan'] - sen['penyetoran']
+    mismatch = previous.notna() & (expected != sen['saldo'])
+    detail = pd.Series("", index=df.index, dtype=object)
+    detail[mismatch] = (
+        "saldo " + _rupiah(sen['saldo'][mismatch]) + ", seharusnya "
+        + _rupiah(expected[mismatch].astype('int64'))
+    )
+    return _findings(df, mismatch, "saldo", ERROR, detail)
+
+
+def pair_ntpn(df):
+    """
+    Withholdings paired with deposits: one row per pemotongan line and per
+    unpaired penyetoran line, with `row_cut`, `row_deposit` (NaN where
+    unpaired), `tax`, `amount` (sen) and the deposit's `ntpn`.
+    """
+    sen = _sen(df)
+    cuts = sen['pemotongan'] > 0
+    deposits = sen['penyetoran'] > 0
+    cut = pd.DataFrame({'tax': df['tax'][cuts], 'amount': sen['pemotongan'][cuts], 'row_cut': df.index[cuts]})
+    deposit = pd.DataFrame({
+        'tax': df['tax'][deposits], 'amount': sen['penyetoran'][deposits],
+        'row_deposit': df.index[deposits], 'ntpn': df['ntpn'][deposits].astype(object),
+    })
+    # The n-th withholding of a tax and amount pairs with the n-th deposit of it
+    cut['n'] = cut.groupby(['tax', 'amount'], sort=False).cumcount()
+    deposit['n'] = deposit.groupby(['tax', 'amount'], sort=False).cumcount()
+    pairs = cut.merge(deposit, on=['tax', 'amount', 'n'], how='outer', sort=False)
+    return pairs.drop(columns='n')
+
+
+def check_ntpn(df):
+    """Unpaired withholdings and deposits, and deposits without an NTPN."""
+    pairs = pair_ntpn(df)
+    unpaired_cut = pairs.loc[pairs['row_deposit'].isna(), 'row_cut'].astype('int64')
+    unpaired_deposit = pairs.loc[pairs['row_cut'].isna(), 'row_deposit'].astype('int64')
+    deposits = to_sen(df['penyetoran']) > 0
+    ntpn = df['ntpn'].astype(object).fillna('').astype(str).str.strip()
+    return pd.concat([
+        _findings(df, df.index.isin(unpaired_cut), "ntpn", WARNING,
+                  "pemotongan belum dipasangkan dengan penyetoran ber-NTPN"),
+        _findings(df, df.index.isin(unpaired_deposit), "ntpn", WARNING,
+                  "penyetoran tanpa pemotongan dengan pajak dan nilai yang sama"),
+        _findings(df, deposits & (ntpn == ''), "ntpn", WARNING, "penyetoran tanpa NTPN"),
+    ])
+
+
+def check_duplicate_kwt(df):
+    """Lines of a kwt that appears on several entries, or of a tax repeated within one entry."""
+    kwt = df['kwt'].astype(object)
+    known = kwt.notna()
+    # Lines of one entry are adjacent and share the kwt; a new run is a new entry
+    entry = (kwt != kwt.shift()).cumsum()
+    entries_per_kwt = entry[known].groupby(kwt[known], sort=False).transform('nunique')
+    repeated_kwt = pd.Series(False, index=df.index)
+    repeated_kwt[known] = entries_per_kwt > 1
+    repeated_tax = pd.DataFrame({'entry': entry, 'tax': df['tax']}).duplicated(keep=False) & known
+    detail = pd.Series("pajak yang sama tercatat dua kali dalam satu bukti", index=df.index, dtype=object)
+    detail[repeated_kwt] = "nomor bukti dipakai di lebih dari satu transaksi"
+    return _findings(df, repeated_kwt | repeated_tax, "kwt", ERROR, detail)
+
+
+def reconcile(df):
+    """All checks on a tax line frame (bkpp_frame.entries_to_frame), as one findings frame."""
+    df = df.reset_index(drop=True)
+    findings = pd.concat([check_saldo(df), check_ntpn(df), check_duplicate_kwt(df)], ignore_index=True)
+    return findings.sort_values(['row', 'check'], kind='stable', ignore_index=True)
+
+
+def finding_counts(findings):
+    """Number of findings as {check: {severity: n}}, for summaries and JSON reports."""
+    counts = {}
+    for (check, severity), n in findings.groupby(['check', 'severity'], sort=False).size().items():
+        counts.setdefault(check, {})[severity] = int(n)
+    return counts
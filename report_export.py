@@ -0,0 +1,81 @@
+#Step 3 report downloads (xlsx, CSV, Parquet), built only when requested
+"""
+The xlsx report holds the summary, bulanan and rincian sheets. It is
+written row by row with xlsxwriter's constant_memory mode, which flushes
+each row to a temporary file once the next row starts, so memory stays
+flat however long the rincian sheet is. pandas' to_excel writes column
+by column and cannot be used in that mode.
+CSV and Parquet hold the rincian rows only.
+"""
+from datetime import datetime
+import importlib.util
+from io import BytesIO
+import math
+
+import pandas as pd
+import xlsxwriter
+
+# format: (file extension, MIME type)
+REPORT_FORMATS = {
+    "xlsx": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("csv", "text/csv"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+DATE_FORMAT = "yyyy-mm-dd"
+
+
+def available_formats():
+    """REPORT_FORMATS keys usable here; Parquet needs pyarrow or fastparquet."""
+    formats = ["xlsx", "csv"]
+    if importlib.util.find_spec("pyarrow") or importlib.util.find_spec("fastparquet"):
+        formats.append("parquet")
+    return formats
+
+
+def _write_sheet(workbook, name, df, header_format, date_format):
+    worksheet = workbook.add_worksheet(name)
+    worksheet.write_row(0, 0, list(df.columns), header_format)
+    # Convert column-wise, then emit strictly in row order for constant_memory
+    columns = []
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            columns.append([None if pd.isna(v) else v.to_pydatetime() for v in values])
+        else:
+            columns.append(values.astype(object).where(values.notna(), None).tolist())
+    for row, cells in enumerate(zip(*columns), start=1):
+        for col, value in enumerate(cells):
+            if value is None or isinstance(value, float) and math.isnan(value):
+                continue
+            if isinstance(value, datetime):
+                worksheet.write_datetime(row, col, value, date_format)
+            else:
+                worksheet.write(row, col, value)
+
+
+def write_xlsx_report(output, summary, monthly, df):
+    """Write the summary / bulanan / rincian workbook to `output` (path or binary file)."""
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    header_format = workbook.add_format({"bold": True, "border": 1})
+    date_format = workbook.add_format({"num_format": DATE_FORMAT})
+    try:
+        _write_sheet(workbook, "summary", summary, header_format, date_format)
+        _write_sheet(workbook, "bulanan", monthly.reset_index(), header_format, date_format)
+        _write_sheet(workbook, "rincian", df, header_format, date_format)
+    finally:
+        workbook.close()
+
+
+def build_report(fmt, summary, monthly, df):
+    """The report in `fmt` (a REPORT_FORMATS key) as bytes."""
+    output = BytesIO()
+    if fmt == "xlsx":
+        write_xlsx_report(output, summary, monthly, df)
+    elif fmt == "csv":
+        df.to_csv(output, index=False, date_format="%Y-%m-%d")
+    elif fmt == "parquet":
+        df.to_parquet(output, index=False)
+    else:
+        raise ValueError(f"fmt must be one of {tuple(REPORT_FORMATS)}, got {fmt!r}")
+    return output.getvalue()
@@ -0,0 +1,173 @@
+#Session data spilled to memory-mapped Arrow IPC files instead of session state
+"""
+Large per-session data (the extracted DataFrame, the uploaded PDF) lives
+in files under one directory per session; the session itself only keeps
+small handles. Frames are written as uncompressed Arrow IPC files and
+read back through a memory map, so columns are views of the page cache
+rather than private copies: the kernel can share and drop those pages,
+which it cannot do with heap memory under memory pressure.
+
+Each session has a byte budget: writing past it deletes the session's
+oldest files first. Sessions that have not been touched for `ttl` seconds
+are deleted as a whole.
+"""
+from collections import namedtuple
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+
+DEFAULT_SESSION_BUDGET = 512 * 1024 * 1024
+DEFAULT_TTL = 6 * 3600
+
+SAFE_NAME_RE = re.compile(r'[^\w.() -]+')
+
+# path: Arrow IPC file; rows and nbytes are kept so callers need not open it
+FrameHandle = namedtuple('FrameHandle', ['path', 'rows', 'nbytes'])
+
+
+class SpillBudgetExceeded(Exception):
+    """A single file is larger than the whole session budget."""
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+class SpillStore:
+    """Spill files of all sessions, one subdirectory per session id."""
+
+    def __init__(self, directory, session_budget=DEFAULT_SESSION_BUDGET, ttl=DEFAULT_TTL):
+        self.directory = directory
+        self.session_budget = session_budget
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+        self.cleanup()
+
+    def session_dir(self, session_id):
+        if not re.fullmatch(r'[0-9a-f]{32}', session_id):
+            raise ValueError(f"invalid session id {session_id!r}")
+        path = os.path.join(self.directory, session_id)
+        os.makedirs(path, exist_ok=True)
+        # The directory mtime is the session's last activity, see cleanup()
+        os.utime(path)
+        return path
+
+    def _session_files(self, session_dir):
+        files = []
+        for name in os.listdir(session_dir):
+            path = os.path.join(session_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if not name.endswith('.tmp'):
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def usage(self, session_id):
+        """Bytes currently spilled by a session."""
+        return sum(size for _, size, _ in self._session_files(self.session_dir(session_id)))
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            # Still mapped on platforms that forbid deleting open files; expiry retries
+            pass
+
+    def _commit(self, session_dir, tmp_path, path, replaces=()):
+        """Move a written temp file into place, then evict down to the budget."""
+        new_size = os.path.getsize(tmp_path)
+        if new_size > self.session_budget:
+            raise SpillBudgetExceeded(
+                f"{new_size} bytes exceed the session budget of {self.session_budget} bytes")
+        os.replace(tmp_path, path)
+        for old in replaces:
+            self._remove(old)
+        files = self._session_files(session_dir)
+        total = sum(size for _, size, _ in files)
+        # Oldest first; the file just written always stays
+        for _, size, old in sorted(files):
+            if total <= self.session_budget:
+                break
+            if old != path:
+                self._remove(old)
+                total -= size
+        self.cleanup()
+
+    def put_bytes(self, session_id, filename, data):
+        """Store raw bytes (e.g. the uploaded PDF) under `filename`, return its path."""
+        session_dir = self.session_dir(session_id)
+        name = SAFE_NAME_RE.sub('_', os.path.basename(filename)).strip(' .') or 'file'
+        path = os.path.join(session_dir, name)
+        fd, tmp_path = tempfile.mkstemp(dir=session_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            self._commit(session_dir, tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return path
+
+    def put_frame(self, session_id, name, df):
+        """
+        Spill a DataFrame as `name`, replacing the session's previous frame
+        of that name. Returns a FrameHandle for get_frame.
+        """
+        import pyarrow as pa
+
+        session_dir = self.session_dir(session_id)
+        previous = [
+            os.path.join(session_dir, f) for f in os.listdir(session_dir)
+            if f.startswith(f'{name}.') and f.endswith('.arrow')
+        ]
+        # A fresh file name per write: readers may still have the old one mapped
+        path = os.path.join(session_dir, f'{name}.{uuid.uuid4().hex[:8]}.arrow')
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        fd, tmp_path = tempfile.mkstemp(dir=session_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f, pa.ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+            self._commit(session_dir, tmp_path, path, replaces=previous)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return FrameHandle(path, table.num_rows, os.path.getsize(path))
+
+    def get_frame(self, handle, columns=None):
+        """
+        The DataFrame behind `handle`, optionally only `columns`. Numeric
+        columns without nulls are zero-copy views of the memory map.
+        Raises FileNotFoundError once the file was evicted or expired.
+        """
+        import pyarrow as pa
+
+        os.utime(os.path.dirname(handle.path))
+        # Not closed here: the table's buffers point into the map and keep it alive
+        source = pa.memory_map(handle.path, 'r')
+        table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        # split_blocks keeps one block per column instead of consolidating (copying) them
+        return table.to_pandas(split_blocks=True)
+
+    def drop_session(self, session_id):
+        shutil.rmtree(os.path.join(self.directory, session_id), ignore_errors=True)
+
+    def cleanup(self, now=None):
+        """Delete sessions idle for longer than `ttl` seconds."""
+        now = time.time() if now is None else now
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                idle = now - os.stat(path).st_mtime
+            except OSError:
+                continue
+            if idle > self.ttl and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,83 @@
+#Tax types recognized in BKPP ledgers, with their Bupot object code, rate and SPT family
+"""
+Each BKPP tax line is classified once, at extraction time, into a short
+categorical code; filtering by jenis SPT and the template's object code
+and rate columns are then lookups by that code. Supporting a new tax line
+means adding a row to TAX_TYPES: the parser's tax pattern is built from
+the `texts` of every row.
+"""
+from collections import namedtuple
+import functools
+import re
+
+# SPT families, the same names as the XML document types (bupot_excel.SPT_TYPES)
+FAMILY_21 = "Bp21"
+FAMILY_UNIFIKASI = "Bpu"
+
+# code: compact categorical code
+# texts: tax names as printed in the BKPP; the first is the usual one
+# family: SPT family whose Bupot carries this tax, None when there is none
+# object_code, rate: kode objek pajak and tarif (%) written to the Bupot
+TaxType = namedtuple('TaxType', ['code', 'texts', 'family', 'object_code', 'rate'])
+
+TAX_TYPES = [
+    TaxType('PPH21', ("Potongan Pajak PPh Pasal 21",), FAMILY_21, "21-100-17", 5),
+    TaxType('PPH22', ("Potongan Pajak PPh Pasal 22",), FAMILY_UNIFIKASI, "22-910-01", 1.5),
+    TaxType('PPH23', ("Potongan Pajak PPh Pasal 23",), FAMILY_UNIFIKASI, "24-100-02", 2),
+    TaxType('PPH4_2', (
+        "Potongan Pajak PPh Pasal 4 ayat (2)",
+        "Potongan Pajak PPh Pasal 4 Ayat (2)",
+        "Potongan Pajak PPh Pasal 4 Ayat 2",
+    ), FAMILY_UNIFIKASI, "28-403-02", 10),
+    TaxType('PPN', ("Potongan Pajak PPN Pusat",), None, None, None),
+    TaxType('PB1', ("Pajak Restoran, Rumah Makan",), None, None, None),
+    TaxType('UMJ', ("Uang Muka dan Jaminan",), None, None, None),
+    TaxType('LAINNYA', ("Potongan Pajak Lainnya", "Potongan Pajak Lainnnya"), None, None, None),
+]
+
+TAX_CODES = [tax_type.code for tax_type in TAX_TYPES]
+BY_CODE = {tax_type.code: tax_type for tax_type in TAX_TYPES}
+TEXT_TO_CODE = {text: tax_type.code for tax_type in TAX_TYPES for text in tax_type.texts}
+
+
+def build_tax_pattern(texts):
+    # Longest texts first, so a text that extends another one wins
+    return re.compile('(' + '|'.join(re.escape(text) for text in sorted(texts, key=len, reverse=True)) + ')')
+
+
+tax_pattern = build_tax_pattern(TEXT_TO_CODE)
+
+
+# pandas and numpy are imported on first use: the parser (and every
+# extraction worker process) only needs tax_pattern
+@functools.cache
+def tax_code_dtype():
+    import pandas as pd
+    return pd.CategoricalDtype(TAX_CODES)
+
+
+def classify(taxes):
+    """Tax names (as the parser captured them) as a categorical Series of codes, NaN if unknown."""
+    import pandas as pd
+    taxes = pd.Series(taxes, dtype=object)
+    return taxes.map(TEXT_TO_CODE).astype(tax_code_dtype())
+
+
+def tax_codes(df):
+    """The frame's `tax_code` column, classified from `tax` for frames that lack it."""
+    if 'tax_code' in df:
+        return df['tax_code'].astype(tax_code_dtype())
+    return classify(df['tax']).set_axis(df.index)
+
+
+def family_codes(family):
+    return [tax_type.code for tax_type in TAX_TYPES if tax_type.family == family]
+
+
+def lookup(codes, field, default=None):
+    """Per-row `field` of TaxType for categorical `codes`, `default` where unknown."""
+    import numpy as np
+    table = [getattr(tax_type, field) for tax_type in TAX_TYPES]
+    table = np.array([default if value is None else value for value in table] + [default], dtype=object)
+    # Category position per row; -1 (unknown) picks the trailing default
+    return table[np.asarray(codes.cat.codes)]
@@ -0,0 +1,208 @@
+import http.client
+import io
+import json
+import os
+import socket
+import threading
+import time
+
+import openpyxl
+import pytest
+
+from api_server import JobApi, _attachment, make_server
+from benchmarks.synthetic_bkpp import generate_bkpp_pdf
+from extract_jobs import DONE
+
+NPWP = "0123456789012345"
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    monkeypatch.setenv("XTRACTPAJAK_CACHE_DIR", str(tmp_path / "extract"))
+    monkeypatch.setenv("XTRACTPAJAK_INCREMENTAL_DIR", str(tmp_path / "incremental"))
+    return JobApi(workers=1, max_queued=1, upload_dir=str(tmp_path / "api"))
+
+
+@pytest.fixture
+def request_(api):
+    server = make_server("127.0.0.1", 0, api)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+
+    def request(method, path, body=None, headers=None):
+        connection = http.client.HTTPConnection(*server.server_address, timeout=30)
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        finally:
+            connection.close()
+
+    request.server_address = server.server_address
+    yield request
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def blocked(api):
+    """Occupies the single worker until set(), so submitted jobs stay queued."""
+    release = threading.Event()
+    api.jobs.submit("blocker", lambda job: release.wait(30))
+    yield release
+    release.set()
+
+
+def bkpp_pdf():
+    output = io.BytesIO()
+    generate_bkpp_pdf(output, pages=2, entries_per_page=6, seed=5)
+    return output.getvalue()
+
+
+def wait_done(request, job_id):
+    for _ in range(300):
+        status, _, body = request("GET", f"/jobs/{job_id}")
+        assert status == 200
+        payload = json.loads(body)
+        if payload["state"] not in ("queued", "running"):
+            return payload
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+@pytest.mark.parametrize("cached", [True, False])
+def test_extract_then_bupot_from_source(api, request_, monkeypatch, cached):
+    status, headers, body = request_("POST", f"/jobs/extract?npwp={NPWP}&name=sukamaju", bkpp_pdf())
+    assert status == 202
+    job = json.loads(body)
+    assert headers["Location"] == f"/jobs/{job['id']}"
+
+    payload = wait_done(request_, job["id"])
+    assert payload["state"] == DONE and payload["result_url"] == f"/jobs/{job['id']}/result"
+    status, headers, body = request_("GET", payload["result_url"])
+    assert status == 200
+    assert headers["Content-Disposition"] == 'attachment; filename="sukamaju.json"'
+    result = json.loads(body)
+    assert len(result["rows"]) == payload["rows"] > 0
+    assert set(result) == {"rows", "summary", "monthly", "findings"}
+    # The retained result is a file, not the frame
+    assert "df" not in api.jobs.get(job["id"]).result
+    assert os.listdir(api.upload_dir) == [f"{job['id']}.result"]
+
+    if not cached:
+        # Evicted from the extraction cache: the frame is read back from the JSON result
+        monkeypatch.setattr(api.cache, "get", lambda key: None)
+    status, _, body = request_("POST", f"/jobs/bupot?npwp={NPWP}&jenis=21&source={job['id']}", b"")
+    assert status == 202
+    bupot = wait_done(request_, json.loads(body)["id"])
+    assert bupot["state"] == DONE
+    assert bupot["rows"] > 0
+    status, headers, body = request_("GET", bupot["result_url"])
+    assert status == 200 and headers["Content-Type"].startswith("application/vnd.openxmlformats")
+    openpyxl.load_workbook(io.BytesIO(body))
+
+
+def test_bupot_rows_body_is_parsed_by_the_job(request_):
+    rows = [{"date": "2024-03-05", "kwt": "0001/KWT/01.2001/2024", "ntpn": None, "uraian": "Honor ",
+             "tax": "Potongan Pajak PPh Pasal 21", "pemotongan": 50000.0, "penyetoran": 0.0, "saldo": 50000.0}]
+    status, _, body = request_("POST", f"/jobs/bupot?npwp={NPWP}&jenis=21&format=xml",
+                               json.dumps({"rows": rows}).encode())
+    assert status == 202
+    payload = wait_done(request_, json.loads(body)["id"])
+    assert payload["state"] == DONE and payload["rows"] == 1
+    status, _, body = request_("GET", payload["result_url"])
+    assert status == 200 and body.startswith(b"<?xml")
+
+    # Invalid JSON fails the job instead of tying up the HTTP thread
+    status, _, body = request_("POST", f"/jobs/bupot?npwp={NPWP}&jenis=21", b'{"rows": ')
+    assert status == 202
+    payload = wait_done(request_, json.loads(body)["id"])
+    assert payload["state"] == "failed" and "JSON" in payload["error"]
+
+
+@pytest.mark.parametrize("path, body, message", [
+    ("/jobs/extract?npwp=123", b"%PDF-1.4", "NPWP"),
+    (f"/jobs/extract?npwp={NPWP}", b"not a pdf", "PDF"),
+    (f"/jobs/extract?npwp={NPWP}&mode=ocr", b"%PDF-1.4", "mode"),
+    (f"/jobs/extract?npwp={NPWP}&name=desa%0d%0aX-Injected:%201", b"%PDF-1.4", "name"),
+    (f"/jobs/extract?npwp={NPWP}&name=desa%22.pdf", b"%PDF-1.4", "name"),
+    (f"/jobs/bupot?npwp={NPWP}&jenis=21", b"rows", "JSON"),
+    (f"/jobs/bupot?npwp={NPWP}&jenis=21&source={'0' * 32}", b"", "tidak ditemukan"),
+    ("/jobs/xml?type=Bp21", b"not a workbook", "Excel"),
+    ("/jobs/ocr", b"", "operasi"),
+])
+def test_invalid_requests_are_rejected(api, request_, path, body, message):
+    status, _, response = request_("POST", path, body)
+    assert status == 400
+    assert message in json.loads(response)["error"]
+    assert os.listdir(api.upload_dir) == []
+
+
+def test_full_queue_answers_429(api, request_, blocked):
+    status, _, body = request_("POST", f"/jobs/extract?npwp={NPWP}", b"%PDF-1.4 first")
+    assert status == 202
+    queued = json.loads(body)
+    assert queued["state"] == "queued"
+
+    status, headers, body = request_("POST", f"/jobs/extract?npwp={NPWP}", b"%PDF-1.4 second")
+    assert status == 429 and headers["Retry-After"] == "10"
+    # Only the queued job's upload is on disk
+    assert len(os.listdir(api.upload_dir)) == 1
+
+    status, _, body = request_("GET", "/health")
+    assert json.loads(body)["queued"] == 1
+
+
+def test_full_queue_is_refused_before_the_body_is_read(api, request_, blocked):
+    api.jobs.submit("waiting", lambda job: None)
+    host, port = request_.server_address
+    with socket.create_connection((host, port), timeout=10) as sock:
+        # Announce a large body but never send it: answering at all means it was not read
+        sock.sendall(f"POST /jobs/extract?npwp={NPWP} HTTP/1.1\r\nHost: x\r\n"
+                     f"Content-Length: 50000000\r\n\r\n".encode("ascii"))
+        response = sock.recv(4096)
+    assert response.startswith(b"HTTP/1.0 429")
+    assert b"Retry-After: 10" in response
+
+
+def test_attachment_file_names_are_sanitized():
+    assert _attachment('Bp21_1"2\r\nX-Injected: 1.xml') == 'attachment; filename="Bp21_1_2__X-Injected__1.xml"'
+
+
+def test_result_before_done_conflicts_and_cancel(api, request_, blocked):
+    status, _, body = request_("POST", f"/jobs/extract?npwp={NPWP}", b"%PDF-1.4")
+    job_id = json.loads(body)["id"]
+    status, headers, _ = request_("GET", f"/jobs/{job_id}/result")
+    assert status == 409 and "Retry-After" in headers
+
+    status, _, body = request_("DELETE", f"/jobs/{job_id}")
+    assert status == 202 and json.loads(body)["cancel_requested"]
+    blocked.set()
+    assert api.jobs.get(job_id).wait(10)
+    status, _, _ = request_("GET", f"/jobs/{job_id}/result")
+    assert status == 410
+    # The cancelled job's upload goes with the next request
+    request_("POST", "/jobs/ocr", b"")
+    assert os.listdir(api.upload_dir) == []
+
+
+def test_unknown_jobs_and_endpoints(request_):
+    assert request_("GET", f"/jobs/{'0' * 32}")[0] == 404
+    assert request_("GET", f"/jobs/{'0' * 32}/result")[0] == 404
+    assert request_("DELETE", f"/jobs/{'0' * 32}")[0] == 404
+    assert request_("GET", "/jobs/not-a-job")[0] == 404
+    assert request_("POST", "/nope", b"")[0] == 404
+    assert request_("POST", f"/jobs/extract?npwp={NPWP}", headers={"Content-Length": "x"})[0] == 411
+
+
+def test_results_are_deleted_with_the_job(api, request_):
+    rows = json.dumps({"rows": []}).encode()
+    status, _, body = request_("POST", f"/jobs/bupot?npwp={NPWP}&jenis=21&format=xml", rows)
+    job_id = json.loads(body)["id"]
+    assert wait_done(request_, job_id)["state"] == DONE
+    assert os.listdir(api.upload_dir) == [f"{job_id}.result"]
+
+    api.jobs.retention = 0
+    time.sleep(0.01)
+    api._sweep()
+    assert os.listdir(api.upload_dir) == []
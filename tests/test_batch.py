@@ -0,0 +1,92 @@
+import io
+import json
+import xml.etree.ElementTree as ET
+
+import openpyxl
+import pytest
+
+import batch
+from benchmarks.synthetic_bkpp import generate_bkpp_pdf
+from bupot_excel import SPT_TYPES, TEMPLATE_NAMES
+
+
+@pytest.fixture
+def pdf_dir(tmp_path):
+    (tmp_path / "desa.pdf").write_bytes(b"%PDF-1.4\n")
+    return tmp_path
+
+
+def test_load_npwp_map_accepts_names_with_and_without_extension(tmp_path):
+    path = tmp_path / "npwp.csv"
+    path.write_text("file,npwp\ndesa.pdf, 1234567890123456\n", encoding="utf-8")
+    npwp_map = batch.load_npwp_map(str(path))
+    assert npwp_map["desa.pdf"] == npwp_map["desa"] == "1234567890123456"
+
+
+@pytest.mark.parametrize("content", [
+    b"nama,nomor\ndesa,1234567890123456\n",      # wrong columns
+    b"file,npwp\ndesa\n",                          # short row: npwp is None
+    b"\xff\xfe\x00\x01garbage",                    # not UTF-8
+    b'{"desa": "1234567890123456"}',               # JSON, not CSV
+])
+def test_malformed_npwp_map_exits_with_2(pdf_dir, tmp_path, content, capsys):
+    path = tmp_path / "npwp.csv"
+    path.write_bytes(content)
+    assert batch.main([str(pdf_dir), "--npwp-map", str(path), "--out", str(tmp_path / "out")]) == 2
+    assert "File NPWP tidak valid" in capsys.readouterr().err
+
+
+def test_no_pdfs_exits_with_2(tmp_path):
+    assert batch.main([str(tmp_path), "--npwp", "1234567890123456"]) == 2
+
+
+def test_converts_a_bkpp_to_xml_excel_and_report(tmp_path, capsys):
+    output = io.BytesIO()
+    generate_bkpp_pdf(output, pages=2, entries_per_page=8, seed=11)
+    (tmp_path / "sukamaju.pdf").write_bytes(output.getvalue())
+    out, report_path = tmp_path / "hasil", tmp_path / "report.json"
+
+    assert batch.main([str(tmp_path), "--npwp", "1234567890123456", "--out", str(out),
+                       "--workers", "2", "--report", str(report_path)]) == 0
+    [report] = json.loads(report_path.read_text(encoding="utf-8"))
+    assert report["error"] is None and report["tax_lines"] > 0
+    assert sorted(o["jenis_spt"] for o in report["outputs"]) == sorted(batch.JENIS_CHOICES.values())
+    for o in report["outputs"]:
+        base = out / f"{TEMPLATE_NAMES[o['jenis_spt']]}_sukamaju"
+        root = ET.parse(f"{base}.xml").getroot()
+        type_spt = SPT_TYPES[o["jenis_spt"]]
+        assert root.tag == f"{type_spt}Bulk"
+        assert len(root.find(f"ListOf{type_spt}")) == o["rows"]
+        openpyxl.load_workbook(f"{base}.xlsx", read_only=True).close()
+    assert "Selesai: 1 berhasil, 0 gagal." in capsys.readouterr().out
+
+
+def test_crashed_worker_fails_its_file_not_the_batch(pdf_dir, tmp_path, monkeypatch, capsys):
+    from concurrent.futures.process import BrokenProcessPool
+
+    class BrokenFuture:
+        def result(self):
+            raise BrokenProcessPool("worker died")
+
+    class BrokenExecutor:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def submit(self, *args):
+            return BrokenFuture()
+
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", BrokenExecutor)
+    monkeypatch.setattr(batch, "as_completed", lambda futures: list(futures))
+    report_path = tmp_path / "report.json"
+    assert batch.main([str(pdf_dir), "--npwp", "1234567890123456", "--out", str(tmp_path / "out"),
+                       "--report", str(report_path)]) == 1
+    [report] = json.loads(report_path.read_text(encoding="utf-8"))
+    assert report["file"].endswith("desa.pdf")
+    assert report["error"] == "BrokenProcessPool: worker died"
+    assert "GAGAL" in capsys.readouterr().out
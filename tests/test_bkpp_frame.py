@@ -0,0 +1,61 @@
+from decimal import Decimal
+
+import pytest
+
+from bkpp_frame import entries_to_frame, parse_amounts, summarize
+
+
+def entry(date, kwt, taxes):
+    return {
+        'date': date, 'kwt': kwt, 'ntpn': None, 'uraian': '',
+        'tax': [tax for tax, _, _, _ in taxes],
+        'pemotongan': [cut for _, cut, _, _ in taxes],
+        'penyetoran': [deposit for _, _, deposit, _ in taxes],
+        'saldo': [saldo for _, _, _, saldo in taxes],
+    }
+
+
+def test_parse_amounts_modes():
+    values = ["1.234.567,89", "0,10"]
+    assert parse_amounts(values, 'float').tolist() == [1234567.89, 0.1]
+    assert parse_amounts(values, 'sen').tolist() == [123456789, 10]
+    assert parse_amounts(values, 'decimal').tolist() == [Decimal("1234567.89"), Decimal("0.10")]
+    with pytest.raises(ValueError):
+        parse_amounts(values, 'cents')
+
+
+def test_entries_to_frame_one_row_per_tax_line():
+    df = entries_to_frame([
+        entry("05/01/2024", "0001/KWT/01.2001/2024",
+              [("PPh 21", "10,00", "0,00", "10,00"), ("PPN", "11,00", "0,00", "11,00")]),
+        entry("06/02/2024", "0002/KWT/01.2001/2024", [("PPh 21", "0,00", "10,00", "0,00")]),
+    ])
+    assert df['tax'].tolist() == ["PPh 21", "PPN", "PPh 21"]
+    assert df['kwt'].tolist() == ["0001/KWT/01.2001/2024"] * 2 + ["0002/KWT/01.2001/2024"]
+    assert df['date'].dt.month.tolist() == [1, 1, 2]
+
+
+def test_entries_to_frame_empty():
+    df = entries_to_frame([])
+    assert len(df) == 0
+    summary, monthly = summarize(df)
+    assert len(summary) == 0
+
+
+@pytest.mark.parametrize("money", ['float', 'sen', 'decimal'])
+def test_summarize_totals_are_exact_to_the_sen(money):
+    # 0.1 + 0.2 != 0.3 in floats; a thousand of them drifts further
+    entries = [
+        entry("05/01/2024", f"{n:04d}/KWT/01.2001/2024", [("PPh 21", "0,10", "0,20", "0,00")])
+        for n in range(1000)
+    ]
+    entries.append(entry("07/03/2024", "9999/KWT/01.2001/2024", [("PPN", "1.234.567,89", "0,00", "0,00")]))
+    summary, monthly = summarize(entries_to_frame(entries, money=money))
+
+    totals = summary.set_index('tax')
+    assert totals.loc["PPh 21", 'pemotongan'] == 100.0
+    assert totals.loc["PPh 21", 'penyetoran'] == 200.0
+    assert totals.loc["PPN", 'pemotongan'] == 1234567.89
+    assert monthly.index.name == 'date'
+    assert monthly.loc[1, "PPh 21"] == 100.0
+    assert monthly.loc[3, "PPN"] == 1234567.89
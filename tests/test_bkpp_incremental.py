@@ -0,0 +1,115 @@
+import copy
+import io
+import os
+
+import pytest
+
+import bkpp_incremental
+from benchmarks.synthetic_bkpp import generate_bkpp_pdf
+from bkpp_incremental import IncrementalStore, extract_incremental
+from bkpp_parser import extract_entries
+
+
+def ledger(pages, seed=3, hex_strings=False):
+    """A ledger with a fixed line count per page: a longer one keeps the leading pages, not the footers."""
+    output = io.BytesIO()
+    generate_bkpp_pdf(output, pages=pages, entries_per_page=6, lines_per_page=30, seed=seed,
+                      hex_strings=hex_strings)
+    return output.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return IncrementalStore(str(tmp_path))
+
+
+@pytest.mark.parametrize("mode", ["text", "layout"])
+@pytest.mark.parametrize("hex_strings", [False, True])
+def test_reupload_reuses_unchanged_leading_pages(store, mode, hex_strings):
+    january, february = ledger(4, hex_strings=hex_strings), ledger(8, hex_strings=hex_strings)
+
+    stats = {}
+    assert extract_incremental(january, store, mode=mode, stats=stats) == extract_entries(january, mode=mode)
+    assert stats["reused_pages"] == 0
+
+    stats = {}
+    entries = extract_incremental(february, store, mode=mode, stats=stats)
+    # Every footer changed ("dari 4" -> "dari 6"); of the rest only January's partly filled last page did
+    assert stats["reused_pages"] == 3
+    assert stats["pages_done"] == stats["pages"]
+    assert entries == extract_entries(february, mode=mode)
+
+
+def test_ledgers_of_one_npwp_keep_their_own_records(store):
+    village_a, village_b = ledger(4, seed=3), ledger(4, seed=4)
+    extract_incremental(village_a, store)
+    extract_incremental(village_b, store)
+    assert len([name for name in os.listdir(store.directory) if name.endswith(".pkl")]) == 2
+
+    stats = {}
+    extract_incremental(ledger(8, seed=3), store, stats=stats)
+    assert stats["reused_pages"] == 3
+
+
+def test_parallel_tail_matches_serial(store, monkeypatch):
+    monkeypatch.setattr(bkpp_incremental, "PARALLEL_MIN_PAGES", 2)
+    extract_incremental(ledger(4), store)
+    stats = {}
+    entries = extract_incremental(ledger(12), store, workers=2, stats=stats)
+    assert stats["reused_pages"] == 3
+    assert entries == extract_entries(ledger(12))
+
+
+def test_cancelled_extraction_saves_nothing(store):
+    def cancel(pages_done, total_pages):
+        if pages_done >= 2:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        extract_incremental(ledger(4), store, progress_callback=cancel)
+    assert not [name for name in os.listdir(store.directory) if name.endswith(".pkl")]
+
+
+def test_store_evicts_least_recently_used(tmp_path):
+    store = IncrementalStore(str(tmp_path), max_bytes=1)
+    extract_incremental(ledger(4, seed=3), store)
+    extract_incremental(ledger(4, seed=4), store)
+    assert len([name for name in os.listdir(store.directory) if name.endswith(".pkl")]) <= 1
+
+
+def test_reupload_keeps_new_entries_repeating_a_reused_kwt(store, monkeypatch):
+    import benchmarks.synthetic_bkpp as synthetic
+
+    january = ledger(4)
+    extract_incremental(january, store)
+
+    generate = synthetic.generate_entries
+
+    def with_repeat(*args):
+        # Same kwt, NTPN and taxes as the first entry, another date and amounts
+        entries = generate(*args)
+        repeat = copy.deepcopy(entries[0])
+        repeat.update(date="28/12/2024", pemotongan=["9,99"] * len(repeat['tax']))
+        entries[-1] = repeat
+        return entries
+
+    monkeypatch.setattr(synthetic, "generate_entries", with_repeat)
+    february = ledger(8)
+    stats = {}
+    entries = extract_incremental(february, store, stats=stats)
+    assert stats["reused_pages"] == 3
+    assert entries == extract_entries(february)
+    assert entries[-1]['kwt'] == entries[0]['kwt'] and entries[-1]['date'] == "28/12/2024"
+
+
+def test_fingerprint_ignores_the_footer_only():
+    import pdfplumber
+
+    from bkpp_incremental import page_fingerprint
+
+    with pdfplumber.open(io.BytesIO(ledger(4))) as short, pdfplumber.open(io.BytesIO(ledger(8))) as long:
+        fingerprints = [[page_fingerprint(page) for page in pdf.pages] for pdf in (short, long)]
+    # "Halaman 1 dari 4" vs "dari 6": same leading pages, the partly filled fourth page differs
+    assert fingerprints[0][:3] == fingerprints[1][:3]
+    assert fingerprints[0][3] != fingerprints[1][3]
+    assert len(set(fingerprints[1])) == len(fingerprints[1])
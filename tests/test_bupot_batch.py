@@ -0,0 +1,92 @@
+import io
+import os
+import xml.etree.ElementTree as ET
+import zipfile
+
+import pytest
+
+from bkpp_frame import entries_to_frame
+from bupot_batch import convert_workbooks, results_to_zip, write_zip, xml_documents
+from bupot_excel import SPT_21, fill_template, filter_bupot
+from bupot_xml import frame_to_xml, write_bulk_parts
+
+# openpyxl drops the templates' data validation extension on read
+pytestmark = pytest.mark.filterwarnings("ignore:Data Validation extension:UserWarning")
+
+TIN_A = "0123456789012345"
+TIN_B = "5432109876543210"
+
+
+def workbook(tin, kwts):
+    df = entries_to_frame([
+        {'date': "05/01/2024", 'kwt': kwt, 'ntpn': None, 'uraian': '', 'tax': ["Potongan Pajak PPh Pasal 21"],
+         'pemotongan': ["50.000,00"], 'penyetoran': ["0,00"], 'saldo': ["50.000,00"]}
+        for kwt in kwts
+    ])
+    df_filtered = filter_bupot(df, 0, SPT_21)
+    return fill_template(df_filtered, tin, SPT_21).getvalue(), df_filtered
+
+
+@pytest.fixture
+def files():
+    return [
+        ("januari.xlsx", workbook(TIN_A, ["0001/KWT/01.2001/2024", "0002/KWT/01.2001/2024"])[0]),
+        ("rusak.xlsx", b"PK not a workbook"),
+        ("februari.xlsx", workbook(TIN_A, ["0003/KWT/01.2001/2024"])[0]),
+        ("desa_lain.xlsx", workbook(TIN_B, ["0100/KWT/01.2001/2024"])[0]),
+    ]
+
+
+def document_numbers(xml_bytes):
+    root = ET.fromstring(xml_bytes)
+    return root.findtext("TIN"), [row.findtext("DocumentNumber") for row in root.iter("Bp21")]
+
+
+def test_workbook_xml_matches_the_direct_export(tmp_path):
+    data, df_filtered = workbook(TIN_A, ["0001/KWT/01.2001/2024", "0002/KWT/01.2001/2024"])
+    results = convert_workbooks([("januari.xlsx", data)], "Bp21", str(tmp_path), workers=1)
+    ((_, tin, parts),) = xml_documents(results, "Bp21")
+    output = io.BytesIO()
+    write_bulk_parts(output, "Bp21", tin, parts)
+    with frame_to_xml(df_filtered, TIN_A, SPT_21) as direct:
+        assert output.getvalue() == direct.read()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_workers_return_paths_not_rows(tmp_path, files, workers):
+    results = convert_workbooks(files, "Bp21", str(tmp_path), workers=workers)
+    assert [r["name"] for r in results] == [name for name, _ in files]
+    assert [r["rows"] for r in results] == [2, 0, 1, 1]
+    assert results[1]["error"] is not None and results[1]["path"] is None
+    for result in results[:1] + results[2:]:
+        assert result["tin"] in (TIN_A, TIN_B)
+        assert os.path.dirname(result["path"]) == str(tmp_path)
+    # The broken workbook leaves nothing behind
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_zip_one_document_per_workbook(tmp_path, files):
+    results = convert_workbooks(files, "Bp21", str(tmp_path), workers=1)
+    with results_to_zip(results, "Bp21") as output, zipfile.ZipFile(output) as archive:
+        assert archive.namelist() == ["januari.xml", "februari.xml", "desa_lain.xml"]
+        assert document_numbers(archive.read("januari.xml")) == (
+            TIN_A, ["0001/KWT/01.2001/2024", "0002/KWT/01.2001/2024"])
+
+
+def test_zip_merged_by_tin_keeps_upload_order(tmp_path, files):
+    results = convert_workbooks(files, "Bp21", str(tmp_path), workers=1)
+    output = io.BytesIO()
+    write_zip(output, results, "Bp21", merge_by_tin=True)
+    with zipfile.ZipFile(output) as archive:
+        assert archive.namelist() == [f"Bp21_{TIN_A}.xml", f"Bp21_{TIN_B}.xml"]
+        assert document_numbers(archive.read(f"Bp21_{TIN_A}.xml")) == (
+            TIN_A, ["0001/KWT/01.2001/2024", "0002/KWT/01.2001/2024", "0003/KWT/01.2001/2024"])
+
+
+def test_empty_workbook_gives_an_empty_list(tmp_path):
+    data, _ = workbook(TIN_A, [])
+    results = convert_workbooks([("kosong.xlsx", data)], "Bp21", str(tmp_path), workers=1)
+    ((_, tin, parts),) = xml_documents(results, "Bp21")
+    output = io.BytesIO()
+    write_bulk_parts(output, "Bp21", tin, parts)
+    assert output.getvalue().endswith(b"<ListOfBp21 /></Bp21Bulk>")
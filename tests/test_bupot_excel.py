@@ -0,0 +1,71 @@
+import warnings
+
+import openpyxl
+import pytest
+
+from bkpp_frame import entries_to_frame
+from bupot_excel import SPT_21, SPT_UNIFIKASI, TIN_cell, fill_template, filter_bupot, sheet_name, start_row
+
+NPWP = "0123456789012345"
+
+
+def entry(date, kwt, tax, pemotongan):
+    return {
+        'date': date, 'kwt': kwt, 'ntpn': None, 'uraian': '',
+        'tax': [tax], 'pemotongan': [pemotongan], 'penyetoran': ["0,00"], 'saldo': [pemotongan],
+    }
+
+
+@pytest.fixture
+def df():
+    return entries_to_frame([
+        entry("05/01/2024", "0001/KWT/01.2001/2024", "Potongan Pajak PPh Pasal 21", "50.000,00"),
+        entry("12/01/2024", "0002/KWT/01.2001/2024", "Potongan Pajak PPh Pasal 23", "20.000,00"),
+        entry("03/02/2024", "0003/KWT/01.2001/2024", "Potongan Pajak PPh Pasal 21", "7.500,00"),
+        entry("04/02/2024", "0004/KWT/01.2001/2024", "Potongan Pajak PPN Pusat", "11.000,00"),
+    ])
+
+
+def read_sheet(output):
+    with warnings.catch_warnings():
+        # The templates carry a data validation extension openpyxl drops on read
+        warnings.simplefilter("ignore", UserWarning)
+        workbook = openpyxl.load_workbook(output)
+    return workbook[sheet_name]
+
+
+def test_filter_bupot_by_masa_and_jenis(df):
+    assert filter_bupot(df, 0, SPT_21)['kwt'].tolist() == ["0001/KWT/01.2001/2024", "0003/KWT/01.2001/2024"]
+    assert filter_bupot(df, 2, SPT_21)['kwt'].tolist() == ["0003/KWT/01.2001/2024"]
+    assert filter_bupot(df, 0, SPT_UNIFIKASI)['kwt'].tolist() == ["0002/KWT/01.2001/2024"]
+
+
+def test_fill_template_round_trip_bupot_21(df):
+    sheet = read_sheet(fill_template(filter_bupot(df, 0, SPT_21), NPWP, SPT_21))
+
+    assert sheet[TIN_cell].value == NPWP
+    rows = [[cell.value for cell in row] for row in sheet.iter_rows(min_row=start_row, max_row=start_row + 1,
+                                                                    min_col=2, max_col=16)]
+    assert rows[0] == [
+        1, 2024, "0000000000000000", f'=D{start_row} & "000000"', "K/0", "N/A", "21-100-17",
+        1000000, 100, 5, "PaymentProof", "0001/KWT/01.2001/2024", "2024-01-05", f"{NPWP}000000", "2024-01-05",
+    ]
+    assert rows[1][:2] == [2, 2024]
+    assert rows[1][3] == f'=D{start_row + 1} & "000000"'
+    assert rows[1][7] == 150000
+    assert sheet.cell(start_row + 2, 2).value is None
+    assert sheet.tables["Table1"].ref == f"B3:P{start_row + 1}"
+
+
+def test_fill_template_round_trip_unifikasi(df):
+    sheet = read_sheet(fill_template(filter_bupot(df, 0, SPT_UNIFIKASI), NPWP, SPT_UNIFIKASI))
+
+    assert [sheet.cell(start_row, col).value for col in (7, 8, 9, 11, 14)] == [
+        "24-100-02", 1000000, 2, "0002/KWT/01.2001/2024", "Imprest",
+    ]
+
+
+def test_fill_template_without_rows_keeps_the_table(df):
+    sheet = read_sheet(fill_template(filter_bupot(df, 5, SPT_21), NPWP, SPT_21))
+    assert sheet[TIN_cell].value == NPWP
+    assert sheet.tables["Table1"].ref == f"B3:P{start_row}"
@@ -0,0 +1,63 @@
+import pytest
+
+from bupot_xml import eval_formula
+from excel_formula import FormulaError, FormulaEvaluator, compile_formula, to_r1c1
+
+
+def evaluate(formula, values=None, origin=(4, 5)):
+    return FormulaEvaluator(values or {}).evaluate(formula, *origin)
+
+
+@pytest.mark.parametrize("formula, expected", [
+    ('=D4 & "000000"', "1234000000"),
+    ("=1+2*3", 7),
+    ("=(1+2)*3", 9),
+    ("=-D4/4", -308.5),
+    ("=2^10", 1024),
+    ("=1.5E3+1", 1501),
+    ('=CONCAT("a", D4, "b")', "a1234b"),
+    ('="say ""hi"""', 'say "hi"'),
+])
+def test_evaluates(formula, expected):
+    assert evaluate(formula, {(4, 4): 1234}) == expected
+
+
+@pytest.mark.parametrize("formula, error", [
+    ("=0^-1", "#DIV/0!"),
+    ("=1/0", "#DIV/0!"),
+    ("=2.0^5000", "#NUM!"),
+    ("=1E308*10", "#NUM!"),
+    ("=1E308+1E308", "#NUM!"),
+    ("=(-8)^(1/3)", "#NUM!"),
+    ('="x"*2', "#VALUE!"),
+])
+def test_arithmetic_errors_are_formula_errors(formula, error):
+    with pytest.raises(FormulaError, match=error):
+        evaluate(formula)
+
+
+def test_power_chain_stays_a_float():
+    # Left-associative like Excel: (9^9)^9, computed in floats instead of a huge int
+    assert evaluate("=9^9^9") == pytest.approx(float(9 ** 81))
+    assert isinstance(evaluate("=9^9^9"), float)
+
+
+@pytest.mark.parametrize("formula", ["=0^-1", "=2.0^5000", "=9^9^9^9", "=D4/0"])
+def test_eval_formula_gives_empty_text_on_errors(formula):
+    assert eval_formula(formula, {(4, 4): 1}, (4, 5)) == ""
+
+
+def test_column_formulas_share_one_compiled_form():
+    assert to_r1c1('D4 & "000000"', 4, 5) == to_r1c1('D5 & "000000"', 5, 5) == 'R[0]C[-1] & "000000"'
+    assert compile_formula('=D4 & "000000"', 4, 5) is compile_formula('=D5 & "000000"', 5, 5)
+    assert compile_formula("=$D$4", 4, 5) is compile_formula("=$D$4", 5, 5)
+    assert compile_formula("=D4", 4, 5) is not compile_formula("=D4", 5, 5)
+    # References inside string literals are left alone
+    assert to_r1c1('"D4" & D4', 4, 5) == '"D4" & R[0]C[-1]'
+
+
+def test_chained_and_circular_references():
+    values = {(4, 4): "=C4*2", (4, 3): 21, (5, 4): "=D5"}
+    assert evaluate("=D4+0", values) == 42
+    with pytest.raises(FormulaError, match="circular"):
+        evaluate("=D5", values, origin=(5, 5))
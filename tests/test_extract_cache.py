@@ -0,0 +1,48 @@
+import os
+import pickle
+
+import pandas as pd
+import pytest
+
+from extract_cache import ExtractCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ExtractCache(str(tmp_path))
+
+
+def test_round_trip_counts_hits_and_misses(cache):
+    key = cache.key(b"%PDF-1.4 data", mode="text")
+    assert cache.get(key) is None
+    cache.put(key, {"df": pd.DataFrame({"a": [1, 2]})})
+    assert cache.get(key)["df"]["a"].tolist() == [1, 2]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_key_depends_on_mode(cache):
+    assert cache.key(b"x", mode="text") != cache.key(b"x", mode="layout")
+
+
+@pytest.mark.parametrize("payload", [
+    b"not a pickle",
+    pickle.dumps({"df": 1})[:5],
+    # A class that no longer exists (moved module, upgraded library)
+    b"\x80\x04\x95\x1e\x00\x00\x00\x00\x00\x00\x00\x8c\x0bno_such_mod\x94\x8c\x03Cls\x94\x93\x94.",
+])
+def test_unreadable_entry_is_a_miss_and_removed(cache, payload):
+    key = cache.key(b"pdf")
+    with open(cache._path(key), "wb") as f:
+        f.write(payload)
+    assert cache.get(key) is None
+    assert not os.path.exists(cache._path(key))
+    assert cache.misses == 1
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ExtractCache(str(tmp_path), max_bytes=1)
+    cache.put("a" * 64, b"x" * 100)
+    cache.put("b" * 64, b"y" * 100)
+    # Entries never stay over the byte budget
+    assert cache.stats()["entries"] <= 1
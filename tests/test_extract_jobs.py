@@ -0,0 +1,41 @@
+import threading
+
+from extract_jobs import CANCELLED, DONE, RUNNING, JobManager
+
+
+def test_finished_job_is_shared_until_forgotten():
+    jobs = JobManager()
+    runs = []
+
+    def work(job):
+        runs.append(job.key)
+        return {"rows": len(runs)}
+
+    first = jobs.submit("pdf-hash", work, meta={"session": "a"})
+    assert first.wait(5) and first.state == DONE
+    # Another session with the same PDF attaches to the finished job
+    assert jobs.submit("pdf-hash", work, meta={"session": "b"}) is first
+    assert first.meta["session"] == "a"
+
+    jobs.forget("pdf-hash")
+    second = jobs.submit("pdf-hash", work)
+    assert second is not first
+    assert second.wait(5) and second.result == {"rows": 2}
+
+
+def test_running_job_is_not_forgotten_and_can_be_cancelled():
+    jobs = JobManager()
+    started = threading.Event()
+
+    def work(job):
+        started.set()
+        while True:
+            job.report(0, 10)
+            threading.Event().wait(0.01)
+
+    job = jobs.submit("pdf-hash", work)
+    assert started.wait(5)
+    jobs.forget("pdf-hash")
+    assert jobs.get("pdf-hash") is job and job.state == RUNNING
+    job.cancel()
+    assert job.wait(5) and job.state == CANCELLED
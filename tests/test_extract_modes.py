@@ -0,0 +1,65 @@
+import io
+
+import pdfplumber
+import pytest
+
+from benchmarks.synthetic_bkpp import generate_bkpp_pdf
+from bkpp_frame import MONEY_COLUMNS, entries_to_frame
+from bkpp_layout import page_rows
+from bkpp_parser import extract_entries
+
+# The parsed uraian differs from the generated one (it only collects lines
+# without a date, kwt, NTPN, tax or amount), so it is compared between modes
+# only: text mode drops page footers and header rows by their text, layout
+# mode crops them away. Everything that reaches a Bupot must match.
+COMPARED = ['date', 'kwt', 'ntpn', 'tax', 'tax_code'] + MONEY_COLUMNS
+
+
+def bkpp_pdf(**kwargs):
+    output = io.BytesIO()
+    expected = generate_bkpp_pdf(output, pages=4, entries_per_page=8, **kwargs)
+    return output.getvalue(), expected
+
+
+def without_uraian(entries):
+    return [{key: value for key, value in entry.items() if key != 'uraian'} for entry in entries]
+
+
+@pytest.mark.parametrize("header_noise", [True, False])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_text_and_layout_modes_agree(seed, header_noise):
+    pdf, expected = bkpp_pdf(seed=seed, header_noise=header_noise)
+    text = extract_entries(pdf, mode='text')
+    layout = extract_entries(pdf, mode='layout')
+
+    assert text == layout
+    assert without_uraian(layout) == without_uraian(expected)
+    text_frame, layout_frame = entries_to_frame(text, money='sen'), entries_to_frame(layout, money='sen')
+    assert text_frame[COMPARED].equals(layout_frame[COMPARED])
+
+
+def test_continuation_pages_are_cropped_to_the_table():
+    pdf, _ = bkpp_pdf(seed=1)
+    layouts = {}
+    with pdfplumber.open(io.BytesIO(pdf)) as pdf_file:
+        pages = [page_rows(page, layouts) for page in pdf_file.pages]
+    [layout] = layouts.values()
+    # Set from the second page: below its repeated table header and unit row
+    assert 0 < layout.table_top < 100
+    header_words = {'Tanggal', 'Uraian', 'Pemotongan', 'Saldo', '(Rp)', 'Halaman'}
+    for rows in pages:
+        assert not any(header_words & set(text.split()) for text, _ in rows)
+    assert all(pages)
+
+
+def test_layout_mode_reads_blank_zero_cells():
+    # The case layout mode exists for: text mode cannot tell which amount is missing
+    pdf, expected = bkpp_pdf(seed=0, blank_zeros=True)
+    assert without_uraian(extract_entries(pdf, mode='layout')) == without_uraian(expected)
+    assert without_uraian(extract_entries(pdf, mode='text')) != without_uraian(expected)
+
+
+def test_unknown_mode_is_rejected():
+    pdf, _ = bkpp_pdf(seed=0)
+    with pytest.raises(ValueError):
+        extract_entries(pdf, mode='ocr')
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+import instrumentation
+from instrumentation import Metrics, max_rss_mb
+
+
+def test_stage_records_time_memory_and_counters(tmp_path):
+    log_path = tmp_path / "metrics.jsonl"
+    metrics = Metrics(log_path=str(log_path), run_id="run")
+    with metrics.stage("extract", mode="text") as stage:
+        stage.count("entries", 3)
+        stage.count("entries")
+
+    record = json.loads(log_path.read_text(encoding="utf-8"))
+    assert (record["run"], record["stage"], record["error"]) == ("run", "extract", None)
+    assert record["counters"] == {"mode": "text", "entries": 4}
+    assert record["seconds"] >= 0
+    assert record["rss_mb"] > 0 and record["process_peak_mb"] > 0
+    assert "max_rss_mb" not in record
+    assert metrics.table()[0]["entries"] == 4
+
+
+def test_process_peak_is_not_per_stage():
+    metrics = Metrics()
+    with metrics.stage("big"):
+        block = bytearray(64 * 2 ** 20)
+        block[::4096] = b"x" * len(block[::4096])
+        del block
+    with metrics.stage("small"):
+        pass
+    big, small = metrics.records
+    # A small stage after a big one still reports the big one's peak, but did not raise it
+    assert small.process_peak_mb >= big.process_peak_mb
+    assert small.process_peak_mb <= max_rss_mb()
+    assert 0 <= small.peak_delta_mb < 1
+    assert big.peak_delta_mb >= 0
+
+
+def test_memory_fields_are_none_without_getrusage(monkeypatch):
+    monkeypatch.setattr(instrumentation, "resource", None)
+    monkeypatch.setattr(instrumentation, "rss_mb", lambda: None)
+    metrics = Metrics()
+    with metrics.stage("extract"):
+        pass
+    record = metrics.records[0].to_dict()
+    assert record["rss_mb"] is record["rss_delta_mb"] is None
+    assert record["process_peak_mb"] is record["peak_delta_mb"] is None
+    assert record["seconds"] >= 0
+
+
+def test_failed_stage_is_recorded():
+    metrics = Metrics()
+    with pytest.raises(KeyError):
+        with metrics.stage("fill"):
+            raise KeyError("kwt")
+    assert metrics.records[0].error == "KeyError: 'kwt'"
@@ -0,0 +1,199 @@
+from email.message import EmailMessage
+import json
+import os
+import socketserver
+import threading
+import time
+
+import pytest
+
+from mailer import BackgroundMailer, Outbox, SmtpConnection
+
+
+class SmtpStub(socketserver.ThreadingTCPServer):
+    """
+    Just enough of an SMTP server for smtplib. `data_replies` holds the
+    replies to the next DATA commands (then "250 OK"); with
+    `close_after_message` the server hangs up after every accepted message,
+    like a server that times out idle pooled connections.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SmtpHandler)
+        self.messages = []
+        self.connections = 0
+        self.data_replies = []
+        self.rejected_recipients = set()
+        self.close_after_message = False
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 stub ready")
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line[:4].upper()
+            if not line or command == "QUIT":
+                self.reply("221 bye")
+                return
+            if command in ("EHLO", "HELO"):
+                self.reply("250 stub")
+            elif command == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif command == "RCPT":
+                address = line.split(":", 1)[1].strip(" <>")
+                if address in server.rejected_recipients:
+                    self.reply("550 no such user")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 go ahead")
+                body = []
+                while (data_line := self.rfile.readline()) != b".\r\n":
+                    body.append(data_line)
+                reply = server.data_replies.pop(0) if server.data_replies else "250 OK"
+                if reply.startswith("250"):
+                    server.messages.append((recipients, b"".join(body)))
+                self.reply(reply)
+                if server.close_after_message:
+                    return
+            else:
+                self.reply("250 OK")
+
+
+@pytest.fixture
+def smtp():
+    server = SmtpStub()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    return Outbox(str(tmp_path))
+
+
+def message(subject):
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg.set_content("laporan terlampir")
+    return msg
+
+
+def make_mailer(outbox, smtp, **kwargs):
+    return BackgroundMailer(outbox, SmtpConnection("127.0.0.1", smtp.port, starttls=False, timeout=5), **kwargs)
+
+
+def sidecar(outbox, message_id):
+    with open(os.path.join(outbox.directory, f"{message_id}.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_sends_a_batch_over_one_connection(outbox, smtp):
+    mailer = make_mailer(outbox, smtp)
+    for n in range(3):
+        mailer.enqueue(message(f"laporan {n}"), "desa@example.com", "camat@example.com")
+    assert mailer.send_due() == 3
+    assert (mailer.sent, smtp.connections, len(smtp.messages)) == (3, 1, 3)
+    assert outbox.pending() == 0
+
+
+def test_reconnects_when_the_server_dropped_the_connection(outbox, smtp):
+    smtp.close_after_message = True
+    mailer = make_mailer(outbox, smtp)
+    for n in range(3):
+        mailer.enqueue(message(f"laporan {n}"), "desa@example.com", "camat@example.com")
+    mailer.send_due()
+    assert (mailer.sent, mailer.failed, smtp.connections) == (3, 0, 3)
+
+
+def test_temporary_failure_is_retried_with_backoff(outbox, smtp):
+    smtp.data_replies = ["451 try again later", "451 try again later"]
+    mailer = make_mailer(outbox, smtp, base_delay=10)
+    message_id = mailer.enqueue(message("laporan"), "desa@example.com", "camat@example.com")
+
+    before = time.time()
+    mailer.send_due()
+    meta = sidecar(outbox, message_id)
+    assert meta["attempts"] == 1 and "451" in meta["error"]
+    assert meta["next_attempt"] >= before + 10
+    assert mailer.send_due() == 0
+    assert outbox.due(10, now=before + 11) == [(message_id, meta)]
+
+    # The second delay doubles
+    outbox.retry_later(message_id, meta, 0, meta["error"])
+    mailer.send_due()
+    meta = sidecar(outbox, message_id)
+    assert meta["attempts"] == 3
+    assert meta["next_attempt"] >= before + 40
+
+    outbox.retry_later(message_id, meta, 0, meta["error"])
+    mailer.send_due()
+    assert (mailer.sent, len(smtp.messages), outbox.pending()) == (1, 1, 0)
+
+
+def test_gives_up_after_max_attempts(outbox, smtp):
+    smtp.data_replies = ["451 try again later"] * 3
+    mailer = make_mailer(outbox, smtp, base_delay=0, max_attempts=3)
+    message_id = mailer.enqueue(message("laporan"), "desa@example.com", "camat@example.com")
+    for _ in range(5):
+        mailer.send_due()
+    assert (mailer.sent, mailer.failed, outbox.pending()) == (0, 1, 0)
+    assert os.path.exists(os.path.join(outbox.failed_directory, f"{message_id}.eml"))
+
+
+def test_refused_recipient_fails_without_retry(outbox, smtp):
+    smtp.rejected_recipients.add("salah@example.com")
+    mailer = make_mailer(outbox, smtp, base_delay=0)
+    message_id = mailer.enqueue(message("laporan"), "desa@example.com", "salah@example.com")
+    mailer.send_due()
+    assert (mailer.failed, outbox.pending(), mailer.send_due()) == (1, 0, 0)
+    with open(os.path.join(outbox.failed_directory, f"{message_id}.json"), encoding="utf-8") as f:
+        assert json.load(f)["attempts"] == 1
+
+
+def test_missing_body_fails_without_retry(outbox, smtp):
+    mailer = make_mailer(outbox, smtp, base_delay=0)
+    message_id = mailer.enqueue(message("laporan"), "desa@example.com", "camat@example.com")
+    os.unlink(os.path.join(outbox.directory, f"{message_id}.eml"))
+    mailer.send_due()
+    assert (mailer.failed, mailer.send_due(), smtp.connections) == (1, 0, 0)
+    assert os.path.exists(os.path.join(outbox.failed_directory, f"{message_id}.json"))
+
+
+def test_pending_drops_orphan_sidecars(outbox):
+    kept = outbox.put(message("laporan"), "desa@example.com", "camat@example.com")
+    orphan = outbox.put(message("laporan"), "desa@example.com", "camat@example.com")
+    os.unlink(os.path.join(outbox.directory, f"{orphan}.eml"))
+    assert outbox.pending() == 1
+    assert [message_id for message_id, _ in outbox.due(10)] == [kept]
+
+
+def test_background_thread_delivers(outbox, smtp):
+    mailer = make_mailer(outbox, smtp, poll_interval=0.05).start()
+    try:
+        mailer.enqueue(message("laporan"), "desa@example.com", "camat@example.com")
+        deadline = time.time() + 5
+        while not smtp.messages and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        mailer.stop(timeout=5)
+    assert len(smtp.messages) == 1 and outbox.pending() == 0
@@ -0,0 +1,118 @@
+import pandas as pd
+
+from bkpp_frame import entries_to_frame
+from reconcile import ERROR, FINDING_COLUMNS, WARNING, finding_counts, reconcile
+
+PPH21 = "Potongan Pajak PPh Pasal 21"
+PPN = "Potongan Pajak PPN Pusat"
+
+
+def entry(date, kwt, taxes, ntpn=None):
+    return {
+        'date': date, 'kwt': kwt, 'ntpn': ntpn, 'uraian': '',
+        'tax': [tax for tax, _, _, _ in taxes],
+        'pemotongan': [cut for _, cut, _, _ in taxes],
+        'penyetoran': [deposit for _, _, deposit, _ in taxes],
+        'saldo': [saldo for _, _, _, saldo in taxes],
+    }
+
+
+def clean_ledger():
+    """Two withholdings, each deposited later with an NTPN; saldo follows per tax."""
+    return [
+        entry("05/01/2024", "0001/KWT/01.2001/2024",
+              [(PPH21, "100.000,00", "0,00", "100.000,00"), (PPN, "1.100,50", "0,00", "1.100,50")]),
+        entry("20/01/2024", "0002/KWT/01.2001/2024",
+              [(PPH21, "0,00", "100.000,00", "0,00")], ntpn="ABCDEF0123456789"),
+        entry("21/01/2024", "0003/KWT/01.2001/2024",
+              [(PPN, "0,00", "1.100,50", "0,00")], ntpn="0123456789ABCDEF"),
+    ]
+
+
+def test_clean_ledger_has_no_findings():
+    findings = reconcile(entries_to_frame(clean_ledger()))
+    assert list(findings.columns) == FINDING_COLUMNS
+    assert findings.empty
+    assert finding_counts(findings) == {}
+
+
+def test_saldo_mismatch_is_checked_per_tax():
+    entries = clean_ledger()
+    # Deposit misread: the PPh 21 saldo should drop to 0
+    entries[1]['saldo'] = ["100,00"]
+    findings = reconcile(entries_to_frame(entries))
+    saldo = findings[findings['check'] == "saldo"]
+    assert saldo['row'].tolist() == [2]
+    assert saldo['severity'].tolist() == [ERROR]
+    assert saldo['detail'].iloc[0] == "saldo Rp 100.00, seharusnya Rp 0.00"
+    # The PPN lines in between do not take part in the PPh 21 balance
+    assert (findings['tax'] == PPN).sum() == 0
+
+
+def test_saldo_in_sen_has_no_float_drift():
+    entries = [entry(f"{day:02d}/02/2024", f"{day:04d}/KWT/01.2001/2024",
+                     [(PPN, "0,10", "0,00", f"{day / 10:.2f}".replace('.', ','))]) for day in range(1, 29)]
+    findings = reconcile(entries_to_frame(entries))
+    assert findings[findings['check'] == "saldo"].empty
+
+
+def test_unpaired_ntpn_lines_are_warnings():
+    entries = clean_ledger()
+    # PPN deposited with a different amount and PPh 21 without an NTPN
+    entries[2] = entry("21/01/2024", "0003/KWT/01.2001/2024", [(PPN, "0,00", "1.000,00", "100,50")],
+                       ntpn="0123456789ABCDEF")
+    entries[1]['ntpn'] = None
+    findings = reconcile(entries_to_frame(entries))
+    ntpn = findings[findings['check'] == "ntpn"]
+    assert set(ntpn['severity']) == {WARNING}
+    assert sorted(zip(ntpn['row'], ntpn['detail'])) == [
+        (1, "pemotongan belum dipasangkan dengan penyetoran ber-NTPN"),
+        (2, "penyetoran tanpa NTPN"),
+        (3, "penyetoran tanpa pemotongan dengan pajak dan nilai yang sama"),
+    ]
+    assert finding_counts(findings) == {"ntpn": {WARNING: 3}}
+
+
+def test_repeated_withholdings_pair_in_document_order():
+    entries = [
+        entry("05/03/2024", "0001/KWT/01.2001/2024", [(PPH21, "50,00", "0,00", "50,00")]),
+        entry("06/03/2024", "0002/KWT/01.2001/2024", [(PPH21, "50,00", "0,00", "100,00")]),
+        entry("07/03/2024", "0003/KWT/01.2001/2024", [(PPH21, "0,00", "50,00", "50,00")], ntpn="N1"),
+    ]
+    findings = reconcile(entries_to_frame(entries))
+    assert findings['row'].tolist() == [1]
+    assert findings['check'].tolist() == ["ntpn"]
+
+
+def test_duplicate_kwt_across_entries_and_repeated_tax_within_one():
+    entries = clean_ledger()
+    entries[2]['kwt'] = entries[0]['kwt']
+    entries.append(entry("25/01/2024", "0004/KWT/01.2001/2024",
+                         [(PPH21, "10,00", "0,00", "10,00"), (PPH21, "10,00", "0,00", "20,00")]))
+    findings = reconcile(entries_to_frame(entries))
+    kwt = findings[findings['check'] == "kwt"]
+    assert set(kwt['severity']) == {ERROR}
+    assert kwt['row'].tolist() == [0, 1, 3, 4, 5]
+    details = dict(zip(kwt['row'], kwt['detail']))
+    assert details[0] == details[3] == "nomor bukti dipakai di lebih dari satu transaksi"
+    assert details[4] == details[5] == "pajak yang sama tercatat dua kali dalam satu bukti"
+
+
+def test_lines_without_kwt_are_not_duplicates():
+    entries = clean_ledger()
+    entries[0]['kwt'] = entries[1]['kwt'] = None
+    findings = reconcile(entries_to_frame(entries))
+    assert findings[findings['check'] == "kwt"].empty
+
+
+def test_findings_sorted_by_row_and_counted():
+    entries = clean_ledger()
+    entries[1]['saldo'] = ["1,00"]
+    entries[2]['kwt'] = entries[0]['kwt']
+    df = entries_to_frame(entries)
+    df.index = pd.RangeIndex(10, 10 + len(df))
+    findings = reconcile(df)
+    # Rows refer to positions in the frame, whatever its index
+    assert findings[['row', 'check']].values.tolist() == [
+        [0, "kwt"], [1, "kwt"], [2, "saldo"], [3, "kwt"]]
+    assert finding_counts(findings) == {"kwt": {ERROR: 3}, "saldo": {ERROR: 1}}
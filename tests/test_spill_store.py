@@ -0,0 +1,91 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from spill_store import SpillBudgetExceeded, SpillStore, new_session_id
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SpillStore(str(tmp_path), session_budget=10_000, ttl=60)
+
+
+def test_frame_round_trip(store):
+    df = pd.DataFrame({
+        'date': pd.to_datetime(["2024-01-05", "2024-02-06"]),
+        'kwt': ["0001/KWT/01.2001/2024", None],
+        'pemotongan': [1000.1, 0.2],
+        'tax_code': pd.Categorical(["PPH21", "PPN"]),
+    })
+    handle = store.put_frame(new_session_id(), "df", df)
+    assert handle.rows == 2 and handle.nbytes == os.path.getsize(handle.path)
+    pd.testing.assert_frame_equal(store.get_frame(handle), df)
+    kwt = store.get_frame(handle, columns=['kwt'])
+    assert list(kwt.columns) == ['kwt']
+    assert kwt['kwt'].iloc[0] == "0001/KWT/01.2001/2024" and pd.isna(kwt['kwt'].iloc[1])
+
+
+def test_new_frame_replaces_the_previous_one(store):
+    session = new_session_id()
+    first = store.put_frame(session, "df", pd.DataFrame({'a': [1]}))
+    second = store.put_frame(session, "df", pd.DataFrame({'a': [2]}))
+    assert first.path != second.path
+    assert not os.path.exists(first.path)
+    assert store.get_frame(second)['a'].tolist() == [2]
+
+
+def test_budget_evicts_the_oldest_files_of_the_session(store):
+    session, other = new_session_id(), new_session_id()
+    store.put_bytes(other, "lain.pdf", b"x" * 6000)
+    old = store.put_bytes(session, "januari.pdf", b"x" * 6000)
+    os.utime(old, (time.time() - 10, time.time() - 10))
+    new = store.put_bytes(session, "februari.pdf", b"x" * 6000)
+
+    assert not os.path.exists(old) and os.path.exists(new)
+    assert store.usage(session) == 6000
+    # Budgets are per session: the other session keeps its file
+    assert store.usage(other) == 6000
+
+
+def test_file_larger_than_the_budget_is_refused(store):
+    session = new_session_id()
+    kept = store.put_bytes(session, "kecil.pdf", b"x" * 100)
+    with pytest.raises(SpillBudgetExceeded):
+        store.put_bytes(session, "besar.pdf", b"x" * 20_000)
+    assert os.path.exists(kept)
+    assert [name for name in os.listdir(os.path.dirname(kept)) if name.endswith(".tmp")] == []
+
+
+def test_evicted_frame_raises_file_not_found(store):
+    session = new_session_id()
+    handle = store.put_frame(session, "df", pd.DataFrame({'a': [1]}))
+    store.drop_session(session)
+    with pytest.raises(FileNotFoundError):
+        store.get_frame(handle)
+
+
+def test_idle_sessions_expire_after_the_ttl(store):
+    idle, active = new_session_id(), new_session_id()
+    store.put_bytes(idle, "bkpp.pdf", b"pdf")
+    store.put_bytes(active, "bkpp.pdf", b"pdf")
+    now = time.time()
+    os.utime(os.path.join(store.directory, idle), (now - 120, now - 120))
+
+    store.cleanup(now)
+    assert sorted(os.listdir(store.directory)) == [active]
+    # Reading a frame counts as activity
+    handle = store.put_frame(active, "df", pd.DataFrame({'a': [1]}))
+    os.utime(os.path.join(store.directory, active), (now - 120, now - 120))
+    store.get_frame(handle)
+    store.cleanup(now)
+    assert os.listdir(store.directory) == [active]
+
+
+def test_session_ids_and_file_names_are_sanitized(store):
+    with pytest.raises(ValueError):
+        store.put_bytes("../etc", "passwd", b"")
+    path = store.put_bytes(new_session_id(), "../../BKPP 2024 (final).pdf", b"pdf")
+    assert os.path.basename(path) == "BKPP 2024 (final).pdf"
+    assert os.path.dirname(os.path.dirname(path)) == store.directory
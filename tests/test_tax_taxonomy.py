@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bkpp_parser import BkppParser
+from tax_taxonomy import (
+    FAMILY_21, FAMILY_UNIFIKASI, TAX_TYPES, TEXT_TO_CODE, build_tax_pattern, classify, family_codes, lookup,
+    tax_codes, tax_pattern,
+)
+
+
+@pytest.mark.parametrize("text", sorted(TEXT_TO_CODE))
+def test_every_text_is_captured_whole_and_classified(text):
+    line = f"{text} 1.000,00 0,00 1.000,00"
+    captured = tax_pattern.search(line).group(1)
+    assert captured == text
+    assert classify([captured]).tolist() == [TEXT_TO_CODE[text]]
+
+
+def test_longest_text_wins_over_its_prefix():
+    pattern = build_tax_pattern(["Potongan Pajak PPh Pasal 4", "Potongan Pajak PPh Pasal 4 ayat (2)"])
+    assert pattern.search("Potongan Pajak PPh Pasal 4 ayat (2) 1.000,00").group(1) == \
+        "Potongan Pajak PPh Pasal 4 ayat (2)"
+    assert pattern.search("Potongan Pajak PPh Pasal 4 1.000,00").group(1) == "Potongan Pajak PPh Pasal 4"
+
+
+def test_parser_keeps_the_variant_spelling():
+    parser = BkppParser()
+    parser.feed_line("05/01/2024 0001/KWT/01.2001/2024 Honor")
+    parser.feed_line("Potongan Pajak PPh Pasal 4 Ayat (2) 100,00 0,00 100,00")
+    parser.feed_line("Potongan Pajak Lainnnya 5,00 0,00 5,00")
+    entry = parser.finish()
+    assert entry['tax'] == ["Potongan Pajak PPh Pasal 4 Ayat (2)", "Potongan Pajak Lainnnya"]
+    assert classify(entry['tax']).tolist() == ["PPH4_2", "LAINNYA"]
+
+
+def test_unknown_tax_is_nan():
+    codes = classify(["Potongan Pajak PPh Pasal 21", "Retribusi Pasar"])
+    assert codes.iloc[0] == "PPH21"
+    assert pd.isna(codes.iloc[1])
+    assert lookup(codes, "object_code", "").tolist() == ["21-100-17", ""]
+    rates = lookup(codes, "rate", np.nan).astype("float64")
+    assert rates[0] == 5 and np.isnan(rates[1])
+
+
+def test_families_and_tax_codes_fallback():
+    assert family_codes(FAMILY_21) == ["PPH21"]
+    assert set(family_codes(FAMILY_UNIFIKASI)) == {"PPH22", "PPH23", "PPH4_2"}
+    assert all(tax_type.family is None or tax_type.object_code for tax_type in TAX_TYPES)
+    df = pd.DataFrame({'tax': ["Potongan Pajak PPN Pusat"]}, index=[7])
+    assert tax_codes(df).tolist() == ["PPN"] and tax_codes(df).index.tolist() == [7]
@@ -0,0 +1,79 @@
+import pytest
+
+from bkpp_frame import entries_to_frame
+from bupot_excel import SPT_21, SPT_UNIFIKASI, filter_bupot
+from spill_store import SpillStore, new_session_id
+from transaction_store import QUARTERS, TransactionStore
+
+NPWP = "0123456789012345"
+PPH21 = "Potongan Pajak PPh Pasal 21"
+PPH23 = "Potongan Pajak PPh Pasal 23"
+
+
+def entry(date, kwt, tax, pemotongan, penyetoran="0,00"):
+    return {'date': date, 'kwt': kwt, 'ntpn': None, 'uraian': 'Honor', 'tax': [tax],
+            'pemotongan': [pemotongan], 'penyetoran': [penyetoran], 'saldo': ["0,00"]}
+
+
+def frame(*entries):
+    return entries_to_frame(list(entries))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TransactionStore(str(tmp_path / "transactions.sqlite"))
+
+
+def test_recap_per_tax_and_period(store):
+    df = frame(
+        entry("05/01/2024", "0001/KWT/01.2001/2024", PPH21, "1.000,10"),
+        entry("06/01/2024", "0002/KWT/01.2001/2024", PPH23, "200,00"),
+        entry("07/02/2024", "0003/KWT/01.2001/2024", PPH21, "0,00", "1.000,10"),
+        entry("08/04/2024", "0004/KWT/01.2001/2024", PPH21, "0,20"),
+    )
+    assert store.save_frame(df, NPWP, desa="Sukamaju") == [2024]
+
+    recap = store.recap(2024)
+    assert recap[['desa', 'tax', 'pemotongan', 'penyetoran', 'baris']].values.tolist() == [
+        ["Sukamaju", PPH21, 1000.3, 1000.1, 3], ["Sukamaju", PPH23, 200.0, 0.0, 1]]
+    assert store.recap(2024, months=QUARTERS[1], jenis_spt=SPT_21)['pemotongan'].tolist() == [1000.1]
+    assert store.recap(2024, jenis_spt=SPT_UNIFIKASI)['tax'].tolist() == [PPH23]
+
+
+def test_reupload_replaces_the_years_it_covers(store):
+    store.save_frame(frame(entry("05/01/2024", "0001/KWT/01.2001/2024", PPH21, "10,00"),
+                           entry("05/12/2023", "0009/KWT/01.2001/2023", PPH21, "5,00")), NPWP)
+    store.save_frame(frame(entry("05/01/2024", "0001/KWT/01.2001/2024", PPH21, "10,00"),
+                           entry("05/02/2024", "0002/KWT/01.2001/2024", PPH21, "0,10")), NPWP)
+
+    recap = store.recap(2024)
+    assert recap['pemotongan'].tolist() == [10.1]
+    assert recap['baris'].tolist() == [2]
+    # 2023 was not in the second upload and is kept
+    assert store.recap(2023)['pemotongan'].tolist() == [5.0]
+    assert store.years() == [2023, 2024]
+
+
+def test_upload_without_dated_rows_replaces_nothing(store):
+    store.save_frame(frame(entry("05/01/2024", "0001/KWT/01.2001/2024", PPH21, "10,00")), NPWP)
+    assert store.save_frame(frame(), NPWP) == []
+    assert store.recap(2024)['baris'].tolist() == [1]
+
+
+def test_session_frame_survives_another_upload_of_the_same_npwp(store, tmp_path):
+    spill = SpillStore(str(tmp_path / "spill"))
+    first = frame(entry("05/01/2024", "0001/KWT/01.2001/2024", PPH21, "10,00"))
+    second = frame(entry("09/01/2024", "0100/KWT/01.2001/2024", PPH21, "99,00"))
+
+    # Two sessions upload a BKPP of the same NPWP and year, one after the other
+    handle = spill.put_frame(new_session_id(), "df", first)
+    store.save_frame(first, NPWP, source="session-1")
+    spill.put_frame(new_session_id(), "df", second)
+    store.save_frame(second, NPWP, source="session-2")
+
+    # The store keeps the latest upload only; the first session builds its Bupot from its own frame
+    assert store.recap(2024)['pemotongan'].tolist() == [99.0]
+    rows = filter_bupot(spill.get_frame(handle), 0, SPT_21)
+    assert rows['kwt'].tolist() == ["0001/KWT/01.2001/2024"]
+    assert rows['pemotongan'].tolist() == [10.0]
+    assert rows['date'].dt.month.tolist() == [1]
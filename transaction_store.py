@@ -0,0 +1,197 @@
+#Persistent SQLite store of extracted BKPP tax lines across desa, years and uploads
+"""
+Every upload replaces the stored rows of its NPWP for the years it covers,
+so re-uploading a longer BKPP of the same year never double counts. Money
+is stored as integer sen and summed in recaps as float rupiah.
+
+The store feeds recaps across desa only. A Bupot is always built from the
+uploading session's own frame: another upload of the same NPWP and year
+may replace the stored rows in the meantime.
+
+Usage for recaps across desa:
+    python transaction_store.py .cache/transactions.sqlite --year 2024 --quarter 1 --out rekap.csv
+"""
+import argparse
+from contextlib import closing, contextmanager
+import os
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+
+from bkpp_frame import to_sen
+from bupot_excel import SPT_TYPES
+from tax_taxonomy import classify, family_codes
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    id INTEGER PRIMARY KEY,
+    npwp TEXT NOT NULL,
+    desa TEXT,
+    source TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    upload_id INTEGER NOT NULL REFERENCES uploads(id) ON DELETE CASCADE,
+    npwp TEXT NOT NULL,
+    desa TEXT,
+    date TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    kwt TEXT,
+    ntpn TEXT,
+    uraian TEXT,
+    tax TEXT NOT NULL,
+    pemotongan INTEGER NOT NULL,
+    penyetoran INTEGER NOT NULL,
+    saldo INTEGER NOT NULL
+);
+-- Distinct tax names, so jenis SPT can be resolved without a table scan
+CREATE TABLE IF NOT EXISTS taxes (name TEXT PRIMARY KEY);
+CREATE INDEX IF NOT EXISTS transactions_npwp_period ON transactions (npwp, year, month, tax);
+CREATE INDEX IF NOT EXISTS transactions_period ON transactions (year, month, tax);
+CREATE INDEX IF NOT EXISTS transactions_kwt ON transactions (kwt);
+"""
+
+MONEY_COLUMNS = ['pemotongan', 'penyetoran', 'saldo']
+
+# Months of each quarter, for recaps
+QUARTERS = {1: (1, 2, 3), 2: (4, 5, 6), 3: (7, 8, 9), 4: (10, 11, 12)}
+
+
+class TransactionStore:
+    """
+    Tax lines of all uploads in one SQLite file. A connection is opened per
+    call, so one instance can be shared between threads and processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            conn.execute("PRAGMA foreign_keys=ON")
+            with conn:
+                yield conn
+
+    def save_frame(self, df, npwp, desa=None, source=None):
+        """
+        Store the tax lines of one upload (an entries_to_frame result),
+        replacing earlier rows of `npwp` for the same years. Rows without a
+        date are skipped, as filter_bupot drops them too. Returns the years
+        stored.
+        """
+        df = df.dropna(subset=['date'])
+        dates = df['date']
+        rows = pd.DataFrame({
+            'npwp': npwp,
+            'desa': desa,
+            'date': dates.dt.strftime('%Y-%m-%d'),
+            'year': dates.dt.year,
+            'month': dates.dt.month,
+            'kwt': df['kwt'],
+            'ntpn': df['ntpn'],
+            'uraian': df['uraian'],
+            'tax': df['tax'],
+        })
+        for column in MONEY_COLUMNS:
+            rows[column] = to_sen(df[column])
+        rows = rows.astype(object).where(rows.notna(), None)
+        years = sorted(int(year) for year in rows['year'].unique())
+
+        with self._connect() as conn:
+            placeholders = ','.join('?' * len(years))
+            conn.execute(
+                f"DELETE FROM transactions WHERE npwp = ? AND year IN ({placeholders})", [npwp, *years])
+            conn.execute(
+                "DELETE FROM uploads WHERE npwp = ? AND id NOT IN (SELECT DISTINCT upload_id FROM transactions)",
+                (npwp,))
+            upload_id = conn.execute(
+                "INSERT INTO uploads (npwp, desa, source, created_at) VALUES (?, ?, ?, ?)",
+                (npwp, desa, source, time.time()),
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO transactions (upload_id, npwp, desa, date, year, month, kwt, ntpn, uraian,"
+                " tax, pemotongan, penyetoran, saldo) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((upload_id, *row) for row in rows.itertuples(index=False, name=None)),
+            )
+            conn.executemany("INSERT OR IGNORE INTO taxes (name) VALUES (?)",
+                             ((tax,) for tax in rows['tax'].unique()))
+        return years
+
+    def taxes(self):
+        """Distinct tax names in the store."""
+        with self._connect() as conn:
+            return [name for name, in conn.execute("SELECT name FROM taxes ORDER BY name")]
+
+    def _tax_names(self, jenis_spt):
+        # Classify the few distinct names once, so the query itself is an
+        # indexed `tax IN (...)`
+        taxes = self.taxes()
+        selected = classify(taxes).isin(family_codes(SPT_TYPES[jenis_spt]))
+        return [tax for tax, keep in zip(taxes, selected) if keep]
+
+    def recap(self, year, months=None, jenis_spt=None):
+        """
+        Pemotongan and penyetoran per desa and tax for `year`, limited to
+        `months` (e.g. QUARTERS[1]) and to the taxes of `jenis_spt` if given.
+        """
+        where = ["year = ?"]
+        params = [year]
+        if months:
+            where.append(f"month IN ({','.join('?' * len(months))})")
+            params.extend(months)
+        if jenis_spt is not None:
+            taxes = self._tax_names(jenis_spt) or ['']
+            where.append(f"tax IN ({','.join('?' * len(taxes))})")
+            params.extend(taxes)
+        sql = (
+            "SELECT npwp, MAX(desa) AS desa, tax, SUM(pemotongan) AS pemotongan,"
+            " SUM(penyetoran) AS penyetoran, COUNT(*) AS baris"
+            f" FROM transactions WHERE {' AND '.join(where)}"
+            " GROUP BY npwp, tax ORDER BY desa, npwp, tax"
+        )
+        with self._connect() as conn:
+            df = pd.read_sql_query(sql, conn, params=params)
+        for column in ('pemotongan', 'penyetoran'):
+            df[column] = df[column] / 100
+        return df
+
+    def years(self):
+        with self._connect() as conn:
+            return [year for year, in conn.execute("SELECT DISTINCT year FROM transactions ORDER BY year")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rekap pemotongan/penyetoran lintas desa dari penyimpanan transaksi.")
+    parser.add_argument("db", help="file SQLite penyimpanan transaksi")
+    parser.add_argument("--year", type=int, required=True)
+    period = parser.add_mutually_exclusive_group()
+    period.add_argument("--quarter", type=int, choices=sorted(QUARTERS))
+    period.add_argument("--masa", type=int, choices=range(1, 13), metavar="1-12")
+    parser.add_argument("--out", help="tulis rekap ke CSV ini (default: tampilkan)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"File {args.db} tidak ditemukan.", file=sys.stderr)
+        return 2
+    months = QUARTERS[args.quarter] if args.quarter else (args.masa,) if args.masa else None
+    recap = TransactionStore(args.db).recap(args.year, months)
+    if args.out:
+        recap.to_csv(args.out, index=False)
+    else:
+        print(recap.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+#Stream data rows into an .xlsx template without loading it through openpyxl
+import functools
+import os
+import posixpath
+import re
+import zipfile
+from numbers import Number
+
+import numpy as np
+import pandas as pd
+
+SHEET_DATA_RE = re.compile(r'<sheetData\s*/>|<sheetData>(.*?)</sheetData>', re.S)
+ROW_RE = re.compile(r'<row\b[^>]*?(?:/>|>.*?</row>)', re.S)
+CELL_RE = re.compile(r'<c\b[^>]*?(?:/>|>.*?</c>)', re.S)
+ROW_NUM_RE = re.compile(r'\br="(\d+)"')
+CELL_REF_RE = re.compile(r'\br="([A-Z]+)(\d+)"')
+STYLE_RE = re.compile(r'\bs="\d+"')
+REF_RE = re.compile(r'\bref="([A-Z]+\d+:[A-Z]+)(\d+)"')
+TABLE_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/table"
+
+BLOCK_ROWS = 5000
+
+
+class Formula:
+    """Per-row formula; `{row}` in the template is replaced by the row number."""
+
+    def __init__(self, template):
+        self.template = template
+
+
+def col_index(col):
+    index = 0
+    for ch in col:
+        index = index * 26 + ord(ch) - 64
+    return index
+
+
+def _escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _is_blank(value):
+    if value is None or isinstance(value, str) and value == '':
+        return True
+    return isinstance(value, float) and np.isnan(value)
+
+
+def _is_sequence(values):
+    return isinstance(values, (pd.Series, np.ndarray, list))
+
+
+def _number(value):
+    # Same 16 significant digits openpyxl writes
+    return f'{value:.16g}' if isinstance(value, float) else str(value)
+
+
+def _cell_body(value):
+    """Everything after `<c r="..."` for a literal value."""
+    if isinstance(value, Number) and not isinstance(value, bool):
+        return f'><v>{_number(value)}</v></c>'
+    text = str(value)
+    space = ' xml:space="preserve"' if text != text.strip() else ''
+    return f' t="inlineStr"><is><t{space}>{_escape(text)}</t></is></c>'
+
+
+def cell_xml(ref, value, style=''):
+    """XML for one cell; `style` is the raw ` s="n"` attribute or ''."""
+    if _is_blank(value):
+        return f'<c r="{ref}"{style}/>' if style else ''
+    if isinstance(value, Formula):
+        row = CELL_REF_RE.search(f'r="{ref}"').group(2)
+        return f'<c r="{ref}"{style}><f>{_escape(value.template.format(row=row)[1:])}</f></c>'
+    return f'<c r="{ref}"{style}' + _cell_body(value)
+
+
+def _column_fragments(col, rows, values):
+    """Cell XML for one column over a block of row numbers, built column-wise."""
+    if isinstance(values, Formula):
+        before, _, after = values.template[1:].partition('{row}')
+        if '{row}' in after:
+            return pd.Series([cell_xml(f'{col}{r}', values) for r in rows], dtype=object)
+        return f'<c r="{col}' + rows + f'"><f>{_escape(before)}' + rows + f'{_escape(after)}</f></c>'
+    if not _is_sequence(values):
+        return '' if _is_blank(values) else f'<c r="{col}' + rows + '"' + _cell_body(values)
+
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        numbers = pd.Series([_number(v) for v in values.tolist()], dtype=object)
+        fragments = f'<c r="{col}' + rows + '"><v>' + numbers + '</v></c>'
+        return fragments.where(values.notna().to_numpy(), '')
+    if values.map(type).eq(str).all() and (values.str.strip() == values).all():
+        text = (values.str.replace('&', '&amp;', regex=False)
+                      .str.replace('<', '&lt;', regex=False)
+                      .str.replace('>', '&gt;', regex=False))
+        fragments = f'<c r="{col}' + rows + '" t="inlineStr"><is><t>' + text + '</t></is></c>'
+        return fragments.where((values != '').to_numpy(), '')
+    # Mixed types: format cell by cell
+    return pd.Series([cell_xml(f'{col}{r}', v) for r, v in zip(rows, values.tolist())], dtype=object)
+
+
+def _row_cells(row_xml):
+    """Split a <row> element into its open tag and {column: cell xml}."""
+    if row_xml.endswith('/>'):
+        return row_xml[:-2] + '>', {}
+    open_tag = row_xml[:row_xml.index('>') + 1]
+    cells = {CELL_REF_RE.search(c).group(1): c for c in CELL_RE.findall(row_xml[len(open_tag):])}
+    return open_tag, cells
+
+
+def _set_cell(cells, col, row, value):
+    style = STYLE_RE.search(cells.get(col, ''))
+    cells[col] = cell_xml(f'{col}{row}', value, f' {style.group(0)}' if style else '')
+
+
+def _join_row(open_tag, cells):
+    return open_tag + ''.join(cells[c] for c in sorted(cells, key=col_index)) + '</row>'
+
+
+class XlsxTemplate:
+    """
+    An .xlsx template parsed once. The target sheet is split into the rows
+    above the data area, the styled first data row and the sheet tail; all
+    other parts are kept as raw bytes and copied unchanged on fill.
+    """
+
+    def __init__(self, path, sheet_name, start_row):
+        self.start_row = start_row
+        with zipfile.ZipFile(path) as zf:
+            self.members = [(info.filename, zf.read(info)) for info in zf.infolist()]
+        parts = dict(self.members)
+
+        self.sheet_path = self._sheet_path(parts, sheet_name)
+        self.table_path = self._table_path(parts, self.sheet_path)
+        sheet = parts[self.sheet_path].decode('utf-8')
+
+        match = SHEET_DATA_RE.search(sheet)
+        self.sheet_head = sheet[:match.start()] + '<sheetData>'
+        self.sheet_tail = '</sheetData>' + sheet[match.end():]
+
+        self.header_rows = {}
+        self.first_row = (f'<row r="{start_row}">', {})
+        # Template rows below the first data row are replaced by the data
+        for row_xml in ROW_RE.findall(match.group(1) or ''):
+            row_num = int(ROW_NUM_RE.search(row_xml).group(1))
+            if row_num < start_row:
+                self.header_rows[row_num] = row_xml
+            elif row_num == start_row:
+                self.first_row = _row_cells(row_xml)
+
+    @staticmethod
+    def _rels(parts, part_path):
+        directory, name = posixpath.split(part_path)
+        rels_xml = parts.get(posixpath.join(directory, '_rels', f'{name}.rels'), b'').decode('utf-8')
+        rels = {}
+        for match in re.finditer(r'<Relationship\b[^>]*/>', rels_xml):
+            attrs = dict(re.findall(r'(\w+)="([^"]*)"', match.group(0)))
+            rels[attrs['Id']] = (attrs['Type'], posixpath.normpath(posixpath.join(directory, attrs['Target'])))
+        return rels
+
+    def _sheet_path(self, parts, sheet_name):
+        workbook = parts['xl/workbook.xml'].decode('utf-8')
+        sheet_tag = re.search(rf'<sheet\b[^>]*\bname="{re.escape(sheet_name)}"[^>]*/>', workbook).group(0)
+        rel_id = re.search(r'\br:id="([^"]+)"', sheet_tag).group(1)
+        return self._rels(parts, 'xl/workbook.xml')[rel_id][1]
+
+    def _table_path(self, parts, sheet_path):
+        for rel_type, target in self._rels(parts, sheet_path).values():
+            if rel_type == TABLE_REL:
+                return target
+        return None
+
+    def _header_xml(self, header_values):
+        rows = dict(self.header_rows)
+        for ref, value in header_values.items():
+            col, row_num = CELL_REF_RE.search(f'r="{ref}"').groups()
+            row_num = int(row_num)
+            open_tag, cells = _row_cells(rows.get(row_num, f'<row r="{row_num}"/>'))
+            _set_cell(cells, col, row_num, value)
+            rows[row_num] = _join_row(open_tag, cells)
+        return ''.join(rows[r] for r in sorted(rows))
+
+    def _first_row_xml(self, columns):
+        open_tag, cells = self.first_row
+        cells = dict(cells)
+        for col, values in columns:
+            _set_cell(cells, col, self.start_row, values.iloc[0] if _is_sequence(values) else values)
+        return _join_row(open_tag, cells)
+
+    def _body_blocks(self, columns, n_rows):
+        for block_start in range(1, n_rows, BLOCK_ROWS):
+            block_stop = min(block_start + BLOCK_ROWS, n_rows)
+            rows = pd.Series(np.arange(block_start, block_stop) + self.start_row).astype(str)
+            row_xml = '<row r="' + rows + '">'
+            for col, values in columns:
+                if _is_sequence(values):
+                    values = values.iloc[block_start:block_stop].reset_index(drop=True)
+                row_xml = row_xml + _column_fragments(col, rows, values)
+            yield ''.join((row_xml + '</row>').tolist())
+
+    def _patch_part(self, name, data, last_row):
+        if name == self.table_path:
+            return REF_RE.sub(lambda m: f'ref="{m.group(1)}{last_row}"', data.decode('utf-8')).encode('utf-8')
+        if name == '[Content_Types].xml':
+            return re.sub(rb'<Override PartName="/xl/calcChain.xml"[^>]*/>', b'', data)
+        if name == 'xl/_rels/workbook.xml.rels':
+            return re.sub(rb'<Relationship\b[^>]*/calcChain"[^>]*/>', b'', data)
+        if name == 'xl/workbook.xml' and b'fullCalcOnLoad' not in data:
+            # Formula cells are written without cached values
+            return data.replace(b'<calcPr ', b'<calcPr fullCalcOnLoad="1" ', 1)
+        return data
+
+    def fill(self, output, columns, n_rows, header_values=None):
+        """
+        Write the filled workbook to `output` (a binary file object).
+
+        `columns` is a list of (column letter, values) where values is a
+        scalar for every row, a Formula or a sequence of length `n_rows`.
+        """
+        columns = [
+            (col, pd.Series(values).reset_index(drop=True) if _is_sequence(values) else values)
+            for col, values in columns
+        ]
+        last_row = self.start_row + max(n_rows, 1) - 1
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name, data in self.members:
+                # The calculation chain points at cells we overwrite; Excel rebuilds it
+                if name == 'xl/calcChain.xml':
+                    continue
+                if name != self.sheet_path:
+                    zf.writestr(name, self._patch_part(name, data, last_row))
+                    continue
+                with zf.open(name, 'w') as sheet:
+                    sheet.write(REF_RE.sub(
+                        lambda m: f'ref="{m.group(1)}{max(int(m.group(2)), last_row)}"',
+                        self.sheet_head, count=1
+                    ).encode('utf-8'))
+                    sheet.write(self._header_xml(header_values or {}).encode('utf-8'))
+                    sheet.write(self._first_row_xml(columns if n_rows else []).encode('utf-8'))
+                    for block in self._body_blocks(columns, n_rows):
+                        sheet.write(block.encode('utf-8'))
+                    sheet.write(self.sheet_tail.encode('utf-8'))
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_template(path, sheet_name, start_row, mtime):
+    return XlsxTemplate(path, sheet_name, start_row)
+
+
+def load_template(path, sheet_name, start_row):
+    """Parsed template, cached per process until the file changes on disk."""
+    return _cached_template(path, sheet_name, start_row, os.path.getmtime(path))